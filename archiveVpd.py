@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# Program to keep an archive of VPD images with each record stored once
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# The archive is a directory with two parts
+#   blobs/<first 2 digits>/<sha256> - the VHDR, VTOC, records and ecc of the images, each stored once by content
+#   images/<name>.json              - for each image, the hash of every blob in image order
+# An image is put back together by joining its blobs, and is then checked against the hash of the whole image
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import vpdmodel
+import createVpd
+import argparse
+import textwrap
+import hashlib
+import json
+import struct
+import threading
+import concurrent.futures
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# The file a blob is stored in
+def blobPath(archivePath, digest):
+    return os.path.join(archivePath, "blobs", digest[0:2], digest)
+
+# The file the blob list for an image is stored in
+def imagePath(archivePath, name):
+    return os.path.join(archivePath, "images", name + ".json")
+
+# Write a file so it's either all there or not there at all
+# A unique temp file is renamed into place, so parallel writers of the same file can't corrupt it
+def writeAtomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tempPath = "%s.tmp-%d-%d" % (path, os.getpid(), threading.get_ident())
+    with open(tempPath, "wb") as tempFile:
+        tempFile.write(data)
+    os.replace(tempPath, path)
+
+# Break an image up into the areas that are stored as blobs
+# Anything between or after the VPD areas, like padding out to the size of the eeprom, gets a blob of its own
+# Returns a list of (offset, length, name) that covers all of data
+def splitImage(data):
+    image = vpdmodel.VpdImage.fromBytes(data)
+
+    areas = list()
+    offset = 0
+    for (areaOffset, areaLength, areaName) in vpdmodel.imageAreas(image):
+        if (areaOffset < offset):
+            raise vpdmodel.VpdError("The %s area at offset %d overlaps the area before it!" % (areaName, areaOffset))
+        if (areaOffset > offset):
+            areas.append((offset, areaOffset - offset, "gap"))
+        areas.append((areaOffset, areaLength, areaName))
+        offset = areaOffset + areaLength
+
+    if (offset > len(data)):
+        raise vpdmodel.VpdError("The image is %d bytes, but the VTOC needs %d!" % (len(data), offset))
+    if (offset < len(data)):
+        areas.append((offset, len(data) - offset, "tail"))
+
+    return areas
+
+# Add an image to the archive, safe to run in parallel and to repeat
+# Only the blobs not already in the archive are written
+# Returns the errors found and a dict of what was done
+def ingestImage(archivePath, name, vpdFile):
+    stats = {"name" : name, "size" : 0, "blobs" : 0, "blobsWritten" : 0, "bytesWritten" : 0, "unchanged" : False}
+
+    try:
+        data = open(vpdFile, mode='rb').read()
+        areas = splitImage(data)
+    except (IOError, vpdmodel.VpdError, IndexError, struct.error, ValueError) as e:
+        return (["Unable to archive %s: %s" % (vpdFile, e)], stats)
+    stats["size"] = len(data)
+
+    view = memoryview(data)
+    manifest = {"name" : name, "size" : len(data), "sha256" : hashlib.sha256(data).hexdigest(), "blobs" : list()}
+    for (offset, length, areaName) in areas:
+        blob = view[offset:(offset + length)]
+        digest = hashlib.sha256(blob).hexdigest()
+        manifest["blobs"].append([areaName, digest, length])
+        stats["blobs"] += 1
+
+        # Already stored by this or some other image
+        path = blobPath(archivePath, digest)
+        if (os.path.exists(path)):
+            continue
+        writeAtomic(path, blob)
+        stats["blobsWritten"] += 1
+        stats["bytesWritten"] += length
+
+    # If this exact image is already in the archive under this name, leave it be
+    # One that can't be read is replaced
+    path = imagePath(archivePath, name)
+    if (os.path.exists(path)):
+        try:
+            with open(path) as existing:
+                existingSha = json.load(existing).get("sha256")
+        except (IOError, ValueError, AttributeError):
+            existingSha = None
+        if (existingSha == manifest["sha256"]):
+            stats["unchanged"] = True
+            return ([], stats)
+
+    manifestData = json.dumps(manifest, separators=(",", ":")).encode()
+    writeAtomic(path, manifestData)
+    stats["bytesWritten"] += len(manifestData)
+
+    return ([], stats)
+
+# Put an image back together from its blobs
+# Returns the errors found and the image
+def extractImage(archivePath, name):
+    path = imagePath(archivePath, name)
+    if (os.path.exists(path) != True):
+        return (["The image %s is not in the archive" % name], None)
+    (errors, manifest) = loadManifest(path, name)
+    if (len(errors)):
+        return (errors, None)
+
+    image = bytearray()
+    for (areaName, digest, length) in manifest["blobs"]:
+        try:
+            image += open(blobPath(archivePath, digest), mode='rb').read()
+        except IOError:
+            return (["The %s blob %s for image %s is missing from the archive" % (areaName, digest, name)], None)
+
+    if (len(image) != manifest["size"] or hashlib.sha256(image).hexdigest() != manifest["sha256"]):
+        return (["The image %s put back together from the archive doesn't match what was archived" % name], None)
+
+    return ([], image)
+
+# Read the blob list of an image and check it has everything extractImage and --list use
+# Returns the errors found and the manifest
+def loadManifest(path, name):
+    try:
+        with open(path) as manifestFile:
+            manifest = json.load(manifestFile)
+    except (IOError, ValueError) as e:
+        return (["The blob list %s for image %s can't be read: %s" % (path, name, e)], None)
+
+    # A blob list that was edited by hand or cut short could have anything in it
+    valid = (isinstance(manifest, dict) and isinstance(manifest.get("size"), int) and
+             isinstance(manifest.get("sha256"), str) and isinstance(manifest.get("blobs"), list))
+    if (valid):
+        valid = all((isinstance(blob, list) and len(blob) == 3 and isinstance(blob[0], str) and isinstance(blob[1], str))
+                    for blob in manifest["blobs"])
+    if (not valid):
+        return (["The blob list %s for image %s is not one written by the archive" % (path, name)], None)
+
+    return ([], manifest)
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Keeps an archive of VPD images with each record stored once', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./archiveVpd.py -a /archive --add /tmp/*.vpd
+                                       ./archiveVpd.py -a /archive --list
+                                       ./archiveVpd.py -a /archive --extract sysplanar -o /tmp
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-a', '--archive', help='The archive directory', required=True)
+    actiongroup = reqgroup.add_mutually_exclusive_group(required=True)
+    actiongroup.add_argument('--add', help='The vpd images to add to the archive, each is named for its file', nargs="+", metavar="VPDFILE")
+    actiongroup.add_argument('--extract', help='The names of the images to put back together into the -o output path', nargs="+", metavar="NAME")
+    actiongroup.add_argument('--list', help='List the images in the archive', action="store_true")
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-o', '--outpath', help="The output path for --extract", default=".")
+    optgroup.add_argument('-w', '--workers', help="The number of images to add in parallel", type=int, default=os.cpu_count())
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    clArchivePath = args.archive
+    # Make sure the path exists, we aren't going to create it
+    if (os.path.isdir(clArchivePath) != True):
+        out.error("The given archive path %s does not exist!" % clArchivePath)
+        out.error("Please create the archive directory and run again")
+        exit(1)
+
+    errorsFound = 0
+
+    ################################################
+    # Add images to the archive
+    if (args.add != None):
+        # The images are named for their files, so two files of the same name can't go in at once
+        names = dict()
+        for vpdFile in args.add:
+            name = os.path.splitext(os.path.basename(vpdFile))[0]
+            if (name in names):
+                out.error("%s and %s would both be archived as %s" % (names[name], vpdFile, name))
+                errorsFound += 1
+            names[name] = vpdFile
+        if (errorsFound):
+            exit(min(errorsFound, 255))
+
+        totals = {"images" : 0, "size" : 0, "blobs" : 0, "blobsWritten" : 0, "bytesWritten" : 0}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+            results = pool.map(lambda item: ingestImage(clArchivePath, item[0], item[1]), names.items())
+            for (errors, stats) in results:
+                for error in errors:
+                    out.error(error)
+                errorsFound += len(errors)
+                if (len(errors)):
+                    continue
+
+                out.msg("Archived %s: %d blobs, %d new%s" % (stats["name"], stats["blobs"], stats["blobsWritten"],
+                                                             (", image unchanged" if (stats["unchanged"]) else "")))
+                totals["images"] += 1
+                for key in ("size", "blobs", "blobsWritten", "bytesWritten"):
+                    totals[key] += stats[key]
+
+        out.msg("Archived %d images: %d of %d blobs new, %d bytes written for %d bytes of images" %
+                (totals["images"], totals["blobsWritten"], totals["blobs"], totals["bytesWritten"], totals["size"]))
+
+    ################################################
+    # Put images back together
+    if (args.extract != None):
+        if (os.path.exists(args.outpath) != True):
+            out.error("The given output path %s does not exist!" % args.outpath)
+            out.error("Please create the output directory and run again")
+            exit(1)
+
+        for name in args.extract:
+            (errors, image) = extractImage(clArchivePath, name)
+            for error in errors:
+                out.error(error)
+            errorsFound += len(errors)
+            if (image == None):
+                continue
+
+            # Written to a temp file and renamed into place like createVpd.py does, so a reader never sees part of an image
+            vpdFileName = os.path.join(args.outpath, name + ".vpd")
+            tempFile = createVpd.tempFileName(vpdFileName)
+            with open(tempFile, "wb") as vpdFile:
+                vpdFile.write(image)
+            createVpd.replaceFile(tempFile, vpdFileName)
+            createVpd.reportOutput("vpd file", vpdFileName)
+
+    ################################################
+    # Show what's in the archive
+    if (args.list):
+        imagesPath = os.path.join(clArchivePath, "images")
+        names = sorted(os.path.splitext(fileName)[0] for fileName in (os.listdir(imagesPath) if (os.path.isdir(imagesPath)) else [])
+                       if (fileName.endswith(".json")))
+        for name in names:
+            (errors, manifest) = loadManifest(imagePath(clArchivePath, name), name)
+            for error in errors:
+                out.error(error)
+            errorsFound += len(errors)
+            if (manifest == None):
+                continue
+            out.msg("%s: %d bytes, %d blobs, sha256 %s" % (name, manifest["size"], len(manifest["blobs"]), manifest["sha256"]))
+        out.msg("%d images in the archive" % len(names))
+
+    # The return code only has 8 bits, 256 errors can't look like it worked
+    exit(min(errorsFound, 255))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# Program to check VPD images read back from parts against the golden image they were programmed from
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import vpdmodel
+import createVpd
+import argparse
+import textwrap
+import bisect
+import time
+import concurrent.futures
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class Golden:
+    """The golden image and where it's allowed to differ"""
+    def __init__(self, image, vpdImage):
+        # The binary image
+        self.image = bytes(image)
+        # The model of the image, with all the record and keyword offsets set
+        self.vpdImage = vpdImage
+        # The (start, end) of each part of the image that has to match, between the allowed to differ keyword data
+        self.segments = list()
+        # The (start, end, description) of every keyword and area, sorted to find what an offset is in
+        self.spans = list()
+        self.spanStarts = list()
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Load the golden image, either a binary or built from a template like createVpd does
+def loadGolden(goldenFile, manifestFile):
+    if (goldenFile != None):
+        image = open(goldenFile, mode='rb').read()
+        try:
+            vpdImage = vpdmodel.VpdImage.fromBytes(image, os.path.splitext(os.path.basename(goldenFile))[0])
+        except vpdmodel.VpdError as e:
+            out.error("The golden image %s is not valid: %s" % (goldenFile, e))
+            return (1, None)
+        return (0, Golden(image, vpdImage))
+
+    (errorsFound, manifest) = createVpd.loadManifest(manifestFile)
+    if (manifest == None or errorsFound):
+        return (max(errorsFound, 1), None)
+    (errorsFound, vpdName, maxSizeBytes) = createVpd.verifyManifest(manifest, manifestFile)
+    if (errorsFound):
+        return (errorsFound, None)
+    (errorsFound, image, vpdImage) = createVpd.createImage(manifest, vpdName=vpdName)
+    if (errorsFound):
+        return (errorsFound, None)
+    return (0, Golden(image, vpdImage))
+
+# Set up the segments that have to match and the spans used to report mismatches
+# allowed is the list of RECORD or RECORD:KEYWORD whose keyword data can differ per part
+def createMask(golden, allowed):
+    errorsFound = 0
+    vpdImage = golden.vpdImage
+
+    # The data of the allowed keywords, as (start, end)
+    masked = list()
+    for entry in allowed:
+        (recordName, sep, keywordName) = entry.partition(":")
+        record = vpdImage.record(recordName)
+        if (record == None):
+            out.error("The allowed record %s is not in the golden image" % recordName)
+            errorsFound += 1
+            continue
+        if (len(record.keywords) == 0):
+            out.error("The allowed record %s came from a rbinfile, its keywords aren't known" % recordName)
+            errorsFound += 1
+            continue
+        keywords = record.keywords
+        if (keywordName != ""):
+            keywords = [keyword for keyword in record.keywords if (keyword.name == keywordName)]
+            if (len(keywords) == 0):
+                out.error("The allowed keyword %s is not in record %s in the golden image" % (keywordName, recordName))
+                errorsFound += 1
+                continue
+        for keyword in keywords:
+            dataOffset = keyword.offset + 2 + keyword.lengthSize()
+            masked.append((dataOffset, dataOffset + len(keyword.data)))
+
+    # Everything between the masked keyword data has to match
+    offset = 0
+    for (start, end) in sorted(masked):
+        if (start > offset):
+            golden.segments.append((offset, start))
+        offset = max(offset, end)
+    if (offset < len(golden.image)):
+        golden.segments.append((offset, len(golden.image)))
+
+    # The keywords go ahead of the areas that hold them, so the most specific description is found first
+    spans = list()
+    for (areaOffset, areaLength, areaName) in vpdmodel.imageAreas(vpdImage):
+        spans.append((areaOffset, areaOffset + areaLength, 1, areaName))
+    for record in vpdImage.records:
+        for keyword in record.keywords:
+            spans.append((keyword.offset, keyword.offset + keyword.packedSize(), 0, "%s %s" % (record.name, keyword.name)))
+    spans.sort(key=lambda span: (span[0], span[2]))
+    golden.spans = [(span[0], span[1], span[3]) for span in spans]
+    golden.spanStarts = [span[0] for span in spans]
+
+    return errorsFound
+
+# Describe what is at an offset in the golden image
+def describeOffset(golden, offset):
+    index = bisect.bisect_right(golden.spanStarts, offset) - 1
+    # Walk back to find the span that holds the offset, nothing in a vpd image nests deeper than area and keyword
+    while (index >= 0):
+        (start, end, description) = golden.spans[index]
+        if (start <= offset < end):
+            return description
+        index -= 1
+    return "unused space"
+
+# Check a readback against the golden image
+# The parts that have to match are compared a segment at a time, each a single compare of the bytes
+# Only when a segment doesn't match is it walked byte by byte to say exactly where
+# Returns the list of mismatches found
+def checkReadback(golden, vpdFile):
+    try:
+        data = open(vpdFile, mode='rb').read()
+    except IOError as e:
+        return ["Unable to read: %s" % e]
+    if (len(data) != len(golden.image)):
+        return ["The image is %d bytes, the golden image is %d bytes" % (len(data), len(golden.image))]
+
+    # The usual case, everything that has to match does
+    mismatches = list()
+    for (start, end) in golden.segments:
+        if (data[start:end] == golden.image[start:end]):
+            continue
+
+        # Find each run of bytes that differ and where they are
+        offset = start
+        while (offset < end):
+            if (data[offset] == golden.image[offset]):
+                offset += 1
+                continue
+            description = describeOffset(golden, offset)
+            runStart = offset
+            while (offset < end and data[offset] != golden.image[offset] and describeOffset(golden, offset) == description):
+                offset += 1
+            mismatches.append("%s differs at offset 0x%04x for %d byte%s" %
+                              (description, runStart, offset - runStart, "s" if ((offset - runStart) > 1) else ""))
+
+    return mismatches
+
+# Expand any directories given into the vpd files in them
+def findReadbacks(vpdFiles):
+    readbacks = list()
+    for vpdFile in vpdFiles:
+        if (os.path.isdir(vpdFile)):
+            readbacks.extend(sorted(os.path.join(vpdFile, fileName) for fileName in os.listdir(vpdFile)
+                                    if (fileName.endswith(".vpd"))))
+        else:
+            readbacks.append(vpdFile)
+    return readbacks
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Checks VPD images read back from parts against the golden image', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./checkVpd.py -g golden.vpd -x VINI:SN,VINI:FN -v readbacks/
+                                       ./checkVpd.py -m examples/p10/bmc/p10_bmc_template.tvpd -i examples/p10/bmc -x VINI:SN -v part1.vpd part2.vpd
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    goldengroup = reqgroup.add_mutually_exclusive_group(required=True)
+    goldengroup.add_argument('-g', '--golden', help='The golden vpd image')
+    goldengroup.add_argument('-m', '--manifest', help='The template to build the golden vpd image from')
+    reqgroup.add_argument('-v', '--vpdfiles', help='The images read back from parts, or directories of .vpd files', nargs="+", required=True)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-d', '--debug', help="Enables debug printing", action="store_true")
+    optgroup.add_argument('-i', '--inpath', help="The search path to use for the files referenced in the template")
+    optgroup.add_argument('-x', '--allow', help="Comma separated RECORD or RECORD:KEYWORD list of the data allowed to differ per part")
+    optgroup.add_argument('-w', '--workers', help="The number of images to read and check in parallel", type=int, default=os.cpu_count())
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # Same input path rules as createVpd, the CWD is always looked at
+    if (args.inpath != None):
+        createVpd.clInputPath = args.inpath + os.pathsep + "."
+
+    allowed = list()
+    if (args.allow != None):
+        allowed = [entry.strip() for entry in args.allow.split(",") if (entry.strip() != "")]
+
+    ################################################
+    # Get the golden image and the mask
+    out.setIndent(0)
+    out.msg("==== Stage 1: Loading the golden image")
+    out.setIndent(2)
+
+    (errorsFound, golden) = loadGolden(args.golden, args.manifest)
+    if (golden == None):
+        exit(min(errorsFound, 255))
+    errorsFound += createMask(golden, allowed)
+    if (errorsFound):
+        exit(min(errorsFound, 255))
+    out.msg("Golden image %s: %d bytes, %d bytes allowed to differ" %
+            (golden.vpdImage.name, len(golden.image), len(golden.image) - sum(end - start for (start, end) in golden.segments)))
+    if (args.debug):
+        for (start, end) in golden.segments:
+            out.debug("Checking 0x%04x to 0x%04x" % (start, end))
+
+    ################################################
+    # Check the readbacks
+    out.setIndent(0)
+    out.msg("==== Stage 2: Checking the readback images")
+    out.setIndent(2)
+
+    readbacks = findReadbacks(args.vpdfiles)
+    startTime = time.time()
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+        for (vpdFile, mismatches) in zip(readbacks, pool.map(lambda vpdFile: checkReadback(golden, vpdFile), readbacks)):
+            if (len(mismatches) == 0):
+                continue
+            failed += 1
+            out.error("%s does not match the golden image" % vpdFile)
+            out.setIndent(4)
+            for mismatch in mismatches:
+                out.msg(mismatch)
+            out.setIndent(2)
+    elapsed = time.time() - startTime
+
+    out.msg("Checked %d images in %.3fs: %d match, %d don't" % (len(readbacks), elapsed, len(readbacks) - failed, failed))
+
+    # Return the number of images that didn't match as the return code
+    # The return code only has 8 bits, 256 bad readbacks can't look like they all matched
+    exit(min(failed, 255))
+
+if __name__ == "__main__":
+    main()
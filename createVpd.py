@@ -34,13 +34,21 @@ scriptPath = os.path.dirname(os.path.realpath(__file__))
 import sys
 sys.path.insert(0,scriptPath + "/pymod");
 import out
-import xml.etree.ElementTree as ET
-import struct
+import vpdmodel
+import vpdbundle
+import vpdxml
+import vpdjson
+import vpddevice
+import vpdbatch
+from lazyimport import lazyImport
+# Only loaded when a template is parsed or written, so tools using the binary functions here start faster
+ET = lazyImport("xml.etree.ElementTree")
 import binascii
 import re
-import argparse
-import textwrap
 import os
+import io
+import time
+import weakref
 
 # Define basestring for python3 compatibility
 if not hasattr(__builtins__, "basestring"): basestring = (str, bytes)
@@ -48,35 +56,99 @@ if not hasattr(__builtins__, "basestring"): basestring = (str, bytes)
 ############################################################
 # Classes - Classes - Classes - Classes - Classes - Classes
 ############################################################
-# This parser extension is necessary to save comments and write them back out in the final file
-# By default, element tree doesn't preserve comments
-# https://stackoverflow.com/questions/33573807/faithfully-preserve-comments-in-parsed-xml-python-2-7/
-class CommentedTreeBuilder(ET.TreeBuilder):
-    def __init__(self, *args, **kwargs):
-        super(CommentedTreeBuilder, self).__init__(*args, **kwargs)
-
-    def comment(self, data):
-        self.start(ET.Comment, {})
-        self.data(data)
-        self.end(ET.Comment)
-       
-class RecordInfo:
-    """Stores the info about each vpd record"""
-    def __init__(self):
-        # The packed record in memory
-        self.record = bytearray()
-        # The packed ecc in memory
-        self.ecc = bytearray()
-        # The name of the record where the toc entry is located
-        self.tocName = None
-        # The location of the Record Offset in toc record
-        self.tocRecordOffset = None
-        # The location of the Record Length in toc record
-        self.tocRecordLength = None
-        # The location of the ECC Offset in toc record
-        self.tocEccOffset = None
-        # The location of the ECC Length in toc record
-        self.tocEccLength = None
+class TvpdStream(object):
+    """A tvpd written a top level tag at a time by streamManifest, it gets its name once it is complete"""
+
+    def __init__(self, bundle, tempFile):
+        # The bundle the tvpd goes in, or None to write it to tempFile and rename it into the output path
+        self.bundle = bundle
+        self.tempFile = tempFile
+        if (bundle == None):
+            self.file = open(tempFile, "wb")
+            self.offset = 0
+        else:
+            self.file = bundle
+            self.offset = bundle.offset
+        # Set once the <vpd> start tag is written
+        self.started = False
+
+    def start(self, root):
+        vpdxml.writeStart(root, self.file)
+        self.started = True
+
+    def write(self, element):
+        vpdxml.writeElement(element, self.file)
+
+    def end(self, root):
+        vpdxml.writeEnd(root, self.file)
+
+    def close(self, fileName):
+        """
+        Gives the complete tvpd its name, returns the rc and the name to tell the user about like writeOutput
+        """
+        if (self.bundle != None):
+            self.bundle.addWritten(fileName, self.offset)
+            return (None, "%s:%s" % (clOutputPath, fileName))
+
+        self.file.close()
+        outputFile = os.path.join(clOutputPath, fileName)
+        rc = formatXml(self.tempFile)
+        if (rc):
+            os.remove(self.tempFile)
+            return (rc, outputFile)
+        replaceFile(self.tempFile, outputFile)
+        return (None, outputFile)
+
+    def discard(self):
+        """
+        Throws away what was written, the part already in a bundle is left out of its index
+        """
+        if (self.bundle == None):
+            self.file.close()
+            os.remove(self.tempFile)
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The defaults for the command line options used by the functions below
+# The main code sets these from the command line, other tools importing this file can set them directly
+clInputPath = "."
+clDebug = False
+clRecordMode = False
+clOutputPath = "."
+clBundle = False
+clBinaryRecords = False
+clBinaryKeywords = False
+clVerify = False
+clStream = False
+# The layout policy, None to lay the records out in manifest order
+clAccesses = None
+clPageSize = None
+clReport = False
+
+# The full path of every input file found by findFile
+# Tools holding a manifest in memory can use this to see if any of the files it was created from have changed
+inputFiles = list()
+
+# The keywords that have already been through Stage 2 and 3, keyed by the keyword element
+# A keyword element shared by a base manifest and its variants is only checked and converted to binary once
+# The keys are weak, so these go away with the manifests that hold them
+verifiedKeywords = weakref.WeakKeyDictionary()
+keywordModels = weakref.WeakKeyDictionary()
+
+# The base manifests loaded by variants in this run, see loadBase
+baseManifests = dict()
+loadingBases = set()
+
+# The output files written in this run, and the ones left alone because they already had the same contents
+outputsWritten = set()
+outputsUnchanged = set()
+
+# The (manifest file, image size, size given) of each image reported on with --report, for the summary of a batch
+spaceReports = list()
+
+# The templates loaded for the jobs of a batch build, each the (image model, size given, hash) keyed by the template file
+batchTemplates = dict()
 
 ############################################################
 # Function - Functions - Functions - Functions - Functions
@@ -91,7 +163,10 @@ def findFile(filename, searchPath):
             found = 1
             break
     if found:
-        return os.path.abspath(os.path.join(path, filename))
+        fullPath = os.path.abspath(os.path.join(path, filename))
+        if (fullPath not in inputFiles):
+            inputFiles.append(fullPath)
+        return fullPath
     else:
         return None
 
@@ -113,10 +188,9 @@ def parseXml(xmlFile):
     # Read in the file with ET
     # If there are tag mismatch errors or other general gross format problems, it will get caught here
     # Once we return from this function, then we'll check to make sure only supported tags were given, etc..
-    # Invoke the extended comment parser, which will handle preserving comments in the output file
-    parser = ET.XMLParser(target=CommentedTreeBuilder())
+    # The xml backend keeps the comments, so they are written back out in the output file
     try:
-        root = ET.parse(fullPathFile, parser=parser).getroot()
+        root = vpdxml.parse(fullPathFile)
     except Exception as e:
         out.error("Unable to parse %s!" % fullPathFile)
         out.error("Check your file for basic XML formatting issues, or missing toplevel <vpd> tag")
@@ -137,9 +211,11 @@ def parseXml(xmlFile):
 
 # Function to write out the resultant xml file
 def writeXml(manifest, outputFile):
-    tree = ET.ElementTree(manifest)
-    tree.write(outputFile, encoding="utf-8", xml_declaration=True)
-    # Now rip it through xmllint quick to cleanup formatting problems from the ET print
+    vpdxml.write(manifest, outputFile)
+    return formatXml(outputFile)
+
+# Rip a written xml file through xmllint quick to cleanup formatting problems from the ET print
+def formatXml(outputFile):
     if (os.path.isfile("/usr/bin/xmllint")):
         rc = os.system("/usr/bin/xmllint --format %s -o %s" % (outputFile, outputFile))
         if (rc):
@@ -150,19 +226,94 @@ def writeXml(manifest, outputFile):
 
     return None
 
+# The temp file an output file is written to before it's moved into place
+# It's in the same directory so the rename can't cross filesystems, and has the host and pid so two builds don't share it,
+# even on different hosts writing to a shared directory
+def tempFileName(outputFile):
+    return os.path.join(os.path.dirname(outputFile), ".%s.%s.tmp" % (os.path.basename(outputFile), vpdbatch.workerName()))
+
+# Returns if a file exists with exactly the contents in data
+def sameContents(fileName, data):
+    try:
+        if (os.path.getsize(fileName) != len(data)):
+            return False
+        with open(fileName, "rb") as f:
+            return (f.read() == data)
+    except (IOError, OSError):
+        return False
+
+# Move a finished temp file over an output file, unless the output file already has the same contents
+# The rename replaces the file in one step, so anything reading it sees the old file or the new one, never part of one
+# Leaving an unchanged file alone keeps its mtime, so the steps that depend on it don't run again
+def replaceFile(tempFile, outputFile):
+    with open(tempFile, "rb") as f:
+        same = sameContents(outputFile, f.read())
+    if (same):
+        os.remove(tempFile)
+        outputsUnchanged.add(outputFile)
+    else:
+        os.rename(tempFile, outputFile)
+        outputsWritten.add(outputFile)
+
+# Tell the user about an output file, and if it was left alone
+def reportOutput(description, fileName):
+    if (fileName in outputsUnchanged):
+        out.msg("Unchanged %s: %s" % (description, fileName))
+    else:
+        out.msg("Wrote %s: %s" % (description, fileName))
+
+# Write an output file either into the bundle, or into the output path when there isn't one
+# data can be a bytearray, a memoryview of part of the image, a manifest to write as a tvpd or a json template
+# Returns the rc and the name to tell the user about
+def writeOutput(bundle, outputPath, fileName, data):
+    if (bundle == None):
+        outputFile = os.path.join(outputPath, fileName)
+        if (isinstance(data, dict)):
+            data = vpdjson.dumps(data)
+        elif (ET.iselement(data)):
+            # xmllint works on a file, so the tvpd is written and formatted as a temp file before it's compared
+            tempFile = tempFileName(outputFile)
+            rc = writeXml(data, tempFile)
+            if (rc):
+                os.remove(tempFile)
+                return (rc, outputFile)
+            replaceFile(tempFile, outputFile)
+            return (None, outputFile)
+
+        # Nothing is written when the file already has these contents
+        if (sameContents(outputFile, data)):
+            outputsUnchanged.add(outputFile)
+            return (None, outputFile)
+        tempFile = tempFileName(outputFile)
+        vpdFile = open(tempFile, "wb")
+        writeDataToVPD(vpdFile, data)
+        vpdFile.close()
+        os.rename(tempFile, outputFile)
+        outputsWritten.add(outputFile)
+        return (None, outputFile)
+
+    # The bundle gets the same tvpd writeXml would create, without the xmllint cleanup
+    if (isinstance(data, dict)):
+        data = vpdjson.dumps(data)
+    elif (ET.iselement(data)):
+        tvpd = io.BytesIO()
+        vpdxml.write(data, tvpd)
+        data = tvpd.getvalue()
+    bundle.add(fileName, data)
+    return (None, "%s:%s" % (outputPath, fileName))
+
+# Point to the file and line a tag with errors was read from, when the xml backend kept them
+def reportLocation(element, what):
+    location = vpdxml.location(element)
+    if (location != None):
+        out.error("%s is at %s" % (what, location))
+
 # Check the <vpd> XML to make sure the required elements are found
 def checkElementsVpd(root):
     errorsFound = 0
 
-    # Do some basic error checking of what we've read in
-    # Make sure the root starts with the vpd tag
-    # If it doesn't, it's not worth syntax checking any further
-    # This is the only time we'll just bail instead of accumulating
-    if (root.tag != "vpd"):
-        out.error("%s does not start with a <vpd> tag.  No further checking will be done until fixed!" % tvpdFile)
-        exit(1)
-
-    # We at least have a proper top level vpd tag, so loop thru the rest of the levels and check for any unknown tags
+    # The caller has already made sure the root starts with the vpd tag
+    # Loop thru the rest of the levels and check for any unknown tags
     # This will also be a good place to check for the required tags
 
     # Define the expected tags at this level
@@ -177,6 +328,7 @@ def checkElementsVpd(root):
         # See if this is a tag we even expect
         if child.tag not in vpdTags:
             out.error("Unsupported tag <%s> found while parsing the <vpd> level" % child.tag)
+            reportLocation(child, "The <%s> tag" % child.tag)
             errorsFound += 1
 
         # It was a supported tag
@@ -253,6 +405,9 @@ def checkElementsRecord(record):
                   (recordTags["rdesc"], recordName))
         errorsFound += 1
 
+    if (errorsFound):
+        reportLocation(record, "The record %s" % recordName)
+
     return (errorsFound, recordName)
                 
 # Check the <keyword> XML to make sure the required elements are found
@@ -305,8 +460,53 @@ def checkElementsKeyword(keyword, recordName):
                       (tag, keywordTagCount, keywordTags[tag], keywordName, recordName))
             errorsFound += 1
 
+    if (errorsFound):
+        reportLocation(keyword, "The keyword %s in record %s" % (keywordName, recordName))
+
     return (errorsFound, keywordName)
 
+# Check the <vpd> XML of a variant manifest, which only has what is different from its base
+def checkElementsVariant(root):
+    errorsFound = 0
+
+    # Define the expected tags at this level
+    variantTags = {"base" : 0, "name" : 0, "size" : 0, "VD" : 0, "record" : 0, "removerecord" : 0}
+
+    # Go thru the children at this level
+    for child in root:
+        # Comments aren't basestring tags
+        if not isinstance(child.tag, basestring):
+            continue
+
+        # See if this is a tag we even expect
+        if child.tag not in variantTags:
+            out.error("Unsupported tag <%s> found while parsing the <vpd> level of a variant" % child.tag)
+            reportLocation(child, "The <%s> tag" % child.tag)
+            errorsFound += 1
+
+        # It was a supported tag
+        else:
+            variantTags[child.tag] += 1
+
+    # Everything but the base comes from the base manifest when it isn't given
+    if (variantTags["base"] != 1):
+        out.error("The tag <base> was expected to have a count of 1, but was found with a count of %d" % variantTags["base"])
+        errorsFound += 1
+    for tag in ["name", "size", "VD"]:
+        if (variantTags[tag] > 1):
+            out.error("The tag <%s> was expected to have a count of 0 or 1, but was found with a count of %d" %
+                      (tag, variantTags[tag]))
+            errorsFound += 1
+
+    # Every record removed has to say which one
+    for removerecord in root.findall("removerecord"):
+        if (removerecord.attrib.get("name") == None):
+            out.error("A <removerecord> tag is missing the name attribute")
+            reportLocation(removerecord, "The <removerecord> tag")
+            errorsFound += 1
+
+    return errorsFound
+
 # Function to write properly packed/encoded data to the vpdFile
 def writeDataToVPD(vpdFile, data, offset = None):
     rc = 0
@@ -326,30 +526,13 @@ def writeDataToVPD(vpdFile, data, offset = None):
 
     return rc
 
-# Turn the tvpd keyword data into packed binary data we can write to the file
-def packKeyword(keyword, length, data, format):
-    # We'll return a bytearray of the packed data
-    keywordPack = bytearray()
-
-    # Write the keyword
-    keywordPack += bytearray(keyword.encode())
-    
-    # Write the length
-    # The < at the front says to pack it little endian
-    if (keyword[0] == "#"): # Keywords that start with pound have a 2 byte length
-        # H is 2 bytes
-        keywordPack += struct.pack("<H", length)
-    else:
-        # B is 1 byte
-        keywordPack += struct.pack("<B", length)
-
-    # Write the data
+# Turn the tvpd keyword data into the binary data that goes in the keyword
+def keywordData(length, data, format):
     # If the user didn't provide data = length given, we'll pad the end with 0's
     if (format == "ascii"):
         # Pad if necessary
         data = data.ljust(length, '\0')
-        # Write it
-        keywordPack += bytearray(data.encode())
+        return bytes(data.encode())
     elif (format == "hex"):
         # Remove white space and carriage returns from the data before we get to fromhex
         # If we don't, it throws off the ljust logic below to set the field to proper length
@@ -357,33 +540,15 @@ def packKeyword(keyword, length, data, format):
         data = data.replace("\n","")
         # Pad if necessary (* 2 to convert nibble data to byte length)
         data = data.ljust((length * 2), '0')
-        # Write it
-        keywordPack += bytearray.fromhex(data)
+        return bytes(bytearray.fromhex(data))
+    elif (format == "repeat"):
+        # The hex pattern is repeated out to the length, the last copy is cut short if it doesn't fit
+        pattern = bytes(bytearray.fromhex(data.replace(" ","").replace("\n","")))
+        return (pattern * ((length // len(pattern)) + 1))[:length]
     else:
-        out.error("Unknown format type %s passed into packKeyword" % format)
+        out.error("Unknown format type %s passed into keywordData" % format)
         return None
 
-    # The keyword is packed, send it back
-    return keywordPack
-
-# Calculate the length of the PF record
-def calcPadFill(record):
-    pfLength = 0
-
-    # The PF keyword must exist
-    # The keyword section of record must be at least 40 bytes long, padfill will be used to achieve that
-    # If the keyword section is over over 40, it must be aligned on word boundaries and PF accomplishes that
-
-    # The record passed in at this point is the keywords + 3 other bytes (LR Tag & Record Length)
-    # Those 3 bytes happen to match the length of the PF keyword and its length which needs to be in the calculation
-    # So we'll just use the length of the record, but it's due to those offsetting lengths of 3
-    pfLength = 40 - len(record)
-    if (pfLength < 1):
-        # It's > 40, so now we just need to fill to nearest word
-        pfLength = (4 - (len(record) % 4))
-
-    return pfLength
-
 # Check input hex data for proper formatting
 def checkHexDataFormat(kwdata):
     # Remove white space and carriage returns from the kwdata
@@ -397,103 +562,139 @@ def checkHexDataFormat(kwdata):
     return (match, kwdata)
 
 
-############################################################
-# Main - Main - Main - Main - Main - Main - Main - Main
-############################################################
-rc = 0
-
-################################################
-# Command line options
-# Create the argparser object
-# We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
-parser = argparse.ArgumentParser(description='The VPD image creation tool', add_help=False,
-                                 formatter_class=argparse.RawDescriptionHelpFormatter,
-                                 epilog=textwrap.dedent('''\
-                                 Examples:
-                                   ./createVpd.py -m examples/simple/simple.tvpd -o /tmp
-                                   ./createVpd.py -m examples/rbinfile/rbinfile.tvpd -i examples/rbinfile -o /tmp
-                                 '''))
-# Create our group of required command line args
-reqgroup = parser.add_argument_group('Required Arguments')
-reqgroup.add_argument('-m', '--manifest', help='The input file detailing all the records and keywords to be in the image', required=True)
-reqgroup.add_argument('-o', '--outpath', help='The output path for the files created by the tool', required=True)
-# Create our group of optional command line args
-optgroup = parser.add_argument_group('Optional Arguments')
-optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
-optgroup.add_argument('-d', '--debug', help="Enables debug printing", action="store_true")
-optgroup.add_argument('-c', '--record-mode', help="The input is a record only file.  No output VPD binary created.", action="store_true")
-optgroup.add_argument('-r', '--binary-records', help="Create binary files for each record in the template", action="store_true")
-optgroup.add_argument('-k', '--binary-keywords', help="Create binary files for each keyword in the template", action="store_true")
-optgroup.add_argument('-i', '--inpath', help="The search path to use for the files referenced in the manifest")
-
-# We've got everything we want loaded up, now look for it
-args = parser.parse_args()
-
-# Get the manifest file and get this party started
-clManifestFile = args.manifest
-
-# Look for output path
-clOutputPath = args.outpath
-# Make sure the path exists, we aren't going to create it
-if (os.path.exists(clOutputPath) != True):
-    out.error("The given output path %s does not exist!" % clOutputPath)
-    out.error("Please create the output directory and run again")
-    exit(1)
-
-# Look for input path
-clInputPath = args.inpath
-# Make sure the path exists
-if (clInputPath != None):
-    # Add the CWD onto the path so the local directory is always looked at
-    clInputPath += os.pathsep + "."
-else:
-    # Set it the CWD since it will be used throughout the program and having it set to None breaks things
-    clInputPath = "."
-
-# Debug printing
-clDebug = args.debug
-
-# Record only mode
-clRecordMode = args.record_mode
-
-# Create separate binary files for each record
-clBinaryRecords = args.binary_records
-
-# Create separate binary files for each keyword
-clBinaryKeywords = args.binary_keywords
-
-# We are going to do this in 3 stages
-# 1 - Read in the manifest and any other referenced files.  This will create a complete XML description of the VPD
-#     We will also check to make sure that all required tags are given and no extra tags exist
-# 2 - Parse thru the now complete vpd tree and make sure the data within the tags is valid.
-#     These are checks like data not greater than length, etc..
-# 3 - With the XML and contents verified correct, loop thru it again and write out the VPD data
-#
-# Note: Looping thru the XML twice between stage 1 and 2 makes it easier to surface multiple errors to the user at once.
-#       If we were trying to both validate the xml and data at once, it would be harder to continue and gather multiple errors like we do now
-
-################################################
-# Work with the manifest
-out.setIndent(0)
-out.msg("==== Stage 1: Parsing VPD XML files")
-out.setIndent(2)
-# Accumulate errors and return the total at the end
-# This allows the user to see all mistakes at once instead of iteratively running
-errorsFound = 0
-
-# Read in the top level manifest file and create the xml manifest tree
-# If this parse gets an error, it's a hard stop since the rest of the code would do nothing
-(rc, manifest) = parseXml(clManifestFile)
-if (rc):
-    out.error("Please check your -m or -i cmdline options for typos")
-    exit(rc)
-
-# We have the top level manifest tree.  Make sure we have all the required elements in the <vpd> section
-# Accumulate errors for this checking
-errorsFound += checkElementsVpd(manifest)
-
-# We've parsed and check the <vpd> section, now do the same to all <records> children
-for record in manifest.iter("record"):
+# Check the size of the created image against the <size> given in the tvpd
+def checkImageSize(imageSize, maxSizeBytes):
+    errorsFound = 0
+
+    # Check if the image size is larger than the maxSizeBytes
+    if (imageSize > maxSizeBytes):
+        out.error("The generated binary image (%s) is too large for the size given (%s)" % (imageSize, maxSizeBytes))
+        errorsFound += 1
+
+    return errorsFound
+
+# Check keyword data given to replace the keyword data in an image
+# The overrides are a dictionary of records, each a dictionary of keyword names to the new data
+# The data is given in the kwformat of the keyword in the template, with mixed keywords taking hex data
+def checkOverrides(vpdImage, overrides):
+    errorsFound = 0
+
+    for recordName in overrides:
+        record = vpdImage.record(recordName)
+        if (record == None):
+            out.error("The override record %s is not found in the manifest" % recordName)
+            errorsFound += 1
+            continue
+
+        if (record.raw != None):
+            out.error("The override record %s is a rbinfile, its keywords can't be changed" % recordName)
+            errorsFound += 1
+            continue
+
+        for keywordName in overrides[recordName]:
+            keyword = record.keyword(keywordName)
+            if (keyword == None):
+                out.error("The override keyword %s is not found in record %s" % (keywordName, recordName))
+                errorsFound += 1
+                continue
+
+            kwdata = overrides[recordName][keywordName]
+            if (not isinstance(kwdata, str)):
+                out.error("The override value for keyword %s in record %s has to be a string" % (keywordName, recordName))
+                errorsFound += 1
+                continue
+
+            if (keyword.format == "ascii"):
+                # Anything outside of ascii encodes to more than one byte, it wouldn't fit the length checked here
+                if (any(ord(c) > 0x7f for c in kwdata)):
+                    out.error("The override value for keyword %s in record %s has non ascii characters" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+                datalen = len(kwdata.encode())
+            else:
+                (rc, kwdata) = checkHexDataFormat(kwdata)
+                if (rc):
+                    out.error("checkHexDataFormat return an error for for override keyword %s in record %s" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+                if (len(kwdata) % 2):
+                    out.error("The override value for keyword %s in record %s has to be whole bytes of hex" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+                # Nibbles to bytes
+                datalen = (len(kwdata) // 2)
+
+            if (datalen > len(keyword.data)):
+                out.error("The length of the override value is longer than the <kwlen> for keyword %s in record %s" %
+                          (keywordName, recordName))
+                errorsFound += 1
+
+    return errorsFound
+
+# Create a copy of an image with the keyword data replaced by the checked overrides
+# Only the records with overrides are copied, the rest are shared with the original image
+def applyOverrides(vpdImage, overrides):
+    newImage = vpdmodel.VpdImage(vpdImage.name, vpdImage.version)
+
+    for record in vpdImage.records:
+        if (record.name not in overrides):
+            newImage.records.append(record)
+            continue
+
+        newRecord = vpdmodel.Record(record.name)
+        for keyword in record.keywords:
+            if (keyword.name in overrides[record.name]):
+                kwformat = "ascii" if (keyword.format == "ascii") else "hex"
+                keyword = vpdmodel.Keyword(keyword.name,
+                                           keywordData(len(keyword.data), overrides[record.name][keyword.name], kwformat),
+                                           keyword.format)
+            else:
+                keyword = vpdmodel.Keyword(keyword.name, keyword.data, keyword.format)
+            newRecord.keywords.append(keyword)
+        newImage.records.append(newRecord)
+
+    return newImage
+
+# Read the data of a bin keyword out of its file
+# offset and length pick out part of the file, the default is all of it
+# They can be numbers, or strings in decimal or in hex with 0x in front
+# Returns the errors found, the data and the offset it was read from
+def readBinData(databinfileName, offset, length, keywordName, recordName):
+    # Check to make sure the file can be found
+    databinfile = findFile(databinfileName, clInputPath)
+    if (databinfile == None):
+        out.error("The input binary data file %s could not be found!  Please check your tvpd or input path." % databinfileName)
+        return (1, None, None)
+
+    fileSize = os.path.getsize(databinfile)
+    try:
+        if (offset == None):
+            offset = 0
+        elif (isinstance(offset, basestring)):
+            offset = int(offset, 0)
+        if (length == None):
+            length = fileSize - offset
+        elif (isinstance(length, basestring)):
+            length = int(length, 0)
+        if (not isinstance(offset, int) or not isinstance(length, int) or isinstance(offset, bool) or isinstance(length, bool)):
+            raise ValueError("not an integer")
+    except ValueError:
+        out.error("The offset or length for the input binary data file %s is not a number for keyword %s in record %s" %
+                  (databinfileName, keywordName, recordName))
+        return (1, None, None)
+    if (offset < 0 or length < 0 or (offset + length) > fileSize):
+        out.error("The offset %d and length %d are outside of the %d bytes in %s for keyword %s in record %s" %
+                  (offset, length, fileSize, databinfileName, keywordName, recordName))
+        return (1, None, None)
+
+    with open(databinfile, mode='rb') as binFile:
+        binFile.seek(offset)
+        return (0, binFile.read(length), offset)
+
+# Check a <record> and read in the rtvpdfile, ktvpdfile or bin files it references
+# Returns the record with everything merged in, which is the record given unless it was a rtvpdfile
+def loadRecord(record):
+    errorsFound = 0
 
     # Accumulate errors for this checking
     # This returning non 0 would indicate a problem at the base record level the user will have to fix
@@ -512,7 +713,7 @@ for record in manifest.iter("record"):
         if (rc):
             out.error("The <rtvpdfile> given could not be found.")
             errorsFound += 1
-            continue
+            return (errorsFound, record)
 
         # Early versions of these files could start with <vpd> tag, handle that by getting down a level to the record
         # If it's already the top level entry, then just assign over
@@ -533,7 +734,7 @@ for record in manifest.iter("record"):
             out.error("The record (%s) found in %s doesn't match the record name in the manifest (%s)" %
                       (newRecordName, rtvpdfile.text, recordName))
             errorsFound += 1
-            continue
+            return (errorsFound, record)
 
         # Insert a comment with a name of the file the record came from
         comment = ET.Comment(" Imported rtvpdfile contents - %s " % rtvpdfileName)
@@ -551,10 +752,10 @@ for record in manifest.iter("record"):
 
     # Done handling the record level
     # We can now loop through the keywords in the records and check them
-        
+
     # Look for ktvpdfile lines
-    for keyword in newRecord.iter("keyword"):
-        
+    for keyword in list(newRecord.iter("keyword")):
+
         # Accumulate errors for this checking
         # This returning non 0 would indicate a problem at the base keyword level the user will have to fix
         # However, we'll still continue to try and parse any ktvpdfile entries contained in this record
@@ -601,28 +802,39 @@ for record in manifest.iter("record"):
         # See if the kwformat is a binary file ("bin")
         # If it is, load it in and turn it into a hex data keyword for the rest of the run
         # This is necessary so when the output tvpd is written, we write out the actual data instead of a reference to the file
-        elif (keyword.find("kwformat").text == "bin"):
-            # Get the name of the file out of the kwdata
-            databinfileName = keyword.find("kwdata").text
-            # Check to make sure the file can be found
-            databinfile = findFile(databinfileName, clInputPath)
-            if (databinfile == None):
-                out.error("The input binary data file %s could not be found!  Please check your tvpd or input path." % databinfileName)
-                errorsFound += 1
+        elif (keyword.find("kwformat") != None and keyword.find("kwformat").text == "bin"):
+            # Get the name of the file out of the kwdata, the offset and length attributes pick out part of it
+            kwdataXml = keyword.find("kwdata")
+            databinfileName = kwdataXml.text
+            sliced = ("offset" in kwdataXml.attrib or "length" in kwdataXml.attrib)
+            (rc, kwdata, offset) = readBinData(databinfileName, kwdataXml.attrib.get("offset"), kwdataXml.attrib.get("length"),
+                                               keywordName, newRecordName)
+            if (rc):
+                errorsFound += rc
                 continue
+            length = len(kwdata)
 
             # We were able to read the file in successfully
             # - Create our newKeyword for the replacement
             newKeyword = keyword
             # - Set our data type
             newKeyword.find("kwformat").text = "hex"
-            # - Read in our bin data & store it as hex ascii data
-            kwdata = open(databinfile, mode='rb').read()
-            newKeyword.find("kwdata").text = binascii.hexlify(kwdata)
+            # - Store our bin data as hex ascii data
+            kwdataXml.text = binascii.hexlify(kwdata).decode()
+            kwdataXml.attrib.pop("offset", None)
+            kwdataXml.attrib.pop("length", None)
             # Insert a comment with a name of the file the data came from
-            comment = ET.Comment(" Imported bin contents of file as hex - %s " % databinfileName)
+            if (not sliced):
+                comment = ET.Comment(" Imported bin contents of file as hex - %s " % databinfileName)
+            else:
+                comment = ET.Comment(" Imported bytes %d to %d of bin file as hex - %s " % (offset, offset + length - 1, databinfileName))
             comment.tail = "\n"
-            newKeyword.insert(list(newKeyword).index(newKeyword.find("kwdata")), comment)
+            newKeyword.insert(list(newKeyword).index(kwdataXml), comment)
+
+            # The data is already binary, so stage 2 doesn't have to check the hex and stage 3 doesn't have to convert it back
+            kwlen = keyword.find("kwlen")
+            if (kwlen != None and kwlen.text != None and kwlen.text.strip().isdigit() and length <= int(kwlen.text)):
+                keywordModels[keyword] = kwdata.ljust(int(kwlen.text), b"\0")
 
             # We were successful, make our replacement active
             newKeywordReplace = True
@@ -636,48 +848,270 @@ for record in manifest.iter("record"):
             newRecord.insert(list(newRecord).index(keyword), newKeyword)
             newRecord.remove(keyword)
 
-    # End of the record loop    
-    # Merge the new record into the main manifest
-    # ET doesn't have a replace function.  You can do an extend/remove, but that changes the order of the file
-    # The goal is to preserve order, so that method doesn't work
-    # The below code will insert the newRecord in the list above the current matching record definition
-    # Then remove the original record definition, preserving order
-    manifest.insert(list(manifest).index(record), newRecord)
-    manifest.remove(record)
-
-# All done with error checks, bailout if we hit something
-if (errorsFound):
-    out.msg("")
-    out.error("%d error%s found in the xml.  Please review the above errors and correct them." %
-              (errorsFound, "s" if (errorsFound > 1) else ""))
-    exit(errorsFound)
-
-################################################
-# Verify the tvpd XML
-# read thru the complete tvpd and verify/check actual tag contents
-out.setIndent(0)
-out.msg("==== Stage 2: Verifying tvpd syntax")
-out.setIndent(2)
-errorsFound = 0
-# Keep a dictionary of the record names we come across, will let us find duplicates
-recordNames = dict()
-
-# Do our top level <vpd> validation of tag contents
-
-# Nothing to validate for the name, however grab it for use in later operations
-# In normal mode, the user has to specify the output file name in the input
-# For record only mode, we only use the input filename as the output file name
-if (not clRecordMode):
-    vpdName = manifest.find("name").text
-    # If the user passed in the special name of FILENAME, we'll use in the input file name, minus the extension, as the output
-    if (vpdName == "FILENAME"):
-        vpdName = os.path.splitext(os.path.basename(clManifestFile))[0]
-else:
-    vpdName = os.path.basename(clManifestFile)
-
-# Validate the <size> is given in proper syntax
-if (not clRecordMode):
-    vpdSize = manifest.find("size").text
+    return (errorsFound, newRecord)
+
+# Stage 1 - Read in the manifest and any other referenced files
+# Returns the manifest with all rtvpdfile, ktvpdfile and bin references merged in
+def loadManifest(manifestFile):
+    # Accumulate errors and return the total at the end
+    # This allows the user to see all mistakes at once instead of iteratively running
+    errorsFound = 0
+
+    # Start a new list of the files read in to create this manifest
+    del inputFiles[:]
+
+    # Read in the top level manifest file and create the xml manifest tree
+    # If this parse gets an error, it's a hard stop since the rest of the code would do nothing
+    (rc, manifest) = parseXml(manifestFile)
+    if (rc):
+        return (rc, None)
+
+    # Do some basic error checking of what we've read in
+    # Make sure the root starts with the vpd tag
+    # If it doesn't, it's not worth syntax checking any further
+    # This is the only time we'll just bail instead of accumulating
+    if (manifest.tag != "vpd"):
+        out.error("%s does not start with a <vpd> tag.  No further checking will be done until fixed!" % manifestFile)
+        return (1, None)
+
+    # A variant only has what is different from its base manifest, put the two together
+    if (manifest.find("base") != None):
+        return loadVariant(manifest, manifestFile)
+
+    # We have the top level manifest tree.  Make sure we have all the required elements in the <vpd> section
+    # Accumulate errors for this checking
+    errorsFound += checkElementsVpd(manifest)
+
+    # We've parsed and check the <vpd> section, now do the same to all <records> children
+    for record in list(manifest.iter("record")):
+        (rc, newRecord) = loadRecord(record)
+        errorsFound += rc
+
+        # End of the record loop
+        # Merge the new record into the main manifest
+        # ET doesn't have a replace function.  You can do an extend/remove, but that changes the order of the file
+        # The goal is to preserve order, so that method doesn't work
+        # The below code will insert the newRecord in the list above the current matching record definition
+        # Then remove the original record definition, preserving order
+        manifest.insert(list(manifest).index(record), newRecord)
+        manifest.remove(record)
+
+    return (errorsFound, manifest)
+
+# Load a base manifest, or get it from the ones already loaded in this run
+# The base is kept along with the size and mtime of every file it was created from, if any of them change it's loaded again
+# Returns the errors found and the base manifest, which must not be changed by the caller
+def loadBase(baseFile):
+    key = (baseFile, clInputPath)
+    if (key in baseManifests):
+        (errorsFound, base, stamps) = baseManifests[key]
+        if (all((os.path.exists(fileName) and fileStamp(fileName) == stamp) for (fileName, stamp) in stamps)):
+            out.msg("Using base manifest %s" % baseFile)
+            inputFiles.extend(fileName for (fileName, stamp) in stamps if (fileName not in inputFiles))
+            return (errorsFound, base)
+
+    if (baseFile in loadingBases):
+        out.error("The base manifest %s is a variant of itself!" % baseFile)
+        return (1, None)
+
+    # The base gets a list of input files of its own, the variant's are put back after
+    variantFiles = list(inputFiles)
+    loadingBases.add(baseFile)
+    try:
+        (errorsFound, base) = loadManifest(baseFile)
+    finally:
+        loadingBases.discard(baseFile)
+    if (base != None):
+        # The rbinfiles aren't read until later, but they have to be tracked as part of the base as well
+        for rbinfile in base.iter("rbinfile"):
+            findFile(rbinfile.text, clInputPath)
+    baseFiles = list(inputFiles)
+    del inputFiles[:]
+    inputFiles.extend(variantFiles)
+    inputFiles.extend(fileName for fileName in baseFiles if (fileName not in inputFiles))
+
+    if (base != None):
+        baseManifests[key] = (errorsFound, base, [(fileName, fileStamp(fileName)) for fileName in baseFiles])
+    return (errorsFound, base)
+
+# The size and mtime of a file, used to tell when a loaded base manifest is out of date
+# Python 2 has no st_mtime_ns, the float mtime is only compared to itself so it does as well there
+def fileStamp(fileName):
+    st = os.stat(fileName)
+    return (getattr(st, "st_mtime_ns", st.st_mtime), st.st_size)
+
+# Put the keywords of a variant record on top of the same record from the base manifest
+# Keywords with the same name take the place of the base keyword, new ones go at the end and <removekeyword> drops them
+# The base record isn't changed, a new record is returned that shares all the unchanged keywords with it
+def overlayRecord(baseRecord, overlay):
+    errorsFound = 0
+    recordName = overlay.attrib.get("name")
+
+    # Only keyword records can be changed a keyword at a time
+    if (baseRecord.find("keyword") == None):
+        out.error("The record %s in the base manifest is a rbinfile, a variant can only replace it with a <rtvpdfile> or <rbinfile>" %
+                  recordName)
+        return (1, None)
+
+    # Define the expected tags at this level
+    overlayTags = ["rdesc", "keyword", "removekeyword"]
+    for child in overlay:
+        # Comments aren't basestring tags
+        if not isinstance(child.tag, basestring):
+            continue
+        if child.tag not in overlayTags:
+            out.error("Unsupported tag <%s> found while parsing the <record> level for variant record %s" % (child.tag, recordName))
+            errorsFound += 1
+
+    # The keywords in the base record, to check the ones removed against
+    baseKeywords = set(keyword.attrib.get("name") for keyword in baseRecord.findall("keyword"))
+    removed = set()
+    for removekeyword in overlay.findall("removekeyword"):
+        keywordName = removekeyword.attrib.get("name")
+        if (keywordName == None):
+            out.error("A <removekeyword> tag in variant record %s is missing the name attribute" % recordName)
+            errorsFound += 1
+        elif (keywordName not in baseKeywords):
+            out.error("The keyword %s to remove is not in record %s of the base manifest" % (keywordName, recordName))
+            errorsFound += 1
+        removed.add(keywordName)
+
+    # Build the new record in the order of the base, with the variant keywords in place of the base ones
+    keywords = dict((keyword.attrib.get("name"), keyword) for keyword in overlay.findall("keyword"))
+    record = ET.Element(baseRecord.tag, baseRecord.attrib)
+    record.text = baseRecord.text
+    record.tail = baseRecord.tail
+    for child in baseRecord:
+        if (child.tag == "rdesc" and overlay.find("rdesc") != None):
+            record.append(overlay.find("rdesc"))
+        elif (child.tag == "keyword" and child.attrib.get("name") in removed):
+            continue
+        elif (child.tag == "keyword" and child.attrib.get("name") in keywords):
+            record.append(keywords.pop(child.attrib.get("name")))
+        else:
+            record.append(child)
+    for keyword in overlay.findall("keyword"):
+        if (keyword.attrib.get("name") in keywords):
+            record.append(keyword)
+
+    return (errorsFound, record)
+
+# Stage 1 for a variant manifest, one that names a <base> manifest and only gives what is different from it
+# The base is loaded once per run and shared by all its variants, only the records the variant changes are loaded here
+# Returns a new manifest that shares every record the variant doesn't change with the base
+def loadVariant(variant, variantFile):
+    if (clRecordMode):
+        out.error("%s is a variant manifest, which isn't supported in record mode" % variantFile)
+        return (1, None)
+
+    # Accumulate errors for this checking, the records can still be checked against the base
+    errorsFound = checkElementsVariant(variant)
+
+    # Get the base the variant builds on
+    baseName = variant.find("base").text
+    baseFile = findFile(baseName, clInputPath)
+    if (baseFile == None):
+        out.error("The base manifest %s could not be found!" % baseName)
+        return (1, None)
+    (rc, base) = loadBase(baseFile)
+    if (base == None or rc):
+        out.error("The base manifest %s has errors, they have to be fixed before its variants can be built" % baseFile)
+        return (max(rc, 1), None)
+    baseRecords = dict((record.attrib.get("name"), record) for record in base.findall("record"))
+
+    # The records the variant takes out
+    removed = set()
+    for removerecord in variant.findall("removerecord"):
+        recordName = removerecord.attrib.get("name")
+        if (recordName not in baseRecords):
+            out.error("The record %s to remove is not in the base manifest %s" % (recordName, baseFile))
+            errorsFound += 1
+        removed.add(recordName)
+
+    # The records the variant changes or adds
+    # A record with a rtvpdfile or rbinfile, or one the base doesn't have, is a whole record
+    # Otherwise the keywords given are put on top of the base record
+    changed = dict()
+    added = list()
+    for record in variant.findall("record"):
+        recordName = record.attrib.get("name")
+        baseRecord = baseRecords.get(recordName)
+        if (baseRecord != None and record.find("rtvpdfile") == None and record.find("rbinfile") == None):
+            (rc, record) = overlayRecord(baseRecord, record)
+            errorsFound += rc
+            if (record == None):
+                continue
+
+        (rc, newRecord) = loadRecord(record)
+        errorsFound += rc
+        if (recordName in changed or recordName in removed):
+            out.error("The record %s is given more than once in the variant" % recordName)
+            errorsFound += 1
+        elif (baseRecord != None):
+            changed[recordName] = newRecord
+        else:
+            added.append(newRecord)
+
+    # Put the manifest together in the order of the base, with any new records after the last base record
+    manifest = ET.Element(base.tag, base.attrib)
+    manifest.text = base.text
+    lastRecord = base.findall("record")[-1]
+    for child in base:
+        if (child.tag in ["name", "size", "VD"] and variant.find(child.tag) != None):
+            manifest.append(variant.find(child.tag))
+        elif (child.tag == "record" and child.attrib.get("name") in changed):
+            manifest.append(changed[child.attrib.get("name")])
+        elif (child.tag != "record" or child.attrib.get("name") not in removed):
+            manifest.append(child)
+        if (child is lastRecord):
+            manifest.extend(added)
+
+    return (errorsFound, manifest)
+
+# Stage 2 - Parse thru the complete vpd tree and make sure the data within the tags is valid
+# Returns the name to use for the output files and the max size of the image
+def verifyManifest(manifest, manifestFile):
+    # Do our top level <vpd> validation of tag contents
+    (errorsFound, vpdName, maxSizeBytes) = verifyVpd(manifest, manifestFile)
+
+    # Keep a dictionary of the record names we come across, will let us find duplicates
+    recordNames = dict()
+
+    # Loop thru our records and then thru the keywords in each record
+    for record in manifest.iter("record"):
+        errorsFound += verifyRecord(record, recordNames)
+
+    return (errorsFound, vpdName, maxSizeBytes)
+
+# Stage 2 for the top level <vpd> tags, the records are done by verifyRecord
+# Returns the name to use for the output files and the max size of the image
+def verifyVpd(manifest, manifestFile):
+    errorsFound = 0
+
+    # Nothing to validate for the name, however grab it for use in later operations
+    # In normal mode, the user has to specify the output file name in the input
+    # For record only mode, we only use the input filename as the output file name
+    if (not clRecordMode):
+        vpdName = manifest.find("name").text
+        # If the user passed in the special name of FILENAME, we'll use in the input file name, minus the extension, as the output
+        if (vpdName == "FILENAME"):
+            vpdName = os.path.splitext(os.path.basename(manifestFile))[0]
+    else:
+        vpdName = os.path.basename(manifestFile)
+
+    # Validate the <size> is given in proper syntax
+    maxSizeBytes = None
+    if (not clRecordMode):
+        (rc, maxSizeBytes) = checkSize(manifest.find("size").text)
+        errorsFound += rc
+
+    return (errorsFound, vpdName, maxSizeBytes)
+
+# Check the size of the image given in the template, a number followed by B/KB/MB
+# Returns the errors found and the size in bytes
+def checkSize(vpdSize):
+    errorsFound = 0
+
     # Make a new string with only the number
     maxSizeBytes = re.match('[0-9]*', vpdSize).group()
 
@@ -688,7 +1122,7 @@ if (not clRecordMode):
         out.error("No number detected in the size string.  Format of string must be number first, then units, e.g. 16KB.")
         out.error("Remove any characters or white space from in front of the number.")
         errorsFound += 1
-    
+
     # --------
     # Make a new string with the number removed
     sizeUnits = vpdSize[len(maxSizeBytes):]
@@ -709,14 +1143,50 @@ if (not clRecordMode):
         out.error("Unexpected units in the size string. Expected: B/KB/MB. Yours: %s" % sizeUnits)
         errorsFound += 1
 
-# Loop thru our records and then thru the keywords in each record
-for record in manifest.iter("record"):
+    return (errorsFound, maxSizeBytes)
+
+# Check a rbinfile is a record that goes with the record name it is given for
+# Returns the errors found and the contents of the file, None if it couldn't be found
+def checkRbinfile(rbinfileName, recordName):
+    errorsFound = 0
+
+    # Get the full path to the file given
+    rbinfile = findFile(rbinfileName, clInputPath)
+    if (rbinfile == None):
+        out.error("The rbinfile %s could not be found!  Please check your tvpd or input path" % (rbinfileName))
+        return (1, None)
+
+    # It does, read it in so we can check the record name
+    out.msg("Reading rbinfile %s" % (rbinfile))
+    rbinfileContents = open(rbinfile, mode='rb').read()
+
+    # --------
+    # Check the record name
+    # The RT keyword is usually first, but reversed records keep whatever order they had in the image
+    try:
+        rbinRecord = vpdmodel.Record.parse(rbinfileContents, 0)
+    except (vpdmodel.VpdError, IndexError):
+        out.error("The rbinfile %s is not a valid record!" % (rbinfile))
+        errorsFound += 1
+        rbinRecord = None
+    if (rbinRecord != None and recordName != rbinRecord.name):
+        out.error("The record name found %s in %s, does not match the name of the record %s in the tvpd" %
+                  (rbinRecord.name, rbinfile, recordName))
+        errorsFound += 1
+
+    return (errorsFound, rbinfileContents)
+
+# Stage 2 for one record and the keywords in it
+# recordNames has the records already verified in the manifest, the record is added to it
+def verifyRecord(record, recordNames):
+    errorsFound = 0
+
     # Pull the record name out for use throughout
     recordName = record.attrib.get("name")
 
     out.msg("Verifying record %s" % recordName)
     out.setIndent(4)
-    
+
     # --------
     # Make sure we aren't finding a record we haven't already seen
     if (recordName in recordNames):
@@ -731,32 +1201,19 @@ for record in manifest.iter("record"):
         out.error("The record name entry \"%s\" is not 4 characters long" % recordName)
         errorsFound += 1
 
+    if (errorsFound):
+        reportLocation(record, "The record %s" % recordName)
+
     # --------
     # Do very basic checking on the rbinfile if found
     # It is assumed that this file was generated by this tool at an earlier date, so it should be format correct
     # We'll simply ensure it is actually a record that goes with this record name
     if (record.find("rbinfile") != None):
-        # Get the name
-        rbinfile = record.find("rbinfile").text
-
-        # Get the full path to the file given
-        rbinfile = findFile(rbinfile, clInputPath)
-        if (rbinfile == None):
-            out.error("The rbinfile %s could not be found!  Please check your tvpd or input path" % (rbinfile))
-            errorsFound += 1
-            break
-
-        # It does, read it in so we can check the record name
-        out.msg("Reading rbinfile %s" % (rbinfile))
-        rbinfileContents = open(rbinfile, mode='rb').read()
-
-        # --------
-        # Check the record name
-        # This is just the hard coded offset into any record where the contents of the RT keyword would be found
-        if (recordName != rbinfileContents[6:10].decode()):
-            out.error("The record name found %s in %s, does not match the name of the record %s in the tvpd" %
-                      (rbinfileContents[6:10].decode(), rbinfile, recordName))
-            clErrors+=1
+        (rc, rbinfileContents) = checkRbinfile(record.find("rbinfile").text, recordName)
+        errorsFound += rc
+        if (rbinfileContents == None):
+            out.setIndent(2)
+            return errorsFound
 
     # --------
     # For the keyword tags we'll do much more extensive checking
@@ -781,6 +1238,11 @@ for record in manifest.iter("record"):
             else:
                 keywordNames[keywordName] = 1
 
+            # A keyword shared with a base manifest that was already verified doesn't need to be checked again
+            if (verifiedKeywords.get(keyword) == recordName):
+                continue
+            keywordErrors = errorsFound
+
             # --------
             # We'll loop through all the tags found in this keyword and check for all required and any extra ones
             for kw in keyword.iter():
@@ -794,10 +1256,10 @@ for record in manifest.iter("record"):
                     # Save the values we'll need into variables for ease of use
                     if (kw.tag == "kwformat"):
                         kwformat = kw.text.lower() # lower() for ease of compare
-                        
+
                     if (kw.tag == "kwlen"):
                         kwlen = int(kw.text)
-                        
+
                     if (kw.tag == "kwdata"):
                         # If it's mixed format, we want kwdata to actually hold all the xml tags contained in this kwdata
                         # Otherwise, grab the plain text so we can treat it like data later
@@ -809,13 +1271,13 @@ for record in manifest.iter("record"):
                 elif kw.tag in kwdTags:
                     # Ignore the kwdTags for now, we'll check them later
                     next
-                    
+
                 else:
                     # Flag that we found an unsupported tag.  This may help catch typos, etc..
                     out.error("The unsupported tag \"<%s>\" was found in keyword %s in record %s" %
                               (kw.tag, keywordName, recordName))
                     errorsFound += 1
-                
+
             # --------
             # Make sure all the required kwTags were found
             for kw in kwTags:
@@ -854,13 +1316,28 @@ for record in manifest.iter("record"):
 
             # --------
             # If the input format is hex, make sure the input data is hex only
-            if (kwformat == "hex"):
+            # Data from a bin file was converted to hex by stage 1 and is already binary
+            if (kwformat == "hex" and keyword not in keywordModels):
                 (rc, kwdata) = checkHexDataFormat(kwdata)
                 if (rc):
                     out.error("checkHexDataFormat return an error for for keyword %s in record %s" %
                               (keywordName, recordName))
                     errorsFound += 1
 
+            # --------
+            # If the input format is repeat, the data is a hex pattern of whole bytes that is repeated out to the kwlen
+            # Only the pattern is checked, so a large fill costs no more than a small one
+            if (kwformat == "repeat"):
+                (rc, kwdata) = checkHexDataFormat(kwdata if (kwdata != None) else "")
+                if (rc):
+                    out.error("checkHexDataFormat return an error for for keyword %s in record %s" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+                if (len(kwdata) == 0 or (len(kwdata) % 2)):
+                    out.error("The repeat pattern for keyword %s in record %s has to be one or more whole bytes of hex" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+
             # --------
             # If the input format is mixed, loop over the kwdata and verify it is formatted properly
             if (kwformat == "mixed"):
@@ -876,7 +1353,7 @@ for record in manifest.iter("record"):
                   if kwd.tag.lower() in kwdTags:
                      if (kwd.tag.lower() == "ascii"):
                         kwdatalen += len(kwd.text)
-                        
+
                      if (kwd.tag.lower() == "hex"):
                         (rc, kwdata) = checkHexDataFormat(kwd.text)
                         if (rc):
@@ -888,7 +1365,7 @@ for record in manifest.iter("record"):
 
                   elif (kwd.tag.lower() == "kwdata"):
                      next # Ignore this tag at this level
-                        
+
                   else:
                      # Flag that we found an unsupported tag.  This may help catch typos, etc..
                      out.error("The unsupported tag \"<%s>\" was found in kwdata for keyword %s in record %s" %
@@ -909,7 +1386,7 @@ for record in manifest.iter("record"):
                     out.error("The length of the value is longer than the given <kwlen> for keyword %s in record %s" %
                               (keywordName, recordName))
                     errorsFound += 1
-            elif (kwformat == "hex"):
+            elif (kwformat == "hex" or kwformat == "repeat"):
                 # Convert hex nibbles to bytes for len compare
                 if ((len(kwdata)/2) > kwlen):
                     out.error("The length of the value is longer than the given <kwlen> for keyword %s in record %s" %
@@ -923,184 +1400,29 @@ for record in manifest.iter("record"):
                           (kwformat, keywordName, recordName))
                 errorsFound += 1
 
+            if (errorsFound == keywordErrors):
+                verifiedKeywords[keyword] = recordName
+            else:
+                reportLocation(keyword, "The keyword %s in record %s" % (keywordName, recordName))
+
     # Done with the record, reset the output
     out.setIndent(2)
 
-# All done with error checks, bailout if we hit something
-if (errorsFound):
-    out.msg("")
-    out.error("%d error%s found in the tvpd data.  Please review the above errors and correct them." %
-              (errorsFound, "s" if (errorsFound > 1) else ""))
-    tvpdFileName = os.path.join(clOutputPath, vpdName + "-err.tvpd")
-    rc = writeXml(manifest, tvpdFileName)
-    if (rc):
-        exit(rc)
-    out.msg("Wrote tvpd file to help in debug: %s" % tvpdFileName)
-    exit(errorsFound)
-
-# We now have a correct tvpd, use it to create a binary VPD image
-out.setIndent(0)
-out.msg("==== Stage 3: Creating VPD output files")
-out.setIndent(2)
-# Create our output file names
-if (clRecordMode):
-    tvpdFileName = os.path.join(clOutputPath, vpdName)
-else:
-    tvpdFileName = os.path.join(clOutputPath, vpdName + ".tvpd")
-    vpdFileName = os.path.join(clOutputPath, vpdName + ".vpd")
-
-# This is our easy one, write the XML back out
-# Write out the full template vpd representing the data contained in our image
-rc = writeXml(manifest, tvpdFileName)
-if (rc):
-    exit(rc)
-out.msg("Wrote tvpd file: %s" % tvpdFileName)
-
-# In record only mode we don't want to write the binary file, so we bail from the program here
-if (clRecordMode):
-    exit(errorsFound)
-
-# Now the hard part, write out the binary file
-# Open up our file to write
-vpdFile = open(vpdFileName, "wb")
-
-# Process for creating the binary file
-# There are 2 ways the file could be created
-# 1 - write the data to file on disk as the records are created
-# 2 - write the data to memory and then write the complete image at the end
-# Option 2 was selected for a few reasons
-# - This isn't a large amount of data where flushing to disk as we went along would help performance
-# - When the TOC entries are created, we don't know the offset/length to provide.  This has to be updated later
-#   By keeping the records in memory, it's marginally easier to update the TOC info since you don't have to manage file position
-# - While ECC isn't supported now, if it is needed in the future, the entire record will be available in memory for the algoritm
-#   If writing to the file was done, the data would have to be read back and sent to the ECC algorithm
-#
-# The rest of this process is pretty straight forward.  There are some helper functions implemented at the top of the file
-# The most difficult piece is tracking the total image size and managing the TOC offset locations so they can be later updated
-
-# Our dictionary of all the records we've created in memory, along with info like TOC offsets
-recordInfo = dict()
-# Track total image size as the various records are created
-imageSize = 0
-
-# The VHDR and VTOC are created by the tool based upon the info in the tvpd
-# The rest of the records are derived from the tvpd
-
-################################################
-# Create VHDR
-recordName = "VHDR"
-recordInfo[recordName] = RecordInfo()
-
-# Create the ECC block
-recordInfo[recordName].record += bytearray(bytearray.fromhex("0000000000000000000000"))
-
-# Create the Large Resource Tag
-recordInfo[recordName].record += bytearray(bytearray.fromhex("84"))
-
-# Create the Record Length
-recordInfo[recordName].record += struct.pack('<H', 40) # VHDR is always 40
-
-# Create the RT keyword
-recordInfo[recordName].record += packKeyword("RT", 4, recordName, "ascii")
-
-# Create the VD keyword
-version = manifest.find("VD").text
-recordInfo[recordName].record += packKeyword("VD", 2, version, "hex")
-
-# Create the PT keyword
-# Since we are creating a TOC entry here, we'll need to create the RecordInfo for the record it will be pointing to
-# This will allow us to store the TOC offsets and update them later when the record gets created
-recordInfo["VTOC"] = RecordInfo()
-recordInfo["VTOC"].tocName = "VHDR"
-# The tocOffset starts where the data in the PT keyword starts
-tocOffset = len(recordInfo[recordName].record) + 3 # PT (2) + Length (1)
-tocOffset += 6 # Record Name (4) + Record Type (2)
-recordInfo["VTOC"].tocRecordOffset = tocOffset
-tocOffset += 2
-recordInfo["VTOC"].tocRecordLength = tocOffset
-tocOffset += 2
-recordInfo["VTOC"].tocEccOffset = tocOffset
-tocOffset += 2
-recordInfo["VTOC"].tocEccLength = tocOffset
-tocOffset += 2
-recordInfo[recordName].record += packKeyword("PT", 14, "VTOC", "ascii")
-
-# Create the PF keyword
-# This PF is fixed at 8 since the VHDR is always 44 long.
-recordInfo[recordName].record += packKeyword("PF", 8, "0", "hex")
-# Create the Small Resource Tag
-recordInfo[recordName].record += bytearray(bytearray.fromhex("78"))
-
-# Update our total image size
-imageSize += len(recordInfo[recordName].record)
-
-################################################
-# Create VTOC
-recordName = "VTOC"
-# No need to create the VTOC recordInfo entry since it was done by the VHDR
-
-# Create the Large Resource Tag
-recordInfo[recordName].record += bytearray(bytearray.fromhex("84"))
-# Create the Record Length
-# We will come back and update this at the end
-recordInfo[recordName].record += bytearray(bytearray.fromhex("0000"))
-# Create the RT keyword
-recordInfo[recordName].record += packKeyword("RT", 4, recordName, "ascii")
-
-# Create the PT keyword
-# We need to create all the data that will go into the PT keyword.  We'll create a big ascii string by looping over all the records
-PTData = ""
-# We'll also use the loop to create all our recordInfos and store the TOC offsets
-# The tocOffset starts where the data in the PT keyword starts
-tocOffset = len(recordInfo[recordName].record) + 3 # PT (2) + Length (1)
-
-# The VTOC has the pointers to all the records described in the tvpd
-for record in manifest.iter("record"):
-    loopRecordName = record.attrib.get("name")
-    PTData += loopRecordName + "\0\0\0\0\0\0\0\0\0\0" # The name, plus 10 empty bytes to be updated later
-
-    # Since we are creating a TOC entry here, we'll need to create the RecordInfo for the records it will be pointing to
-    # This will allow us to store the TOC offsets and update them later when the record gets created
-    recordInfo[loopRecordName] = RecordInfo()
-    recordInfo[loopRecordName].tocName = recordName
-    tocOffset += 6 # Record Name (4) + Record Type (2)
-    recordInfo[loopRecordName].tocRecordOffset = tocOffset
-    tocOffset += 2
-    recordInfo[loopRecordName].tocRecordLength = tocOffset
-    tocOffset += 2
-    recordInfo[loopRecordName].tocEccOffset = tocOffset
-    tocOffset += 2
-    recordInfo[loopRecordName].tocEccLength = tocOffset
-    tocOffset += 2
-recordInfo[recordName].record += packKeyword("PT", len(PTData), PTData, "ascii")
-
-# Create the PF keyword
-padfillSize = calcPadFill(recordInfo[recordName].record)
-recordInfo[recordName].record += packKeyword("PF", padfillSize, "0", "hex")
-
-# Create the Small Resource Tag
-recordInfo[recordName].record += bytearray(bytearray.fromhex("78"))
-
-# Update the record length
-# Total length minus 4, LR(1), SR(1), Length (2)
-recordLength = len(recordInfo[recordName].record) - 4
-recordInfo[recordName].record[1:3] = struct.pack('<H', recordLength)
-
-# Go back and update all our TOC info now that the record is created
-tocName = recordInfo[recordName].tocName
-# Image size hasn't been updated since the end of the last record, so it points to the start of our new record
-tocRecordOffset = recordInfo[recordName].tocRecordOffset
-recordInfo[tocName].record[tocRecordOffset:(tocRecordOffset + 2)] = struct.pack('<H', imageSize)
-# The record is complete, so we can just use the length
-tocRecordLength = recordInfo[recordName].tocRecordLength
-recordInfo[tocName].record[tocRecordLength:(tocRecordLength + 2)] = struct.pack('<H', len(recordInfo[recordName].record))
-
-# Update our total image size
-imageSize += len(recordInfo[recordName].record)
-
-################################################
-# Create the remaining records from the tvpd
-for record in manifest.iter("record"):
+    return errorsFound
+
+# Convert the verified manifest into the in memory model of the image
+# This is the only place the binary image needs to look at the xml
+def manifestToImage(manifest, vpdName = None):
+    vpdImage = vpdmodel.VpdImage(vpdName, keywordData(2, manifest.find("VD").text, "hex"))
+
+    # The records in the order the user gave
+    for record in manifest.iter("record"):
+        vpdImage.records.append(recordToModel(record))
+
+    return vpdImage
+
+# Convert one verified <record> into its record in the image model
+def recordToModel(record):
     recordName = record.attrib.get("name")
 
     # Figure out if we need to create an image from keywords, or just stick a record binary in place
@@ -1111,23 +1433,19 @@ for record in manifest.iter("record"):
         rbinfile = findFile(record.find("rbinfile").text, clInputPath)
 
         # Open the file and stick it into the record
-        recordInfo[recordName].record = open(rbinfile, mode='rb').read()
-
-    # Create the record image from the xml description
-    else:
-
-        # The large resource tag
-        recordInfo[recordName].record += bytearray(bytearray.fromhex("84"))
+        return vpdmodel.Record(recordName, raw=open(rbinfile, mode='rb').read())
 
-        # The record length, we will come back and update this at the end
-        recordInfo[recordName].record += bytearray(bytearray.fromhex("0000"))
+    # Create the record from the xml description
+    newRecord = vpdmodel.Record(recordName)
+    for keyword in record.iter("keyword"):
+        keywordName = keyword.attrib.get("name")
+        kwformat = keyword.find("kwformat").text
 
-        # The keywords
-        for keyword in record.iter("keyword"):
-            keywordName = keyword.attrib.get("name")
+        # Keywords shared with a base manifest already have their binary data
+        data = keywordModels.get(keyword)
+        if (data == None):
             kwlen = int(keyword.find("kwlen").text)
             kwdata = keyword.find("kwdata").text
-            kwformat = keyword.find("kwformat").text
 
             # If the input format is mixed, we need to concat the data together before packing
             # We'll force all the data to hex and tell it to pack as hex
@@ -1137,128 +1455,1588 @@ for record in manifest.iter("record"):
                     if (kwd.tag == "hex"):
                         kwdata += kwd.text
                     if (kwd.tag == "ascii"):
-                        kwdata += kwd.text.encode("hex")
-                kwformat = "hex"
-
-            keywordPack = packKeyword(keywordName,  kwlen, kwdata, kwformat)
-            recordInfo[recordName].record += keywordPack
-            # If the user wanted discrete binary files for each keyword writen out, we'll do it here
-            if (clBinaryKeywords):
-                kvpdFileName = os.path.join(clOutputPath, vpdName + "-" + recordName + "-" + keywordName + ".kvpd")
-                out.msg("Wrote record %s keyword %s kvpd file: %s" % (recordName, keywordName, kvpdFileName))
-                kvpdFile = open(kvpdFileName, "wb")
-                kvpdFile.write(keywordPack)
-                kvpdFile.close()
-
-        # Calculate the padfill required
-        padfillSize = calcPadFill(recordInfo[recordName].record)
-
-        # Write the PF keyword
-        keywordPack = packKeyword("PF", padfillSize, "0", "hex")
-        recordInfo[recordName].record += keywordPack
-
-        # The small resource tag
-        recordInfo[recordName].record += bytearray(bytearray.fromhex("78"))
-
-        # Update the record length
-        # Total length minus 4, LR(1), SR(1), Length (2)
-        recordLength = len(recordInfo[recordName].record) - 4
-        recordInfo[recordName].record[1:3] = struct.pack('<H', recordLength)
-
-    # Go back and update all our TOC info now that the record is created
-    tocName = recordInfo[recordName].tocName
-    # Image size hasn't been updated since the end of the last record, so it points to the start of our new record
-    tocRecordOffset = recordInfo[recordName].tocRecordOffset
-    recordInfo[tocName].record[tocRecordOffset:(tocRecordOffset + 2)] = struct.pack('<H', imageSize)
-    # The record is complete, so we can just use the length
-    tocRecordLength = recordInfo[recordName].tocRecordLength
-    recordInfo[tocName].record[tocRecordLength:(tocRecordLength + 2)] = struct.pack('<H', len(recordInfo[recordName].record))
-
-    # Update our total image size
-    imageSize += len(recordInfo[recordName].record)
-
-################################################
-# Create the ECC data areas and update TOC offsets
-
-# VHDR has it's ECC in a special location at the start of the file
-
-recordName = "VTOC"
-# Not supported at present, so allocate the space, zero it out
-recordInfo[recordName].ecc = bytearray(("\0" * (int(len(recordInfo[recordName].record) / 4))).encode())
-# Go back and update all our TOC info now that the ecc is created
-tocName = recordInfo[recordName].tocName
-# Image size hasn't been updated since the end of the last record, so it points to the start of our new record
-tocEccOffset = recordInfo[recordName].tocEccOffset
-recordInfo[tocName].record[tocEccOffset:(tocEccOffset + 2)] = struct.pack('<H', imageSize)
-# The record is complete, so we can just use the length
-tocEccLength = recordInfo[recordName].tocEccLength
-recordInfo[tocName].record[tocEccLength:(tocEccLength + 2)] = struct.pack('<H', len(recordInfo[recordName].ecc))
-
-# Update our total image size
-imageSize += len(recordInfo[recordName].ecc)
-
-# Create the ECC for the TVPD records
-for record in manifest.iter("record"):
-    recordName = record.attrib.get("name")
-    # Not supported at present, so allocate the space, zero it out
-    recordInfo[recordName].ecc = bytearray(("\0" * (int(len(recordInfo[recordName].record) / 4))).encode())
-    # Go back and update all our TOC info now that the ecc is created
-    tocName = recordInfo[recordName].tocName
-    # Image size hasn't been updated since the end of the last record, so it points to the start of our new record
-    tocEccOffset = recordInfo[recordName].tocEccOffset
-    recordInfo[tocName].record[tocEccOffset:(tocEccOffset + 2)] = struct.pack('<H', imageSize)
-    # The record is complete, so we can just use the length
-    tocEccLength = recordInfo[recordName].tocEccLength
-    recordInfo[tocName].record[tocEccLength:(tocEccLength + 2)] = struct.pack('<H', len(recordInfo[recordName].ecc))
-
-    # Update our total image size
-    imageSize += len(recordInfo[recordName].ecc)
-
-
-################################################
-# Write the VPD 
-# Everything for the image is now in memory!
-# I'm intentionally writing the file by doing VHDR, VTOC and then looping over the tvpd records
-# The file needs to be written in the order the user gave, looping over the dictionary keys would not guarantee that
-
-# Write the top records
-writeDataToVPD(vpdFile, recordInfo["VHDR"].record)
-writeDataToVPD(vpdFile, recordInfo["VTOC"].record)
-
-# Write all the tvpd records
-for record in manifest.iter("record"):
-    recordName = record.attrib.get("name")
-    writeDataToVPD(vpdFile, recordInfo[recordName].record)
-    # If the user wanted discrete binary files for each record writen out, we'll do it here
-    if (clBinaryRecords):
-        rvpdFileName = os.path.join(clOutputPath, vpdName + "-" + recordName + ".rvpd")
-        out.msg("Wrote %s record rvpd file: %s" % (recordName, rvpdFileName))
-        rvpdFile = open(rvpdFileName, "wb")
-        rvpdFile.write(recordInfo[recordName].record)
-        rvpdFile.close()
+                        kwdata += binascii.hexlify(kwd.text.encode()).decode()
 
-# Write the VTOC ECC
-writeDataToVPD(vpdFile, recordInfo["VTOC"].ecc)
+            data = keywordData(kwlen, kwdata, "hex" if (kwformat == "mixed") else kwformat)
+            keywordModels[keyword] = data
 
-# Write all the tvpd record ecc
-for record in manifest.iter("record"):
-    recordName = record.attrib.get("name")
-    writeDataToVPD(vpdFile, recordInfo[recordName].ecc)
-
-# Done with the file
-vpdFile.close()
-out.msg("Wrote vpd file: %s" % vpdFileName)
-
-# Check if the image size is larger than the maxSizeBytes
-if (imageSize > maxSizeBytes):
-    out.error("The generated binary image (%s) is too large for the size given (%s)" % (imageSize, maxSizeBytes))
-    errorsFound += 1
-    
-# Catch the errors
-if (errorsFound):
-    out.msg("")
-    out.error("%d error%s found while creating the binary image.  Please review the above errors and correct them." %
-              (errorsFound, "s" if (errorsFound > 1) else ""))
-    
-# Return the number of errors found as the return code
-exit(errorsFound)
+        newRecord.keywords.append(vpdmodel.Keyword(keywordName, data, kwformat))
+
+    return newRecord
+
+# Check a created image by reading it back and comparing it to the image model it was created from
+# This checks the VHDR/VTOC, the record and ecc offsets, the LR/SR tags, the PF padding and the data of every keyword
+def verifyImage(image, vpdImage):
+    errorsFound = 0
+
+    for error in vpdmodel.verifyImage(image, vpdImage):
+        out.error(error)
+        errorsFound += 1
+
+    if (not errorsFound):
+        out.msg("Verified vpd image: %d records, %d keywords" %
+                (len(vpdImage.records), sum(len(record.keywords) for record in vpdImage.records)))
+
+    return errorsFound
+
+# Stage 3 - Create the binary VPD image in memory from the verified manifest
+# overrides is an optional dictionary of keyword data to use in place of the manifest kwdata, see checkOverrides
+# Returns the complete image along with the image model, which has the offsets of every record and keyword
+def createImage(manifest, overrides = None, vpdName = None):
+    errorsFound = 0
+
+    # Process for creating the binary file
+    # There are 2 ways the file could be created
+    # 1 - write the data to file on disk as the records are created
+    # 2 - write the data to memory and then write the complete image at the end
+    # Option 2 was selected for a few reasons
+    # - This isn't a large amount of data where flushing to disk as we went along would help performance
+    # - When the TOC entries are created, we don't know the offset/length to provide.  This has to be updated later
+    #   By keeping the records in memory, it's marginally easier to update the TOC info since you don't have to manage file position
+    # - While ECC isn't supported now, if it is needed in the future, the entire record will be available in memory for the algoritm
+    #   If writing to the file was done, the data would have to be read back and sent to the ECC algorithm
+    #
+    # The packing itself is done by the VpdImage model in pymod/vpdmodel.py
+    vpdImage = manifestToImage(manifest, vpdName)
+
+    if (overrides):
+        errorsFound += checkOverrides(vpdImage, overrides)
+        if (errorsFound):
+            return (errorsFound, None, vpdImage)
+        vpdImage = applyOverrides(vpdImage, overrides)
+
+    image = packImage(vpdImage)
+
+    return (errorsFound, image, vpdImage)
+
+# Pack an image with its records in manifest order, or laid out for the accesses given with --access-file
+# The layout only changes where the records are, the VTOC points to them wherever they go
+def packImage(vpdImage):
+    if (clAccesses == None):
+        return vpdImage.pack()
+    (vpdImage.records, aligned) = vpddevice.layoutRecords(vpdImage.records, clAccesses)
+    return vpdImage.pack(clPageSize, aligned)
+
+# Print where the bytes of a packed image go, a line for each record, and how much of the <size> given is left
+# The TOC entry of each record is counted with the record, since it goes away with it
+def reportSpace(vpdName, vpdImage, maxSizeBytes):
+    (rows, gaps) = vpdmodel.imageSpace(vpdImage)
+
+    out.msg("Space used in %s.vpd, in bytes:" % vpdName)
+    out.setIndent(4)
+    line = "%-6s %7s %7s %7s %7s %7s %7s %7s"
+    out.msg(line % ("Record", "Data", "Names", "PF", "LR/SR", "ECC", "TOC", "Total"))
+    for row in rows:
+        out.msg(line % (row + (sum(row[1:]),)))
+    totals = tuple(sum(row[column] for row in rows) for column in range(1, 7))
+    out.msg(line % (("Total",) + totals + (sum(totals),)))
+    if (gaps):
+        out.msg("%d bytes are left between records to page align them" % gaps)
+
+    left = maxSizeBytes - vpdImage.size
+    used = (vpdImage.size * 100.0 / maxSizeBytes) if (maxSizeBytes) else 100.0
+    if (left >= 0):
+        out.msg("%d of the %d bytes given by <size> used (%.1f%%), %d left" % (vpdImage.size, maxSizeBytes, used, left))
+    else:
+        out.msg("%d of the %d bytes given by <size> used (%.1f%%), %d over" % (vpdImage.size, maxSizeBytes, used, -left))
+    out.setIndent(2)
+
+# Stage 3 for --report, the image is laid out in memory and the space it uses reported instead of writing anything
+# Returns the errors found, an image that is too big for its size is still an error
+def reportImage(manifestFile, vpdName, vpdImage, maxSizeBytes):
+    out.setIndent(0)
+    out.msg("==== Stage 3: Reporting the VPD image space")
+    out.setIndent(2)
+
+    reportSpace(vpdName, vpdImage, maxSizeBytes)
+    spaceReports.append((manifestFile, vpdImage.size, maxSizeBytes))
+    errorsFound = checkImageSize(vpdImage.size, maxSizeBytes)
+
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found while creating the binary image.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+
+    return errorsFound
+
+
+# Check the image created in Stage 3 and write it, along with the record and keyword files asked for
+# Returns the errors found
+def writeImage(bundle, vpdName, image, vpdImage, maxSizeBytes):
+    errorsFound = 0
+
+    # Read the image back in place and check it against what the tvpd said should be in it
+    if (clVerify):
+        errorsFound += verifyImage(image, vpdImage)
+
+    # Check the image fits, an image too big for its part can't be used
+    # What takes up the space is shown instead so it's clear what to cut
+    sizeErrors = checkImageSize(len(image), maxSizeBytes)
+    if (sizeErrors):
+        reportSpace(vpdName, vpdImage, maxSizeBytes)
+    errorsFound += sizeErrors
+
+    # An image that failed either check is never written, a bad image left in the output could still get flashed
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found while creating the binary image.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        return errorsFound
+
+    # The record and keyword files are pulled right out of the image using the offsets set when it was packed
+    imageView = memoryview(image)
+
+    # If the user wanted discrete binary files for each keyword writen out, we'll do it here
+    if (clBinaryKeywords):
+        for record in vpdImage.records:
+            for keyword in record.keywords:
+                (rc, kvpdFileName) = writeOutput(bundle, clOutputPath, vpdName + "-" + record.name + "-" + keyword.name + ".kvpd",
+                                                 imageView[keyword.offset:(keyword.offset + keyword.packedSize())])
+                reportOutput("record %s keyword %s kvpd file" % (record.name, keyword.name), kvpdFileName)
+
+    ################################################
+    # Write the VPD
+    (rc, vpdFileName) = writeOutput(bundle, clOutputPath, vpdName + ".vpd", image)
+
+    # If the user wanted discrete binary files for each record writen out, we'll do it here
+    if (clBinaryRecords):
+        for record in vpdImage.records:
+            (rc, rvpdFileName) = writeOutput(bundle, clOutputPath, vpdName + "-" + record.name + ".rvpd",
+                                             imageView[record.offset:(record.offset + record.length)])
+            reportOutput("%s record rvpd file" % record.name, rvpdFileName)
+
+    reportOutput("vpd file", vpdFileName)
+
+    return errorsFound
+
+# Parses a json template file.  The json parser will generate errors for bad json syntax
+# Actual checking/validation of the template contents will be done elsewhere, the same as for the xml
+def parseJson(jsonFile):
+    # Get the full path to the file given
+    fullPathFile = findFile(jsonFile, clInputPath)
+    if (fullPathFile == None):
+        out.error("The json file %s could not be found!" % (jsonFile))
+        return (1, None)
+
+    # Let the user know what file we are reading
+    out.msg("Parsing file %s" % fullPathFile)
+
+    try:
+        template = vpdjson.load(fullPathFile)
+    except ValueError as e:
+        out.error("Unable to parse %s!" % fullPathFile)
+        out.error("Check your file for basic JSON formatting issues")
+        out.error("Python Exception: %s" % e)
+        return (1, None)
+
+    return (0, template)
+
+# Check that an object in a json template only has the keys allowed at its level
+# where names the object in the error messages
+def checkJsonKeys(item, allowed, where):
+    errorsFound = 0
+
+    if (not isinstance(item, dict)):
+        out.error("Expected an object for %s, but found %s" % (where, type(item).__name__))
+        return 1
+
+    for key in item:
+        if (key not in allowed):
+            out.error("Unsupported key \"%s\" found in %s" % (key, where))
+            errorsFound += 1
+
+    return errorsFound
+
+# Check the top level of a json template to make sure the required keys are found
+def checkJsonVpd(template):
+    errorsFound = checkJsonKeys(template, vpdjson.VPD_KEYS, "the top level of the template")
+
+    # These keys are not required in record only mode
+    if (not clRecordMode):
+        for key in ["name", "size", "VD"]:
+            if (not isinstance(template.get(key), basestring)):
+                out.error("The key \"%s\" is required as a string at the top level of the template" % key)
+                errorsFound += 1
+
+    # Make sure at least one record was given, and in record only mode only one
+    records = template.get("records")
+    if (not isinstance(records, list) or len(records) == 0):
+        out.error("At least one record must be defined in \"records\" for the file to be valid!")
+        errorsFound += 1
+    elif (clRecordMode and len(records) != 1):
+        out.error("Only one record definition per file is supported in record mode")
+        out.error("The number of record definitions found in your file: %d" % len(records))
+        errorsFound += 1
+
+    return errorsFound
+
+# Check a record object in a json template to make sure the required keys are found
+def checkJsonRecord(record):
+    errorsFound = 0
+
+    # Make sure the record has a name, save for later use
+    recordName = record.get("name") if (isinstance(record, dict)) else None
+    if (not isinstance(recordName, basestring)):
+        out.error("A record is missing the name")
+        errorsFound += 1
+        recordName = "INVALID" # Set the invalid name so the code below can use it without issue
+
+    errorsFound += checkJsonKeys(record, vpdjson.RECORD_KEYS, "record %s" % recordName)
+    if (not isinstance(record, dict)):
+        return (errorsFound, recordName)
+
+    # keywords, rbinfile and rtvpdfile are mutually exclusive, make sure we have exactly one
+    recordKeyTotal = len([key for key in ["keywords", "rbinfile", "rtvpdfile"] if (key in record)])
+    if (recordKeyTotal != 1):
+        out.error("For record %s, %d keys of keywords, rbinfile or rtvpdfile were given!" % (recordName, recordKeyTotal))
+        out.error("1 key of the 3 must be in use for the record to be valid!")
+        errorsFound += 1
+
+    if ("keywords" in record):
+        if (not isinstance(record["keywords"], list)):
+            out.error("The keywords for record %s have to be a list" % recordName)
+            errorsFound += 1
+        if (not isinstance(record.get("rdesc"), basestring)):
+            out.error("The key \"rdesc\" is required as a string for record %s" % recordName)
+            errorsFound += 1
+    for key in ["rtvpdfile", "rbinfile"]:
+        if (key in record and not isinstance(record[key], basestring)):
+            out.error("The key \"%s\" has to be a string for record %s" % (key, recordName))
+            errorsFound += 1
+
+    return (errorsFound, recordName)
+
+# Check a keyword object in a json template to make sure the required keys are found
+def checkJsonKeyword(keyword, recordName):
+    errorsFound = 0
+
+    # Make sure the keyword has a name, save for later use
+    keywordName = keyword.get("name") if (isinstance(keyword, dict)) else None
+    if (not isinstance(keywordName, basestring)):
+        out.error("A keyword in record %s is missing the name" % (recordName))
+        errorsFound += 1
+        keywordName = "INVALID" # Set the invalid name so the code below can use it without issue
+
+    errorsFound += checkJsonKeys(keyword, vpdjson.KEYWORD_KEYS, "keyword %s in record %s" % (keywordName, recordName))
+    if (not isinstance(keyword, dict)):
+        return (errorsFound, keywordName)
+
+    # A ktvpdfile is the whole keyword, nothing else can be given with it
+    if ("ktvpdfile" in keyword):
+        for key in keyword:
+            if (key not in ["name", "ktvpdfile"]):
+                out.error("The key \"%s\" can't be given along with ktvpdfile for keyword %s in record %s" % (key, keywordName, recordName))
+                errorsFound += 1
+        if (not isinstance(keyword["ktvpdfile"], basestring)):
+            out.error("The key \"ktvpdfile\" has to be a string for keyword %s in record %s" % (keywordName, recordName))
+            errorsFound += 1
+        return (errorsFound, keywordName)
+
+    for key in ["kwdesc", "kwformat", "kwlen", "kwdata"]:
+        if (key not in keyword):
+            out.error("Required key \"%s\" was not found in keyword %s in record %s" % (key, keywordName, recordName))
+            errorsFound += 1
+    for key in ["offset", "length"]:
+        if (key in keyword and keyword.get("kwformat") != "bin"):
+            out.error("The key \"%s\" is only used with the bin kwformat for keyword %s in record %s" % (key, keywordName, recordName))
+            errorsFound += 1
+
+    return (errorsFound, keywordName)
+
+# Check a record object in a json template and read in the rtvpdfile, ktvpdfile or bin files it references
+# Returns the record with everything merged in, which is the record given unless it was a rtvpdfile
+def loadJsonRecord(record):
+    (errorsFound, recordName) = checkJsonRecord(record)
+    if (not isinstance(record, dict)):
+        return (errorsFound, record)
+
+    # See if a rtvpdfile was given and if so, load it in
+    newRecord = record
+    if (isinstance(record.get("rtvpdfile"), basestring)):
+        (rc, newRecord) = parseJson(record["rtvpdfile"])
+        if (rc):
+            out.error("The rtvpdfile given could not be found.")
+            return (errorsFound + 1, record)
+
+        # The file can also be a whole template with just the one record in it
+        if (isinstance(newRecord, dict) and isinstance(newRecord.get("records"), list) and len(newRecord["records"]) == 1):
+            newRecord = newRecord["records"][0]
+
+        # --------
+        # Check the contents read in from the rtvpdfile
+        (rc, newRecordName) = checkJsonRecord(newRecord)
+        errorsFound += rc
+
+        # --------
+        # Make sure the record found in rtvpdfile is the same as the record in the manifiest
+        if (newRecordName != recordName):
+            out.error("The record (%s) found in %s doesn't match the record name in the manifest (%s)" %
+                      (newRecordName, record["rtvpdfile"], recordName))
+            return (errorsFound + 1, record)
+        if ("rtvpdfile" in newRecord):
+            out.error("The rtvpdfile %s for record %s can't give another rtvpdfile" % (record["rtvpdfile"], recordName))
+            return (errorsFound + 1, record)
+
+    # Done handling the record level
+    # We can now loop through the keywords in the records and check them
+    keywords = newRecord.get("keywords")
+    if (not isinstance(keywords, list)):
+        return (errorsFound, newRecord)
+
+    for (index, keyword) in enumerate(keywords):
+        (rc, keywordName) = checkJsonKeyword(keyword, recordName)
+        errorsFound += rc
+        if (not isinstance(keyword, dict)):
+            continue
+
+        # See if a ktvpdfile was given and if so, load it in
+        if (isinstance(keyword.get("ktvpdfile"), basestring)):
+            (rc, newKeyword) = parseJson(keyword["ktvpdfile"])
+            if (rc):
+                out.error("The ktvpdfile given could not be found.")
+                errorsFound += 1
+                continue
+
+            # --------
+            # Check the contents read in from the ktvpdfile
+            (rc, newKeywordName) = checkJsonKeyword(newKeyword, recordName)
+            errorsFound += rc
+
+            # --------
+            # Make sure the keyword found in ktvpdfile is the same as the keyword in the manifiest
+            if (newKeywordName != keywordName):
+                out.error("The keyword (%s) found in %s doesn't match the keyword name in the manifest (%s)" %
+                          (newKeywordName, keyword["ktvpdfile"], keywordName))
+                errorsFound += 1
+                continue
+            if ("ktvpdfile" in newKeyword):
+                out.error("The ktvpdfile %s for keyword %s in record %s can't give another ktvpdfile" %
+                          (keyword["ktvpdfile"], keywordName, recordName))
+                errorsFound += 1
+                continue
+
+            keywords[index] = keyword = newKeyword
+
+        # See if the kwformat is a binary file ("bin")
+        # If it is, load it in and turn it into a hex data keyword for the rest of the run
+        # This is necessary so when the output template is written, we write out the actual data instead of a reference to the file
+        if (keyword.get("kwformat") == "bin" and isinstance(keyword.get("kwdata"), basestring)):
+            (rc, kwdata, offset) = readBinData(keyword["kwdata"], keyword.get("offset"), keyword.get("length"), keywordName, recordName)
+            if (rc):
+                errorsFound += rc
+                continue
+            keyword["kwformat"] = "hex"
+            keyword["kwdata"] = binascii.hexlify(kwdata).decode()
+            keyword.pop("offset", None)
+            keyword.pop("length", None)
+
+    return (errorsFound, newRecord)
+
+# Stage 1 for a json template - Read in the template and any other referenced files
+# Returns the template with all rtvpdfile, ktvpdfile and bin references merged in
+def loadJsonManifest(manifestFile):
+    # Start a new list of the files read in to create this manifest
+    del inputFiles[:]
+
+    # Read in the top level template
+    # If this parse gets an error, it's a hard stop since the rest of the code would do nothing
+    (rc, template) = parseJson(manifestFile)
+    if (rc):
+        return (rc, None)
+    if (not isinstance(template, dict)):
+        out.error("%s does not have an object at the top level.  No further checking will be done until fixed!" % manifestFile)
+        return (1, None)
+
+    # Accumulate errors and return the total at the end
+    # This allows the user to see all mistakes at once instead of iteratively running
+    errorsFound = checkJsonVpd(template)
+
+    # Put the records from any rtvpdfile in place of the ones that reference them
+    records = template.get("records")
+    if (isinstance(records, list)):
+        for (index, record) in enumerate(records):
+            (rc, records[index]) = loadJsonRecord(record)
+            errorsFound += rc
+
+    return (errorsFound, template)
+
+# Stage 2 and the model for a json template - Make sure the data in the template is valid
+# There is no xml to look at again in stage 3, so the image model is created as each keyword is checked
+# Returns the name to use for the output files, the max size of the image and the image model
+def verifyJsonManifest(template, manifestFile):
+    errorsFound = 0
+
+    # The name, size and VD the same as verifyVpd does them
+    maxSizeBytes = None
+    version = b"\x00\x00"
+    if (not clRecordMode):
+        vpdName = template["name"]
+        # If the user passed in the special name of FILENAME, we'll use in the input file name, minus the extension, as the output
+        if (vpdName == "FILENAME"):
+            vpdName = os.path.splitext(os.path.basename(manifestFile))[0]
+
+        (rc, maxSizeBytes) = checkSize(template["size"])
+        errorsFound += rc
+
+        (rc, vd) = checkHexDataFormat(template["VD"])
+        if (rc or len(vd) > 4):
+            out.error("The VD \"%s\" has to be 2 bytes of hex or less" % template["VD"])
+            errorsFound += 1
+        else:
+            version = keywordData(2, vd, "hex")
+    else:
+        vpdName = os.path.basename(manifestFile)
+
+    vpdImage = vpdmodel.VpdImage(vpdName, version)
+
+    # Keep a dictionary of the record names we come across, will let us find duplicates
+    recordNames = dict()
+    for record in template["records"]:
+        (rc, newRecord) = verifyJsonRecord(record, recordNames)
+        errorsFound += rc
+        vpdImage.records.append(newRecord)
+
+    return (errorsFound, vpdName, maxSizeBytes, vpdImage)
+
+# Stage 2 for one record object in a json template and the keywords in it
+# recordNames has the records already verified in the template, the record is added to it
+# Returns the errors found and the record in the image model
+def verifyJsonRecord(record, recordNames):
+    errorsFound = 0
+
+    # Pull the record name out for use throughout
+    recordName = record["name"]
+
+    out.msg("Verifying record %s" % recordName)
+    out.setIndent(4)
+
+    # --------
+    # Make sure we aren't finding a record we haven't already seen
+    if (recordName in recordNames):
+        out.error("The record \"%s\" has previously been defined in the template" % recordName)
+        errorsFound += 1
+    else:
+        recordNames[recordName] = 1
+
+    # --------
+    # Make sure the record name is 4 charaters long
+    if (len(recordName) != 4):
+        out.error("The record name entry \"%s\" is not 4 characters long" % recordName)
+        errorsFound += 1
+
+    # --------
+    # A rbinfile is put in the image as is, after a basic check it goes with this record
+    if ("rbinfile" in record):
+        (rc, rbinfileContents) = checkRbinfile(record["rbinfile"], recordName)
+        errorsFound += rc
+        out.setIndent(2)
+        return (errorsFound, vpdmodel.Record(recordName, raw=rbinfileContents))
+
+    # --------
+    # Check each keyword and create it in the model
+    newRecord = vpdmodel.Record(recordName)
+    # Track the keywords we come across so we can find duplicate
+    keywordNames = dict()
+    for keyword in record["keywords"]:
+        keywordName = keyword["name"]
+
+        # --------
+        # Make sure we aren't finding a keyword we haven't already seen
+        if (keywordName in keywordNames):
+            out.error("The keyword \"%s\" has previously been defined in record %s" % (keywordName, recordName))
+            errorsFound += 1
+        else:
+            keywordNames[keywordName] = 1
+
+        (rc, data) = verifyJsonKeyword(keyword, recordName)
+        errorsFound += rc
+        if (data != None):
+            newRecord.keywords.append(vpdmodel.Keyword(keywordName, data, keyword["kwformat"].lower()))
+
+    # Done with the record, reset the output
+    out.setIndent(2)
+
+    return (errorsFound, newRecord)
+
+# Stage 2 for one keyword object in a json template
+# Returns the errors found and the binary data of the keyword, None if there were errors
+def verifyJsonKeyword(keyword, recordName):
+    errorsFound = 0
+
+    keywordName = keyword["name"]
+    kwformat = keyword["kwformat"]
+    kwlen = keyword["kwlen"]
+    kwdata = keyword["kwdata"]
+
+    # --------
+    # Make sure the keyword is two characters long
+    if (len(keywordName) != 2):
+        out.error("The length of the keyword %s in record %s is not 2 characters long" %
+                  (keywordName, recordName))
+        errorsFound += 1
+
+    # --------
+    # A check to make sure the RT keyword kwdata matches the name of the record we are in
+    if ((keywordName == "RT") and (recordName != kwdata)):
+        out.error("The value of the RT keyword \"%s\" does not match the record name \"%s\"" %
+                  (kwdata, recordName))
+        errorsFound += 1
+
+    # --------
+    # Check that the length is a number and isn't longer than the keyword supports
+    # Keywords that start with # are 2 bytes, others are 1 byte
+    if (isinstance(kwlen, bool) or not isinstance(kwlen, int) or kwlen < 0):
+        out.error("The kwlen %s is not a number for keyword %s in record %s" % (vpdjson.json.dumps(kwlen), keywordName, recordName))
+        return (errorsFound + 1, None)
+    maxlen = 65535 if (keywordName[0:1] == "#") else 255
+    if (kwlen > maxlen):
+        out.error("The specified length %d is bigger than the max length %d for keyword %s in record %s" %
+                  (kwlen, maxlen, keywordName, recordName))
+        errorsFound += 1
+
+    if (not isinstance(kwformat, basestring)):
+        out.error("The kwformat for keyword %s in record %s has to be a string" % (keywordName, recordName))
+        return (errorsFound + 1, None)
+    kwformat = kwformat.lower()
+
+    # --------
+    # Mixed data is a list of ascii and hex pieces, put together as hex
+    if (kwformat == "mixed"):
+        if (not isinstance(kwdata, list)):
+            out.error("The kwdata for keyword %s in record %s has to be a list of ascii and hex pieces" % (keywordName, recordName))
+            return (errorsFound + 1, None)
+        hexdata = ""
+        for piece in kwdata:
+            if (not isinstance(piece, dict) or len(piece) != 1 or
+                list(piece)[0] not in ["ascii", "hex"] or not isinstance(list(piece.values())[0], basestring)):
+                out.error("The kwdata piece %s has to be {\"ascii\" : text} or {\"hex\" : data} for keyword %s in record %s" %
+                          (vpdjson.json.dumps(piece), keywordName, recordName))
+                errorsFound += 1
+                continue
+            (tag, text) = list(piece.items())[0]
+            if (tag == "ascii"):
+                hexdata += binascii.hexlify(text.encode()).decode()
+            else:
+                (rc, text) = checkHexDataFormat(text)
+                if (rc):
+                    out.error("checkHexDataFormat return an error for for keyword %s in record %s" %
+                              (keywordName, recordName))
+                    errorsFound += 1
+                hexdata += text
+        if ((len(hexdata)/2) > kwlen):
+            out.error("The total length of the mixed data is longer than the given kwlen for keyword %s in record %s" %
+                      (keywordName, recordName))
+            errorsFound += 1
+        kwdata = hexdata
+
+    elif (not isinstance(kwdata, basestring)):
+        out.error("The kwdata for keyword %s in record %s has to be a string" % (keywordName, recordName))
+        return (errorsFound + 1, None)
+
+    # --------
+    # Check the data is in the format given and isn't longer than the length
+    elif (kwformat == "ascii"):
+        if (len(kwdata) > kwlen):
+            out.error("The length of the value is longer than the given kwlen for keyword %s in record %s" %
+                      (keywordName, recordName))
+            errorsFound += 1
+    elif (kwformat == "hex" or kwformat == "repeat"):
+        (rc, kwdata) = checkHexDataFormat(kwdata)
+        if (rc):
+            out.error("checkHexDataFormat return an error for for keyword %s in record %s" %
+                      (keywordName, recordName))
+            errorsFound += 1
+        if (kwformat == "repeat" and (len(kwdata) == 0 or (len(kwdata) % 2))):
+            out.error("The repeat pattern for keyword %s in record %s has to be one or more whole bytes of hex" %
+                      (keywordName, recordName))
+            errorsFound += 1
+        # Convert hex nibbles to bytes for len compare
+        if ((len(kwdata)/2) > kwlen):
+            out.error("The length of the value is longer than the given kwlen for keyword %s in record %s" %
+                      (keywordName, recordName))
+            errorsFound += 1
+    else:
+        out.error("Unknown keyword format \"%s\" given for keyword %s in record %s" %
+                  (kwformat, keywordName, recordName))
+        errorsFound += 1
+
+    if (errorsFound):
+        return (errorsFound, None)
+
+    return (0, keywordData(kwlen, kwdata, "hex" if (kwformat == "mixed") else kwformat))
+
+# Run the 3 stages for a json template, writing the output files into clOutputPath or the bundle
+# The json is checked and turned right into the image model, stage 3 only has to pack it
+# Returns the errors found and the bundle, which is opened here when it isn't yet
+def buildJsonManifest(manifestFile, bundle):
+    ################################################
+    # Work with the template
+    out.setIndent(0)
+    out.msg("==== Stage 1: Parsing VPD json files")
+    out.setIndent(2)
+
+    (errorsFound, template) = loadJsonManifest(manifestFile)
+    if (template == None):
+        out.error("Please check your -m or -i cmdline options for typos")
+        return (errorsFound, bundle)
+
+    # All done with error checks, bailout if we hit something
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the json.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        return (errorsFound, bundle)
+
+    ################################################
+    # Verify the template and create the image model from it
+    out.setIndent(0)
+    out.msg("==== Stage 2: Verifying json syntax")
+    out.setIndent(2)
+
+    (errorsFound, vpdName, maxSizeBytes, vpdImage) = verifyJsonManifest(template, manifestFile)
+
+    # A report doesn't write anything, even to help debug
+    if (clReport):
+        if (errorsFound):
+            out.msg("")
+            out.error("%d error%s found in the json data.  Please review the above errors and correct them." %
+                      (errorsFound, "s" if (errorsFound > 1) else ""))
+            return (errorsFound, bundle)
+        packImage(vpdImage)
+        return (reportImage(manifestFile, vpdName, vpdImage, maxSizeBytes), bundle)
+
+    # Everything from here on is written to the bundle, if there is one
+    # It's opened by the first manifest to get this far and shared by the rest
+    if (clBundle and bundle == None):
+        try:
+            bundle = vpdbundle.BundleWriter(clOutputPath)
+        except (vpdbundle.BundleError, IOError) as e:
+            out.error("Unable to open the bundle %s: %s" % (clOutputPath, e))
+            return (errorsFound + 1, bundle)
+
+    # All done with error checks, bailout if we hit something
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the json data.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        (rc, templateFileName) = writeOutput(bundle, clOutputPath, vpdName + "-err" + vpdjson.EXTENSION, template)
+        if (rc):
+            return (rc, bundle)
+        reportOutput("json file to help in debug", templateFileName)
+        return (errorsFound, bundle)
+
+    out.setIndent(0)
+    out.msg("==== Stage 3: Creating VPD output files")
+    out.setIndent(2)
+
+    # Write out the full template representing the data contained in our image
+    if (clRecordMode):
+        templateFileName = vpdName
+    else:
+        templateFileName = vpdName + vpdjson.EXTENSION
+    (rc, templateFileName) = writeOutput(bundle, clOutputPath, templateFileName, template)
+    if (rc):
+        return (rc, bundle)
+    reportOutput("json file", templateFileName)
+
+    # In record only mode we don't want to write the binary file, so we bail from the program here
+    if (clRecordMode):
+        return (errorsFound, bundle)
+
+    image = packImage(vpdImage)
+    errorsFound += writeImage(bundle, vpdName, image, vpdImage, maxSizeBytes)
+
+    return (errorsFound, bundle)
+
+# Run the 3 stages for one manifest, writing the output files into clOutputPath or the bundle
+# bundle is the bundle opened by an earlier manifest in the same run, if any
+# stream says to use streamManifest, the default is clStream
+# Returns the errors found and the bundle, which is opened here when it isn't yet
+def buildManifest(manifestFile, bundle, stream = None):
+    # A json template is already read in all at once by the json parser, there is nothing to stream
+    if (vpdjson.isJson(manifestFile)):
+        return buildJsonManifest(manifestFile, bundle)
+    # A report needs the whole image laid out without writing anything, so it isn't streamed
+    if ((stream if (stream != None) else clStream) and not clReport):
+        return streamManifest(manifestFile, bundle)
+
+    ################################################
+    # Work with the manifest
+    out.setIndent(0)
+    out.msg("==== Stage 1: Parsing VPD XML files")
+    out.setIndent(2)
+
+    (errorsFound, manifest) = loadManifest(manifestFile)
+    if (manifest == None):
+        out.error("Please check your -m or -i cmdline options for typos")
+        return (errorsFound, bundle)
+
+    # All done with error checks, bailout if we hit something
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the xml.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        return (errorsFound, bundle)
+
+    ################################################
+    # Verify the tvpd XML
+    # read thru the complete tvpd and verify/check actual tag contents
+    out.setIndent(0)
+    out.msg("==== Stage 2: Verifying tvpd syntax")
+    out.setIndent(2)
+
+    (errorsFound, vpdName, maxSizeBytes) = verifyManifest(manifest, manifestFile)
+
+    # A report doesn't write anything, even to help debug
+    if (clReport):
+        if (errorsFound):
+            out.msg("")
+            out.error("%d error%s found in the tvpd data.  Please review the above errors and correct them." %
+                      (errorsFound, "s" if (errorsFound > 1) else ""))
+            return (errorsFound, bundle)
+        (errorsFound, image, vpdImage) = createImage(manifest, vpdName=vpdName)
+        return (reportImage(manifestFile, vpdName, vpdImage, maxSizeBytes), bundle)
+
+    # Everything from here on is written to the bundle, if there is one
+    # It's opened by the first manifest to get this far and shared by the rest
+    if (clBundle and bundle == None):
+        try:
+            bundle = vpdbundle.BundleWriter(clOutputPath)
+        except (vpdbundle.BundleError, IOError) as e:
+            out.error("Unable to open the bundle %s: %s" % (clOutputPath, e))
+            return (errorsFound + 1, bundle)
+
+    # All done with error checks, bailout if we hit something
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the tvpd data.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        (rc, tvpdFileName) = writeOutput(bundle, clOutputPath, vpdName + "-err.tvpd", manifest)
+        if (rc):
+            return (rc, bundle)
+        reportOutput("tvpd file to help in debug", tvpdFileName)
+        return (errorsFound, bundle)
+
+    # We now have a correct tvpd, use it to create a binary VPD image
+    out.setIndent(0)
+    out.msg("==== Stage 3: Creating VPD output files")
+    out.setIndent(2)
+    # Create our output file names
+    if (clRecordMode):
+        tvpdFileName = vpdName
+    else:
+        tvpdFileName = vpdName + ".tvpd"
+
+    # This is our easy one, write the XML back out
+    # Write out the full template vpd representing the data contained in our image
+    (rc, tvpdFileName) = writeOutput(bundle, clOutputPath, tvpdFileName, manifest)
+    if (rc):
+        return (rc, bundle)
+    reportOutput("tvpd file", tvpdFileName)
+
+    # In record only mode we don't want to write the binary file, so we bail from the program here
+    if (clRecordMode):
+        return (errorsFound, bundle)
+
+    # Now the hard part, create the binary image
+    (errorsFound, image, vpdImage) = createImage(manifest, vpdName=vpdName)
+    errorsFound += writeImage(bundle, vpdName, image, vpdImage, maxSizeBytes)
+
+    return (errorsFound, bundle)
+
+# Run the 3 stages for one manifest a record at a time, so only the record being worked on is held as xml
+# Each record is loaded, verified and converted to binary once it has been read, then written to the tvpd and dropped
+# A variant is built by buildManifest instead, its base manifest is kept in memory to be shared anyway
+# Returns the errors found and the bundle, which is opened here when it isn't yet
+def streamManifest(manifestFile, bundle):
+    loadErrors = 0
+    verifyErrors = 0
+
+    out.setIndent(0)
+    out.msg("==== Stage 1 and 2: Parsing and verifying VPD XML files a record at a time")
+    out.setIndent(2)
+
+    # Start a new list of the files read in to create this manifest
+    del inputFiles[:]
+
+    # Get the full path to the file given
+    fullPathFile = findFile(manifestFile, clInputPath)
+    if (fullPathFile == None):
+        out.error("The xml file %s could not be found!" % (manifestFile))
+        out.error("Please check your -m or -i cmdline options for typos")
+        return (1, bundle)
+    out.msg("Parsing file %s" % fullPathFile)
+
+    # The tvpd is written as the records are read, so a bundle has to be opened before anything else
+    if (clBundle and bundle == None):
+        try:
+            bundle = vpdbundle.BundleWriter(clOutputPath)
+        except (vpdbundle.BundleError, IOError) as e:
+            out.error("Unable to open the bundle %s: %s" % (clOutputPath, e))
+            return (1, bundle)
+
+    # The name of the tvpd isn't known until the <name> is read, so it's written to a temp file and renamed at the end
+    # In a bundle it's written in place and added to the index under its name at the end
+    stream = TvpdStream(bundle, tempFileName(os.path.join(clOutputPath, os.path.basename(manifestFile))))
+
+    # The top level tags other than the records, with a stand in for each record, checked once they have all been read
+    header = ET.Element("vpd")
+    # The records converted to binary, in the order they were given
+    records = list()
+    recordNames = dict()
+    root = None
+    depth = 0
+    variant = False
+
+    try:
+        with open(fullPathFile, "rb") as xmlFile:
+            for (event, element) in vpdxml.iterparse(xmlFile):
+                depth += 1 if (event == "start") else -1
+
+                # Without the vpd tag at the top the file is only read to check the xml, like parseXml does
+                if (root == None):
+                    root = element
+                if (root.tag != "vpd" or depth == 1):
+                    continue
+
+                # Everything before a new top level tag is complete, including the text after it
+                # The parser reads ahead, so the new tag might not be the last one in the tree yet
+                if (event == "start" and depth == 2):
+                    # A variant needs the whole base manifest, stop here and build it the normal way
+                    if (element.tag == "base"):
+                        variant = True
+                        break
+                    done = list(root).index(element)
+                elif (event == "end" and depth == 0):
+                    done = len(root)
+                else:
+                    continue
+
+                if (stream.started == False):
+                    stream.start(root)
+
+                for child in root[:done]:
+                    if (child.tag == "record"):
+                        # Stage 1 for the record, then stage 2 and the conversion to binary as long as stage 1 is clean
+                        # Stage 1 keeps going after an error so all the xml errors are seen at once, like loadManifest
+                        (rc, newRecord) = loadRecord(child)
+                        loadErrors += rc
+                        if (not loadErrors):
+                            verifyErrors += verifyRecord(newRecord, recordNames)
+                        if (not loadErrors and not verifyErrors and not clRecordMode):
+                            records.append(recordToModel(newRecord))
+                        stream.write(newRecord)
+                        header.append(ET.Element(child.tag, child.attrib))
+                    else:
+                        # Comments and the small top level tags
+                        stream.write(child)
+                        header.append(child)
+                del root[:done]
+    except ET.ParseError as e:
+        # If this parse gets an error, it's a hard stop since the rest of the code would do nothing
+        out.error("Unable to parse %s!" % fullPathFile)
+        out.error("Check your file for basic XML formatting issues, or missing toplevel <vpd> tag")
+        out.error("Python Exception: %s" % e)
+        out.error("Please check your -m or -i cmdline options for typos")
+        stream.discard()
+        return (1, bundle)
+
+    # Make sure the root starts with the vpd tag
+    # If it doesn't, it's not worth syntax checking any further
+    if (root.tag != "vpd"):
+        out.error("%s does not start with a <vpd> tag.  No further checking will be done until fixed!" % manifestFile)
+        out.error("Please check your -m or -i cmdline options for typos")
+        stream.discard()
+        return (1, bundle)
+
+    if (variant):
+        stream.discard()
+        out.msg("%s is a variant, the whole manifest has to be loaded" % manifestFile)
+        return buildManifest(manifestFile, bundle, False)
+
+    # With all the top level tags read, make sure we have all the required elements in the <vpd> section
+    if (not loadErrors):
+        loadErrors += checkElementsVpd(header)
+
+    # All done with error checks, bailout if we hit something
+    if (loadErrors):
+        stream.discard()
+        out.msg("")
+        out.error("%d error%s found in the xml.  Please review the above errors and correct them." %
+                  (loadErrors, "s" if (loadErrors > 1) else ""))
+        return (loadErrors, bundle)
+    stream.end(root)
+
+    # The checks of the top level tags
+    (rc, vpdName, maxSizeBytes) = verifyVpd(header, manifestFile)
+    verifyErrors += rc
+
+    # All done with error checks, bailout if we hit something
+    if (verifyErrors):
+        out.msg("")
+        out.error("%d error%s found in the tvpd data.  Please review the above errors and correct them." %
+                  (verifyErrors, "s" if (verifyErrors > 1) else ""))
+        (rc, tvpdFileName) = stream.close(vpdName + "-err.tvpd")
+        if (rc):
+            return (rc, bundle)
+        reportOutput("tvpd file to help in debug", tvpdFileName)
+        return (verifyErrors, bundle)
+
+    # The tvpd is already written, it just has to get its name
+    out.setIndent(0)
+    out.msg("==== Stage 3: Creating VPD output files")
+    out.setIndent(2)
+    (rc, tvpdFileName) = stream.close(vpdName if (clRecordMode) else (vpdName + ".tvpd"))
+    if (rc):
+        return (rc, bundle)
+    reportOutput("tvpd file", tvpdFileName)
+
+    # In record only mode we don't want to write the binary file, so we bail from the program here
+    if (clRecordMode):
+        return (0, bundle)
+
+    # The records are already binary, all that's left is to lay them out in the image
+    vpdImage = vpdmodel.VpdImage(vpdName, keywordData(2, header.find("VD").text, "hex"), records)
+    image = packImage(vpdImage)
+    errorsFound = writeImage(bundle, vpdName, image, vpdImage, maxSizeBytes)
+
+    return (errorsFound, bundle)
+
+# Find the templates to build in a directory tree given to -m, every tvpd and each json template with a size
+# The record and keyword json files some templates include aren't built on their own
+# Returns the template file names in sorted order
+def findTemplates(path):
+    templates = list()
+    for (dirPath, dirNames, fileNames) in os.walk(path, followlinks=True):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+            templateFile = os.path.join(dirPath, fileName)
+            if (fileName.endswith(".tvpd")):
+                templates.append(templateFile)
+            elif (vpdjson.isJson(fileName)):
+                try:
+                    template = vpdjson.load(templateFile)
+                except ValueError:
+                    # A bad template is still a template, building it will say what is wrong
+                    templates.append(templateFile)
+                    continue
+                if (isinstance(template, dict) and "size" in template):
+                    templates.append(templateFile)
+    return templates
+
+# Print the images reported on with --report in a batch, the fullest first
+def reportSummary():
+    out.setIndent(0)
+    out.msg("==== Space used by %d images, the fullest first" % len(spaceReports))
+    out.setIndent(2)
+    for (manifestFile, imageSize, maxSizeBytes) in sorted(spaceReports, key=lambda report: -report[1] / max(report[2], 1)):
+        out.msg("%6.1f%% %7d of %7d bytes, %7d left  %s" %
+                ((imageSize * 100.0 / max(maxSizeBytes, 1)), imageSize, maxSizeBytes, maxSizeBytes - imageSize, manifestFile))
+
+# Stage 1 and 2 for a template the jobs of a batch build use, it is loaded once and kept for the rest of them
+# The files the template includes are looked for next to it first, then in inputPath
+# The hash kept is of the image the template builds on its own, so it changes when any file it includes does
+# Returns the errors found and the (image model, size given, hash)
+def loadBatchTemplate(templateFile, inputPath):
+    global clInputPath
+    if (templateFile in batchTemplates):
+        return (0, batchTemplates[templateFile])
+
+    # The search path is only this template's while it loads, the next template gets its own
+    savedInputPath = clInputPath
+    clInputPath = os.path.dirname(templateFile) + os.pathsep + inputPath
+    try:
+        (errorsFound, vpdImage, maxSizeBytes) = loadTemplateImage(templateFile)
+    finally:
+        clInputPath = savedInputPath
+    if (errorsFound):
+        return (errorsFound, None)
+
+    templateHash = vpdbatch.outputHash(bytes(packImage(vpdImage))) + ":%d" % maxSizeBytes
+    batchTemplates[templateFile] = (vpdImage, maxSizeBytes, templateHash)
+    return (0, batchTemplates[templateFile])
+
+# Stage 1 and 2 for a tvpd or json template, without writing anything, in the clInputPath search path
+# Returns the errors found, the image model and the size given
+def loadTemplateImage(templateFile):
+    if (vpdjson.isJson(templateFile)):
+        (errorsFound, template) = loadJsonManifest(templateFile)
+        if (template == None or errorsFound):
+            return (max(errorsFound, 1), None, None)
+        (errorsFound, vpdName, maxSizeBytes, vpdImage) = verifyJsonManifest(template, templateFile)
+        if (errorsFound):
+            return (errorsFound, None, None)
+    else:
+        (errorsFound, manifest) = loadManifest(templateFile)
+        if (manifest == None or errorsFound):
+            return (max(errorsFound, 1), None, None)
+        (errorsFound, vpdName, maxSizeBytes) = verifyManifest(manifest, templateFile)
+        if (errorsFound):
+            return (errorsFound, None, None)
+        vpdImage = manifestToImage(manifest, vpdName)
+    return (0, vpdImage, maxSizeBytes)
+
+# Set up a worker process of a batch build with the layout and checks given on the command line
+def initBatchWorker(accesses, pageSize, verify):
+    global clAccesses, clPageSize, clVerify
+    clAccesses = accesses
+    clPageSize = pageSize
+    clVerify = verify
+
+# Build the image for one job of a batch build and write it to outputPath as the job name .vpd
+# This is run in the worker processes, so all output is captured and handed back with the result
+# The image is written to a temp file and renamed into place, so the output is never part of an image
+# Returns the errors found, the output, the image file and the hash of the image
+def buildJob(name, templateFile, inputPath, overrides, outputPath):
+    out.startCapture()
+    outputFile = os.path.join(outputPath, name + ".vpd")
+    imageHash = None
+
+    # Anything unexpected fails just this job, and the output is still handed back instead of staying captured
+    try:
+        (errorsFound, template) = loadBatchTemplate(templateFile, inputPath)
+        if (not errorsFound):
+            (vpdImage, maxSizeBytes, templateHash) = template
+            errorsFound += checkOverrides(vpdImage, overrides)
+
+        if (not errorsFound):
+            jobImage = applyOverrides(vpdImage, overrides)
+            image = packImage(jobImage)
+            errorsFound += checkImageSize(len(image), maxSizeBytes)
+
+        # Read the image back and check it against the job's image model, like writeImage does
+        if (not errorsFound and clVerify):
+            errorsFound += verifyImage(image, jobImage)
+    except Exception as e:
+        out.error("Job %s could not be built: %s" % (name, e))
+        errorsFound = 1
+
+    if (not errorsFound):
+        try:
+            writeOutput(None, outputPath, name + ".vpd", image)
+            imageHash = vpdbatch.outputHash(image)
+        except (IOError, OSError) as e:
+            tempFile = tempFileName(outputFile)
+            if (os.path.exists(tempFile)):
+                os.remove(tempFile)
+            out.error("Unable to write %s: %s" % (outputFile, e))
+            errorsFound += 1
+
+    return (errorsFound, out.stopCapture(), outputFile, imageHash)
+
+# Remove the temp files a killed batch build left for the jobs, before any of them are built
+# With a worker, only that worker's temp files are removed, the other workers could still be writing theirs
+# Without one, the output path is listed once for the temp files of any earlier build on this host
+def removeBatchTemps(outputPath, names, worker = None):
+    if (worker != None):
+        for name in names:
+            tempFile = os.path.join(outputPath, ".%s.vpd.%s.tmp" % (name, worker))
+            if (os.path.exists(tempFile)):
+                os.remove(tempFile)
+        return
+
+    host = vpdbatch.workerName().rpartition(".")[0]
+    tempPattern = re.compile(r"^\.(.+)\.vpd\.(.+)\.[0-9]+\.tmp$")
+    for fileName in os.listdir(outputPath):
+        match = tempPattern.match(fileName)
+        if (match != None and match.group(1) in names and match.group(2) == host):
+            os.remove(os.path.join(outputPath, fileName))
+
+# Find and load the templates of the jobs that aren't in templateFiles yet, a job that doesn't name one uses defaultTemplate
+# templateFiles has the template file of each template name the jobs give, None for the ones that couldn't be loaded
+# Returns the errors found
+def loadJobTemplates(jobs, defaultTemplate, inputPath, templateFiles):
+    errorsFound = 0
+    for job in jobs:
+        if (job["template"] in templateFiles):
+            continue
+        templateFile = defaultTemplate if (job["template"] == None) else findFile(job["template"], inputPath)
+        templateFiles[job["template"]] = templateFile
+        if (templateFile == None):
+            if (job["template"] == None):
+                out.error("Job %s doesn't name a template and one -m template wasn't given to use" % job["name"])
+            else:
+                out.error("The template %s of job %s could not be found!" % (job["template"], job["name"]))
+            errorsFound += 1
+            continue
+        out.startCapture()
+        (rc, template) = loadBatchTemplate(templateFile, inputPath)
+        messages = out.stopCapture()
+        if (rc):
+            for line in messages:
+                out.msg(line)
+            templateFiles[job["template"]] = None
+            errorsFound += rc
+        else:
+            out.msg("Loaded template %s: %d records" % (templateFile, len(template[0].records)))
+    return errorsFound
+
+# Stage 1 and 2 for a batch build, read the jobs file and load the templates the jobs use
+# Returns the errors found, the jobs and the template file of each template name the jobs give
+def loadBatch(jobsFile, defaultTemplate, inputPath):
+    out.setIndent(0)
+    out.msg("==== Stage 1 and 2: Loading the jobs and their templates")
+    out.setIndent(2)
+
+    try:
+        (errors, jobs) = vpdbatch.loadJobs(jobsFile)
+    except IOError as e:
+        out.error("Unable to read the jobs file %s: %s" % (jobsFile, e))
+        return (1, None, None)
+    for error in errors:
+        out.error(error)
+    if (len(errors)):
+        return (len(errors), None, None)
+
+    templateFiles = dict()
+    errorsFound = loadJobTemplates(jobs, defaultTemplate, inputPath, templateFiles)
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the templates.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+    return (errorsFound, jobs, templateFiles)
+
+# Build an image for each job in a jobs file with a pool of worker processes, see pymod/vpdbatch.py
+# A job that doesn't name a template uses defaultTemplate, the -m template
+# The jobs in the journal with the same input and an output that is still there are skipped, the rest are built
+# and added to the journal as they finish.  A job that fails isn't, so running the batch again retries it
+# Returns the number of jobs that couldn't be built
+def runJobs(jobsFile, journalFile, defaultTemplate, workers):
+    # Only needed for a batch build
+    import concurrent.futures
+    import itertools
+    inputPath = clInputPath
+
+    (errorsFound, jobs, templateFiles) = loadBatch(jobsFile, defaultTemplate, inputPath)
+    if (errorsFound):
+        return errorsFound
+
+    out.setIndent(0)
+    out.msg("==== Stage 3: Building %d jobs" % len(jobs))
+    out.setIndent(2)
+
+    journal = vpdbatch.Journal(journalFile)
+    pending = list()
+    for job in jobs:
+        jobHash = vpdbatch.inputHash(batchTemplates[templateFiles[job["template"]]][2], job)
+        if (not journal.done(job["name"], jobHash, os.path.join(clOutputPath, job["name"] + ".vpd"))):
+            pending.append((job, jobHash))
+    out.msg("%d jobs already done in %s, %d to build with %d workers" % (len(jobs) - len(pending), journalFile, len(pending), workers))
+    removeBatchTemps(clOutputPath, set(job["name"] for job in jobs))
+
+    startTime = time.time()
+    failed = 0
+    with journal, concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initBatchWorker,
+                                                         initargs=(clAccesses, clPageSize, clVerify)) as pool:
+        # Only a few jobs per worker are handed out at a time, so a big batch isn't all queued up in memory
+        remaining = iter(pending)
+        running = dict()
+        while True:
+            for (job, jobHash) in itertools.islice(remaining, (workers * 4) - len(running)):
+                future = pool.submit(buildJob, job["name"], templateFiles[job["template"]], inputPath, job["keywords"], clOutputPath)
+                running[future] = (job, jobHash)
+            if (len(running) == 0):
+                break
+            (finished, waiting) = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                (job, jobHash) = running.pop(future)
+                try:
+                    (rc, messages, outputFile, imageHash) = future.result()
+                except Exception as e:
+                    (rc, messages) = (1, ["ERROR: %s" % e])
+                if (rc):
+                    failed += 1
+                    out.error("Job %s failed:" % job["name"])
+                    for line in messages:
+                        out.msg("  " + line)
+                else:
+                    journal.add(job["name"], jobHash, outputFile, imageHash)
+    elapsed = time.time() - startTime
+
+    out.msg("Built %d jobs in %.3fs (%.1f images/s), %d already done, %d failed" %
+            (len(pending) - failed, elapsed, (len(pending) - failed) / max(elapsed, 0.001), len(jobs) - len(pending), failed))
+    if (failed):
+        out.msg("")
+        out.error("%d job%s failed.  Run the same jobs again once fixed, only the failed jobs will be built." %
+                  (failed, "s" if (failed > 1) else ""))
+
+    return failed
+
+# Put the jobs of a jobs file in a shared queue directory, chunkSize jobs to a chunk, for the workers of runQueue to claim
+# The jobs and their templates are checked first, so a bad job is found before any host starts on them
+# Returns the errors found
+def submitJobs(jobsFile, queuePath, chunkSize, defaultTemplate):
+    (errorsFound, jobs, templateFiles) = loadBatch(jobsFile, defaultTemplate, clInputPath)
+    if (errorsFound):
+        return errorsFound
+
+    out.setIndent(0)
+    out.msg("==== Stage 3: Queueing %d jobs" % len(jobs))
+    out.setIndent(2)
+
+    queue = vpdbatch.WorkQueue(queuePath)
+    # The chunk names are unique to this submit, so the same jobs file can be queued again after fixing failed jobs
+    prefix = "%s-%d-%d" % (os.path.splitext(os.path.basename(jobsFile))[0], int(time.time()), os.getpid())
+    chunks = 0
+    for start in range(0, len(jobs), chunkSize):
+        queue.submit("%s-%06d%s" % (prefix, chunks, vpdbatch.CHUNK_EXTENSION), jobs[start:(start + chunkSize)])
+        chunks += 1
+    out.msg("Queued %d jobs in %d chunks in %s" % (len(jobs), chunks, queue.queueDir("pending")))
+
+    return 0
+
+# Build a chunk of jobs claimed from a work queue
+# The lease on the chunk is renewed as the jobs are built, a chunk that loses its lease is dropped part way
+# Returns the jobs that were built, the jobs that failed, the lines that weren't jobs, and if the lease was kept
+def buildChunk(queue, claimedFile, journal, defaultTemplate, inputPath, outputPath, templateFiles):
+    built = 0
+    failedJobs = list()
+    # A chunk that didn't come from submitJobs can have lines that aren't good jobs, they can't be built or queued again
+    (errors, jobs) = vpdbatch.loadJobs(claimedFile)
+    for error in errors:
+        out.error(error)
+
+    # A template that doesn't load fails all of its jobs, that is only printed once
+    out.startCapture()
+    loadJobTemplates(jobs, defaultTemplate, inputPath, templateFiles)
+    for line in out.stopCapture():
+        if (line.lstrip().startswith("ERROR")):
+            out.msg(line)
+
+    lastRenew = time.time()
+    for job in jobs:
+        templateFile = templateFiles[job["template"]]
+        if (templateFile == None):
+            failedJobs.append(job)
+            continue
+
+        # A job that can't be built goes to failed with the rest, it must never take the worker down with it
+        # or the chunk would stay claimed, and crash each worker that reclaims it
+        try:
+            (rc, messages, outputFile, imageHash) = buildJob(job["name"], templateFile, inputPath, job["keywords"], outputPath)
+            if (not rc):
+                journal.add(job["name"], vpdbatch.inputHash(batchTemplates[templateFile][2], job), outputFile, imageHash)
+        except Exception as e:
+            (rc, messages) = (1, ["ERROR: %s" % e])
+        if (rc):
+            failedJobs.append(job)
+            out.error("Job %s failed:" % job["name"])
+            for line in messages:
+                out.msg("  " + line)
+        else:
+            built += 1
+
+        # The heartbeat, well inside the lease time so a slow job doesn't lose it
+        if ((time.time() - lastRenew) > (queue.leaseTime / 4)):
+            if (not queue.renew(claimedFile)):
+                return (built, failedJobs, len(errors), False)
+            lastRenew = time.time()
+
+    return (built, failedJobs, len(errors), True)
+
+# One worker of a queue build, claiming chunks from the shared queue directory and building them until there are none left
+# Every worker works this way, whether it is one of the processes on this host or on another host
+# When all the chunks left are claimed, the worker waits to take over any whose worker dies, until they are all done
+# Returns the stats of the worker, which are also written to the queue after each chunk
+def queueWorker(queuePath, leaseTime, defaultTemplate, inputPath, outputPath):
+    queue = vpdbatch.WorkQueue(queuePath, leaseTime)
+    worker = vpdbatch.workerName()
+    stats = {"worker" : worker, "chunks" : 0, "jobs" : 0, "failed" : 0, "lost" : 0, "seconds" : 0.0, "started" : time.time()}
+    templateFiles = dict()
+
+    with vpdbatch.Journal(queue.journalFile(worker)) as journal:
+        while True:
+            claimed = queue.claim(worker)
+            if (claimed == None):
+                # Put the chunks of dead workers back, along with the temp files they may have left for their jobs
+                for (chunkName, claimedFile, deadWorker) in queue.expired():
+                    try:
+                        (errors, jobs) = vpdbatch.loadJobs(claimedFile)
+                    except IOError:
+                        continue
+                    if (queue.reclaim(chunkName, claimedFile)):
+                        out.msg("%s: the lease on %s expired, it is pending again" % (worker, chunkName))
+                        removeBatchTemps(outputPath, set(job["name"] for job in jobs), deadWorker)
+                if (len(queue.chunks("pending"))):
+                    continue
+                if (not queue.active()):
+                    break
+                time.sleep(vpdbatch.POLL_TIME)
+                continue
+
+            (chunkName, claimedFile) = claimed
+            startTime = time.time()
+            (built, failedJobs, badLines, kept) = buildChunk(queue, claimedFile, journal, defaultTemplate, inputPath, outputPath, templateFiles)
+            if (kept):
+                kept = queue.finish(chunkName, claimedFile, failedJobs)
+            if (kept):
+                stats["chunks"] += 1
+                stats["failed"] += len(failedJobs) + badLines
+                out.msg("%s: built %s, %d jobs, %d failed" % (worker, chunkName, built, len(failedJobs) + badLines))
+            else:
+                stats["lost"] += 1
+                out.warn("%s: the lease on %s expired before it was done, another worker will build it" % (worker, chunkName))
+            stats["jobs"] += built
+            stats["seconds"] += time.time() - startTime
+            stats["imagesPerSecond"] = stats["jobs"] / max(stats["seconds"], 0.001)
+            queue.writeStats(worker, stats)
+
+    stats["finished"] = time.time()
+    queue.writeStats(worker, stats)
+    return stats
+
+# Build the jobs in a shared queue directory with workers processes on this host, see vpdbatch.WorkQueue
+# Other hosts sharing the directory run the same thing at the same time, a chunk is built by whichever worker claims it
+# A run on one host against a local directory is the same code, just with all the workers here
+# Returns the number of jobs that failed on this host
+def runQueue(queuePath, leaseTime, defaultTemplate, workers):
+    # Only needed for a batch build
+    import concurrent.futures
+
+    out.setIndent(0)
+    out.msg("==== Stage 3: Building the jobs queued in %s with %d workers" % (queuePath, workers))
+    out.setIndent(2)
+
+    # Each worker is its own process claiming chunks, exactly as a worker on another host does
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initBatchWorker,
+                                                initargs=(clAccesses, clPageSize, clVerify)) as pool:
+        futures = [pool.submit(queueWorker, queuePath, leaseTime, defaultTemplate, clInputPath, clOutputPath) for index in range(workers)]
+        failed = sum(future.result()["failed"] for future in futures)
+
+    # The stats of every worker that has worked on the queue, from this host and the others
+    queue = vpdbatch.WorkQueue(queuePath, leaseTime)
+    out.setIndent(0)
+    out.msg("==== Worker stats")
+    out.setIndent(2)
+    total = {"chunks" : 0, "jobs" : 0, "failed" : 0, "lost" : 0}
+    for stats in queue.readStats():
+        out.msg("%-32s %6d chunks %8d jobs %6d failed %4d lost %9.1f images/s" %
+                (stats["worker"], stats["chunks"], stats["jobs"], stats["failed"], stats["lost"], stats.get("imagesPerSecond", 0.0)))
+        for key in total:
+            total[key] += stats[key]
+    out.msg("%-32s %6d chunks %8d jobs %6d failed %4d lost" % ("Total", total["chunks"], total["jobs"], total["failed"], total["lost"]))
+    if (len(queue.chunks("failed"))):
+        out.msg("")
+        out.error("The jobs that failed are in %s, they can be fixed and queued again" % queue.queueDir("failed"))
+
+    return failed
+
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    global clInputPath, clDebug, clRecordMode, clOutputPath, clBundle, clBinaryRecords, clBinaryKeywords, clVerify, clStream
+    global clAccesses, clPageSize, clReport
+    # Only needed to run as a tool, not by the tools that import this file
+    import argparse
+    import textwrap
+    rc = 0
+
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='The VPD image creation tool', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./createVpd.py -m examples/simple/simple.tvpd -o /tmp
+                                       ./createVpd.py -m examples/rbinfile/rbinfile.tvpd -i examples/rbinfile -o /tmp
+                                       ./createVpd.py -m examples/simple/simple.tvpd -r -k --bundle -o /tmp/images.vpdb
+                                       ./createVpd.py -m generated.tvpd --stream -o /tmp
+                                       ./createVpd.py -m examples/json/json.json -i examples/json -o /tmp
+                                       ./createVpd.py -m examples/variant/variant-a.tvpd examples/variant/variant-b.tvpd -i examples/variant -o /tmp
+                                       ./createVpd.py -m examples/p10/sysplanar/p10_sysplanar_template.tvpd -i examples/p10/sysplanar -o /tmp --access-file boot-accesses.txt --page-size 32
+                                       ./createVpd.py -m examples --report
+                                       ./createVpd.py -m examples/p10/bmc/p10_bmc_template.tvpd -i examples/p10/bmc --jobs serials.jobs -o /tmp/serials
+                                       ./createVpd.py -m examples/p10/bmc/p10_bmc_template.tvpd -i examples/p10/bmc --jobs serials.jobs --queue /shared/queue
+                                       ./createVpd.py -m examples/p10/bmc/p10_bmc_template.tvpd -i examples/p10/bmc --queue /shared/queue -o /shared/serials
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-m', '--manifest', help='The input file detailing all the records and keywords to be in the image, a tvpd or a .json template.  Give more than one to build them all in one run, or a directory to build every template under it', nargs="+", required=True)
+    reqgroup.add_argument('-o', '--outpath', help='The output path for the files created by the tool, or the bundle file with --bundle.  Not used with --report')
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-d', '--debug', help="Enables debug printing", action="store_true")
+    optgroup.add_argument('-c', '--record-mode', help="The input is a record only file.  No output VPD binary created.", action="store_true")
+    optgroup.add_argument('-r', '--binary-records', help="Create binary files for each record in the template", action="store_true")
+    optgroup.add_argument('-k', '--binary-keywords', help="Create binary files for each keyword in the template", action="store_true")
+    optgroup.add_argument('-i', '--inpath', help="The search path to use for the files referenced in the manifest")
+    optgroup.add_argument('--verify', help="Check the created image against the verified tvpd before writing it out", action="store_true")
+    optgroup.add_argument('--stream', help="Read, check and write the manifest a record at a time, so memory use is set by the largest record instead of the whole manifest", action="store_true")
+    optgroup.add_argument('--access-file', help="Lay out the records for the RECORD or RECORD:KEYWORD accesses in this file, one per line, the most accessed records first instead of in manifest order")
+    optgroup.add_argument('--page-size', help="With --access-file, move each accessed record to the next eeprom page boundary of this many bytes when that has it span fewer pages", type=int)
+    optgroup.add_argument('--report', help="Lay out each image and report the space its records take and what is left of its <size>, without writing anything", action="store_true")
+    optgroup.add_argument('--jobs', help="Build an image for each json job in this file, a name, an optional template and the keywords to change, from the -m template when the job doesn't name one")
+    optgroup.add_argument('--journal', help="With --jobs, the journal of the jobs already built, so a batch run again only builds the rest (default the jobs file name .journal in the output path)")
+    optgroup.add_argument('--workers', help="With --jobs, the number of processes building images (default the number of cpus)", type=int)
+    optgroup.add_argument('--queue', help="A directory shared by the hosts building a batch.  With --jobs the jobs are queued in it, without them the jobs queued are built")
+    optgroup.add_argument('--chunk-size', help="With --jobs and --queue, the number of jobs a worker claims at a time (default 100)", type=int, default=100)
+    optgroup.add_argument('--lease', help="With --queue, the seconds a worker can go without a heartbeat before its chunk is given to another worker (default 60)", type=int, default=60)
+    optgroup.add_argument('--xml-backend', help="The xml parser to read the templates with.  The python backend gives the file and line of the tags with errors (default the fastest available)", choices=vpdxml.available())
+    optgroup.add_argument('--bundle', help="Add all the output files to the bundle file given by -o instead of writing them separately.  -o - streams the bundle to stdout", action="store_true")
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # Get the manifest files and get this party started
+    clManifestFiles = args.manifest
+
+    # Write a bundle instead of separate files
+    clBundle = args.bundle
+
+    # Only report the space used in each image, nothing gets written so there's no output path needed
+    clReport = args.report
+    if (clReport and (clBundle or args.record_mode)):
+        out.error("--report can't be used with --bundle or --record-mode, there is nothing written")
+        exit(1)
+    if ((args.jobs != None or args.queue != None) and
+        (clBundle or clReport or args.record_mode or args.binary_records or args.binary_keywords or args.stream)):
+        out.error("--jobs only writes the image of each job, it can't be used with --bundle, --report, -c, -r, -k or --stream")
+        exit(1)
+    if (args.chunk_size < 1 or args.lease < 1):
+        out.error("--chunk-size and --lease have to be at least 1")
+        exit(1)
+    # The worker pools of a batch build come from concurrent.futures, which python 2 doesn't have
+    if ((args.jobs != None or args.queue != None) and sys.version_info[0] < 3):
+        out.error("--jobs and --queue require python 3")
+        exit(1)
+    # Queueing jobs doesn't build anything, so it doesn't need an output path either
+    if (clReport != True and (args.jobs == None or args.queue == None) and args.outpath == None):
+        parser.error("the following arguments are required: -o/--outpath")
+
+    # Look for output path
+    clOutputPath = args.outpath
+    # Make sure the path exists, we aren't going to create it
+    # For a bundle that's the directory the bundle goes in
+    if (clOutputPath == None):
+        # Nothing is written, so there is no output path to check
+        pass
+    elif (clBundle and clOutputPath == "-"):
+        # stdout is the bundle, everything else has to go to stderr
+        out.setStream(sys.stderr)
+    elif (clBundle and os.path.isdir(os.path.dirname(os.path.abspath(clOutputPath))) != True):
+        out.error("The directory for the bundle %s does not exist!" % clOutputPath)
+        out.error("Please create the output directory and run again")
+        exit(1)
+    elif (clBundle != True and os.path.exists(clOutputPath) != True):
+        out.error("The given output path %s does not exist!" % clOutputPath)
+        out.error("Please create the output directory and run again")
+        exit(1)
+
+    # Look for input path
+    clInputPath = args.inpath
+    # Make sure the path exists
+    if (clInputPath != None):
+        # Add the CWD onto the path so the local directory is always looked at
+        clInputPath += os.pathsep + "."
+    else:
+        # Set it the CWD since it will be used throughout the program and having it set to None breaks things
+        clInputPath = "."
+
+    # Debug printing
+    clDebug = args.debug
+
+    # Record only mode
+    clRecordMode = args.record_mode
+
+    # Create separate binary files for each record
+    clBinaryRecords = args.binary_records
+
+    # Create separate binary files for each keyword
+    clBinaryKeywords = args.binary_keywords
+
+    # Check the created image
+    clVerify = args.verify
+
+    # Work a record at a time
+    clStream = args.stream
+
+    # The line numbers in the errors come from the python backend
+    if (args.xml_backend != None):
+        vpdxml.setBackend(args.xml_backend)
+
+    # The layout policy
+    if (args.access_file != None):
+        try:
+            clAccesses = vpddevice.loadAccesses(args.access_file)
+        except IOError as e:
+            out.error("Unable to read the access file %s: %s" % (args.access_file, e))
+            exit(1)
+    elif (args.page_size != None):
+        out.error("--page-size is only used with --access-file")
+        exit(1)
+    clPageSize = args.page_size
+    if (clPageSize != None and clPageSize < 1):
+        out.error("The page size has to be at least 1 byte")
+        exit(1)
+
+    # We are going to do this in 3 stages
+    # 1 - Read in the manifest and any other referenced files.  This will create a complete XML description of the VPD
+    #     We will also check to make sure that all required tags are given and no extra tags exist
+    # 2 - Parse thru the now complete vpd tree and make sure the data within the tags is valid.
+    #     These are checks like data not greater than length, etc..
+    # 3 - With the XML and contents verified correct, loop thru it again and write out the VPD data
+    #
+    # Note: Looping thru the XML twice between stage 1 and 2 makes it easier to surface multiple errors to the user at once.
+    #       If we were trying to both validate the xml and data at once, it would be harder to continue and gather multiple errors like we do now
+
+    # A batch build of jobs, the -m template is the one they use when they don't name another
+    defaultTemplate = clManifestFiles[0] if (len(clManifestFiles) == 1) else None
+    if (args.jobs != None or args.queue != None):
+        workers = max(args.workers if (args.workers != None) else (os.cpu_count() or 1), 1)
+    if (args.queue != None):
+        if (args.jobs != None):
+            exit(min(submitJobs(args.jobs, args.queue, args.chunk_size, defaultTemplate), 255))
+        failed = runQueue(args.queue, args.lease, defaultTemplate, workers)
+        exit(min(failed, 255))
+    if (args.jobs != None):
+        journalFile = args.journal
+        if (journalFile == None):
+            journalFile = os.path.join(clOutputPath, os.path.basename(args.jobs) + ".journal")
+        failed = runJobs(args.jobs, journalFile, defaultTemplate, workers)
+        # The return code only has 8 bits, a batch of 256 failed jobs can't look like it worked
+        exit(min(failed, 255))
+
+    # A directory is every template under it, each looking for the files it includes next to it first
+    manifests = list()
+    for manifestFile in clManifestFiles:
+        if (os.path.isdir(manifestFile)):
+            templates = findTemplates(manifestFile)
+            if (len(templates) == 0):
+                out.error("No templates were found under %s" % manifestFile)
+                exit(1)
+            manifests += [(templateFile, os.path.dirname(templateFile) + os.pathsep + clInputPath) for templateFile in templates]
+        else:
+            manifests.append((manifestFile, clInputPath))
+
+    # Build each manifest in turn
+    # Variants of the same base share the base manifest loaded for the first of them, see loadVariant
+    bundle = None
+    errorsFound = 0
+    for (manifestFile, clInputPath) in manifests:
+        if (len(manifests) > 1):
+            out.setIndent(0)
+            out.msg("==== Building %s" % manifestFile)
+        (rc, bundle) = buildManifest(manifestFile, bundle)
+        errorsFound += rc
+
+    # Done with the bundle
+    if (bundle != None):
+        bundle.close()
+    elif (clReport):
+        if (len(spaceReports) > 1):
+            reportSummary()
+    else:
+        out.setIndent(0)
+        out.msg("Wrote %d output files, %d unchanged" % (len(outputsWritten), len(outputsUnchanged)))
+
+    # Return the number of errors found as the return code
+    # The return code only has 8 bits, 256 errors can't look like it worked
+    exit(min(errorsFound, 255))
+
+if __name__ == "__main__":
+    main()
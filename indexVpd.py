@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# Program to index the keywords in a collection of VPD dumps into a SQLite database for queries
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# The database has a table for each level of the dumps
+#   files    - every file scanned, with the mtime and size it had so unchanged files can be skipped
+#   images   - every vpd image found in a file, a plain image is one at offset 0
+#   keywords - every keyword in every image, with the raw data and the text reverseVpd.py would put in a template
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import vpdmodel
+import reverseVpd
+import argparse
+import textwrap
+import sqlite3
+import mmap
+import time
+import concurrent.futures
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime INTEGER, size INTEGER);
+CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, file INTEGER, offset INTEGER, size INTEGER);
+CREATE TABLE IF NOT EXISTS keywords (image INTEGER, record TEXT, keyword TEXT, data BLOB, text TEXT);
+CREATE INDEX IF NOT EXISTS imagesByFile ON images (file);
+CREATE INDEX IF NOT EXISTS keywordsByImage ON keywords (image);
+CREATE INDEX IF NOT EXISTS keywordsByName ON keywords (record, keyword);
+"""
+
+# The number of files to put in the database between each commit
+COMMIT_FILES = 1000
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Find all the vpd images in a file and their keywords
+# This is run in the worker processes, so nothing is printed, errors are handed back
+# Returns (path, mtime, size, error, images) with images a list of (offset, size, keyword rows)
+def indexFile(path, mtime, size):
+    images = list()
+    if (size == 0):
+        return (path, mtime, size, None, images)
+
+    try:
+        with open(path, mode='rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # A plain image is found at offset 0, a flash dump can have any number
+            for (offset, vpdImage) in vpdmodel.findImages(data):
+                rows = list()
+                for record in vpdImage.records:
+                    for keyword in record.keywords:
+                        rows.append((record.name, keyword.name, keyword.data, reverseVpd.keywordText(keyword.data)[1]))
+                images.append((offset, vpdImage.size, rows))
+    except (IOError, ValueError) as e:
+        return (path, mtime, size, str(e), images)
+
+    return (path, mtime, size, None, images)
+
+# Find the files to scan under the paths given, with the (mtime, size) of each
+# A file that can't be looked at, like a dangling symlink or one removed since the walk, is reported and left out
+# Returns the errors found and the files
+def findFiles(paths):
+    errorsFound = 0
+    files = dict()
+    for path in paths:
+        if (os.path.isfile(path)):
+            fileNames = [path]
+        else:
+            fileNames = [os.path.join(dirPath, fileName) for (dirPath, dirNames, fileNames) in os.walk(path) for fileName in fileNames]
+        for fileName in fileNames:
+            fileName = os.path.abspath(fileName)
+            try:
+                st = os.stat(fileName)
+            except OSError as e:
+                out.error("Unable to index %s: %s" % (fileName, e.strerror))
+                errorsFound += 1
+                continue
+            files[fileName] = (st.st_mtime_ns, st.st_size)
+    return (errorsFound, files)
+
+# Remove a file and everything found in it from the database
+def removeFile(db, fileId):
+    db.execute("DELETE FROM keywords WHERE image IN (SELECT id FROM images WHERE file = ?)", (fileId,))
+    db.execute("DELETE FROM images WHERE file = ?", (fileId,))
+    db.execute("DELETE FROM files WHERE id = ?", (fileId,))
+
+# Bring the database up to date with the files under paths
+# Only new or changed files are parsed, files that are gone are dropped from the database
+# Returns the errors found
+def updateIndex(db, paths, workers):
+    errorsFound = 0
+    startTime = time.time()
+
+    # What the database already has
+    known = dict()
+    for (fileId, path, mtime, size) in db.execute("SELECT id, path, mtime, size FROM files"):
+        known[path] = (fileId, mtime, size)
+
+    (errors, files) = findFiles(paths)
+    errorsFound += errors
+    changed = [(path, files[path][0], files[path][1]) for path in sorted(files)
+               if (path not in known or known[path][1:] != files[path])]
+
+    # Anything under the paths scanned that is no longer there
+    roots = [os.path.abspath(path) for path in paths]
+    removed = [path for path in known if (path not in files and
+                                         any((path == root or path.startswith(root.rstrip(os.sep) + os.sep)) for root in roots))]
+    for path in removed:
+        removeFile(db, known[path][0])
+
+    imagesFound = 0
+    done = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        results = pool.map(indexFile, [entry[0] for entry in changed], [entry[1] for entry in changed],
+                           [entry[2] for entry in changed], chunksize=16)
+        for (path, mtime, size, error, images) in results:
+            if (error != None):
+                out.error("Unable to index %s: %s" % (path, error))
+                errorsFound += 1
+                continue
+
+            if (path in known):
+                removeFile(db, known[path][0])
+            fileId = db.execute("INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)", (path, mtime, size)).lastrowid
+            for (offset, imageSize, rows) in images:
+                imageId = db.execute("INSERT INTO images (file, offset, size) VALUES (?, ?, ?)", (fileId, offset, imageSize)).lastrowid
+                db.executemany("INSERT INTO keywords (image, record, keyword, data, text) VALUES (?, ?, ?, ?, ?)",
+                               [(imageId,) + row for row in rows])
+            imagesFound += len(images)
+
+            done += 1
+            if ((done % COMMIT_FILES) == 0):
+                db.commit()
+    db.commit()
+
+    out.msg("Indexed %d new or changed files with %d images, %d unchanged, %d removed in %.3fs" %
+            (done, imagesFound, len(files) - len(changed), len(removed), time.time() - startTime))
+    return errorsFound
+
+# Run a query and print the rows
+def printQuery(db, query, parameters = ()):
+    cursor = db.execute(query, parameters)
+    if (cursor.description != None):
+        out.msg("\t".join(column[0] for column in cursor.description))
+    rows = 0
+    for row in cursor:
+        out.msg("\t".join(("0x" + value.hex()) if (isinstance(value, bytes)) else str(value) for value in row))
+        rows += 1
+    out.msg("%d rows" % rows)
+
+# Split RECORD:KEYWORD into its parts
+def splitKeyword(entry):
+    (recordName, sep, keywordName) = entry.partition(":")
+    if (sep == "" or len(recordName) != 4 or keywordName == ""):
+        return None
+    return (recordName, keywordName)
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Indexes the keywords in VPD dumps into a SQLite database for queries', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./indexVpd.py -b vpd.db --scan /dumps
+                                       ./indexVpd.py -b vpd.db --find VINI:PN=01DH200
+                                       ./indexVpd.py -b vpd.db --duplicates VINI:SN
+                                       ./indexVpd.py -b vpd.db --query "SELECT text, count(*) FROM keywords WHERE keyword = 'CC' GROUP BY text"
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-b', '--database', help='The SQLite database file, created if it does not exist', required=True)
+    actiongroup = reqgroup.add_mutually_exclusive_group(required=True)
+    actiongroup.add_argument('--scan', help='The dumps or directories of dumps to index, only new or changed files are read', nargs="+", metavar="PATH")
+    actiongroup.add_argument('--find', help='List the dumps where the keyword has the value, given as RECORD:KEYWORD=VALUE', metavar="KEYWORD")
+    actiongroup.add_argument('--duplicates', help='List the values of RECORD:KEYWORD found in more than one image', metavar="KEYWORD")
+    actiongroup.add_argument('--query', help='Run a SQL query against the database')
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-w', '--workers', help="The number of worker processes to parse dumps", type=int, default=os.cpu_count())
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    db = sqlite3.connect(args.database)
+    db.executescript(SCHEMA)
+
+    errorsFound = 0
+
+    if (args.scan != None):
+        for path in args.scan:
+            if (os.path.exists(path) != True):
+                out.error("The given path %s does not exist!" % path)
+                errorsFound += 1
+        if (errorsFound):
+            exit(min(errorsFound, 255))
+        errorsFound += updateIndex(db, args.scan, args.workers)
+
+    if (args.find != None):
+        (entry, sep, value) = args.find.partition("=")
+        keyword = splitKeyword(entry)
+        if (keyword == None or sep == ""):
+            out.error("--find takes RECORD:KEYWORD=VALUE, not %s" % args.find)
+            exit(1)
+        # Trailing blanks are part of the keyword data, but nobody types them
+        printQuery(db, "SELECT files.path, images.offset, keywords.text FROM keywords "
+                       "JOIN images ON images.id = keywords.image JOIN files ON files.id = images.file "
+                       "WHERE keywords.record = ? AND keywords.keyword = ? AND rtrim(keywords.text) = ? "
+                       "ORDER BY files.path, images.offset", keyword + (value.rstrip(),))
+
+    if (args.duplicates != None):
+        keyword = splitKeyword(args.duplicates)
+        if (keyword == None):
+            out.error("--duplicates takes RECORD:KEYWORD, not %s" % args.duplicates)
+            exit(1)
+        printQuery(db, "SELECT keywords.text, count(*) AS images, group_concat(files.path, ' ') AS files FROM keywords "
+                       "JOIN images ON images.id = keywords.image JOIN files ON files.id = images.file "
+                       "WHERE keywords.record = ? AND keywords.keyword = ? "
+                       "GROUP BY keywords.data HAVING count(*) > 1 ORDER BY images DESC", keyword)
+
+    if (args.query != None):
+        try:
+            printQuery(db, args.query)
+        except sqlite3.Error as e:
+            out.error("The query failed: %s" % e)
+            errorsFound += 1
+
+    db.close()
+    # The return code only has 8 bits, 256 errors can't look like it worked
+    exit(min(errorsFound, 255))
+
+if __name__ == "__main__":
+    main()
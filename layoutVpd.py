@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# Program to build a flash or eeprom part image holding VPD images, and any other data, at fixed offsets
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# The layout is an xml file that gives the part and what goes where in it
+#
+#   <layout>
+#     <name>FILENAME</name>
+#     <size>64KB</size>
+#     <fill>FF</fill>
+#     <slot offset="0x0000" size="16KB"><tvpd>system.tvpd</tvpd></slot>
+#     <slot offset="0x4000"><tvpd>backplane.json</tvpd></slot>
+#     <slot offset="0xF000"><bin>other.bin</bin></slot>
+#   </layout>
+#
+# A tvpd slot is built from the template like createVpd.py does, a bin slot is the file as it is
+# A slot size reserves that much of the part, the image has to fit in it.  Everything not in an image is the fill byte
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import createVpd
+import vpdjson
+import argparse
+import textwrap
+import mmap
+import re
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class Slot:
+    """A place in the part and what goes in it"""
+    def __init__(self, offset, size, kind, fileName):
+        self.offset = offset
+        # The bytes reserved for the slot, None for just the size of what's in it
+        self.size = size
+        # tvpd or bin, and the file named
+        self.kind = kind
+        self.fileName = fileName
+        # The bytes that go in the slot, once built
+        self.data = None
+
+    def end(self):
+        return self.offset + (self.size if (self.size != None) else len(self.data))
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Turn a slot offset into a number, decimal or 0x hex
+def parseOffset(text):
+    if (text == None or re.match("^(0x[0-9a-fA-F]+|[0-9]+)$", text.strip()) == None):
+        return None
+    return int(text.strip(), 0)
+
+# Read the layout and check it
+# Returns the errors found, the name of the part, its size, the fill byte and the slots
+def loadLayout(layoutFile):
+    errorsFound = 0
+
+    (rc, layout) = createVpd.parseXml(layoutFile)
+    if (rc):
+        return (rc, None, None, None, None)
+    if (layout.tag != "layout"):
+        out.error("%s does not start with a <layout> tag.  No further checking will be done until fixed!" % layoutFile)
+        return (1, None, None, None, None)
+
+    partName = layout.findtext("name")
+    if (partName == None):
+        out.error("The tag <name> is required in the layout")
+        errorsFound += 1
+    elif (partName == "FILENAME"):
+        partName = os.path.splitext(os.path.basename(layoutFile))[0]
+
+    partSize = 0
+    if (layout.findtext("size") == None):
+        out.error("The tag <size> is required in the layout")
+        errorsFound += 1
+    else:
+        (rc, partSize) = createVpd.checkSize(layout.findtext("size"))
+        errorsFound += rc
+        if (not rc and partSize == 0):
+            out.error("The part <size> can't be 0")
+            errorsFound += 1
+
+    fill = layout.findtext("fill", "FF").strip()
+    if (re.match("^[0-9a-fA-F]{2}$", fill) == None):
+        out.error("The <fill> byte must be 2 hex digits, not %s" % fill)
+        errorsFound += 1
+        fill = "FF"
+    fill = bytes(bytearray([int(fill, 16)]))
+
+    slots = list()
+    for slot in layout.iter("slot"):
+        offset = parseOffset(slot.attrib.get("offset"))
+        if (offset == None):
+            out.error("The slot offset %s is not a decimal or 0x hex number" % slot.attrib.get("offset"))
+            errorsFound += 1
+            continue
+
+        size = None
+        if (slot.attrib.get("size") != None):
+            (rc, size) = createVpd.checkSize(slot.attrib.get("size"))
+            errorsFound += rc
+
+        contents = [child for child in slot if (child.tag in ["tvpd", "bin"])]
+        if (len(contents) != 1 or contents[0].text == None):
+            out.error("The slot at 0x%x must have one <tvpd> or <bin> file" % offset)
+            errorsFound += 1
+            continue
+        slots.append(Slot(offset, size, contents[0].tag, contents[0].text.strip()))
+
+    if (len(slots) == 0 and not errorsFound):
+        out.error("At least one <slot> must be given in the layout")
+        errorsFound += 1
+
+    return (errorsFound, partName, partSize, fill, slots)
+
+# Build the vpd image of a tvpd slot in process, the same way createVpd.py does
+# The files the template includes are looked for next to it first, then in the -i path
+# Returns the errors found
+def buildSlot(slot, inputPath):
+    fullPathFile = createVpd.findFile(slot.fileName, inputPath)
+    if (fullPathFile == None):
+        out.error("The file %s could not be found!" % slot.fileName)
+        return 1
+    if (slot.kind == "bin"):
+        slot.data = open(fullPathFile, mode='rb').read()
+        out.msg("Read %d bytes from %s" % (len(slot.data), fullPathFile))
+        return 0
+
+    createVpd.clInputPath = os.path.dirname(fullPathFile) + os.pathsep + inputPath
+    if (vpdjson.isJson(fullPathFile)):
+        (errorsFound, template) = createVpd.loadJsonManifest(fullPathFile)
+        if (template == None or errorsFound):
+            return max(errorsFound, 1)
+        (errorsFound, vpdName, maxSizeBytes, vpdImage) = createVpd.verifyJsonManifest(template, fullPathFile)
+        if (errorsFound):
+            return errorsFound
+        image = vpdImage.pack()
+    else:
+        (errorsFound, manifest) = createVpd.loadManifest(fullPathFile)
+        if (manifest == None or errorsFound):
+            return max(errorsFound, 1)
+        (errorsFound, vpdName, maxSizeBytes) = createVpd.verifyManifest(manifest, fullPathFile)
+        if (errorsFound):
+            return errorsFound
+        (errorsFound, image, vpdImage) = createVpd.createImage(manifest, vpdName=vpdName)
+        if (errorsFound):
+            return errorsFound
+
+    slot.data = image
+    out.msg("Built %s: %d bytes, %d records" % (vpdName, len(image), len(vpdImage.records)))
+    return createVpd.checkImageSize(len(image), maxSizeBytes)
+
+# Check the slots fit in the part, in their reserved size, and don't overlap each other
+# The slots are left sorted by offset
+def checkSlots(slots, partSize):
+    errorsFound = 0
+
+    slots.sort(key=lambda slot: slot.offset)
+    # The slot that reaches furthest into the part so far, the next one has to start after it
+    previous = None
+    for slot in slots:
+        if (slot.size != None and len(slot.data) > slot.size):
+            out.error("%s is %d bytes, more than the %d bytes of its slot at 0x%x" % (slot.fileName, len(slot.data), slot.size, slot.offset))
+            errorsFound += 1
+        if (slot.end() > partSize):
+            out.error("%s at 0x%x to 0x%x runs past the end of the %d byte part" % (slot.fileName, slot.offset, slot.end(), partSize))
+            errorsFound += 1
+        if (previous != None and previous.end() > slot.offset):
+            out.error("%s at 0x%x to 0x%x overlaps %s at 0x%x to 0x%x" %
+                      (slot.fileName, slot.offset, slot.end(), previous.fileName, previous.offset, previous.end()))
+            errorsFound += 1
+        if (previous == None or slot.end() > previous.end()):
+            previous = slot
+
+    return errorsFound
+
+# Write the part image in one pass over a memory mapped file
+# Each gap gets the fill byte and each slot its data, nothing is written twice
+# The file is built as a temp file and moved into place like createVpd.py outputs
+def writePart(partFile, partSize, fill, slots):
+    tempFile = createVpd.tempFileName(partFile)
+    with open(tempFile, "w+b") as f:
+        f.truncate(partSize)
+        part = mmap.mmap(f.fileno(), partSize)
+        offset = 0
+        for slot in slots:
+            part[offset:slot.offset] = fill * (slot.offset - offset)
+            part[slot.offset:(slot.offset + len(slot.data))] = slot.data
+            offset = slot.offset + len(slot.data)
+        part[offset:partSize] = fill * (partSize - offset)
+        part.flush()
+        part.close()
+    createVpd.replaceFile(tempFile, partFile)
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Builds a part image with VPD images at the offsets given in a layout', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./layoutVpd.py -l layout/layout.xml -i examples -o /tmp
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-l', '--layout', help='The layout xml giving the part and the slots in it', required=True)
+    reqgroup.add_argument('-o', '--outpath', help='The output path for the part image', required=True)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-i', '--inpath', help="The search path to use for the files referenced in the layout and its templates")
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # Make sure the path exists, we aren't going to create it
+    if (os.path.exists(args.outpath) != True):
+        out.error("The given output path %s does not exist!" % args.outpath)
+        out.error("Please create the output directory and run again")
+        exit(1)
+
+    # Same input path rules as createVpd, the CWD is always looked at
+    inputPath = "."
+    if (args.inpath != None):
+        inputPath = args.inpath + os.pathsep + "."
+    createVpd.clInputPath = inputPath
+
+    ################################################
+    # Read the layout
+    out.setIndent(0)
+    out.msg("==== Stage 1: Parsing the layout")
+    out.setIndent(2)
+
+    (errorsFound, partName, partSize, fill, slots) = loadLayout(args.layout)
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found in the layout.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        exit(errorsFound)
+
+    ################################################
+    # Build what goes in each slot
+    out.setIndent(0)
+    out.msg("==== Stage 2: Building the slot images")
+    out.setIndent(2)
+
+    for slot in slots:
+        errorsFound += buildSlot(slot, inputPath)
+    out.setIndent(2)
+    if (not errorsFound):
+        errorsFound += checkSlots(slots, partSize)
+    if (errorsFound):
+        out.msg("")
+        out.error("%d error%s found building the slots.  Please review the above errors and correct them." %
+                  (errorsFound, "s" if (errorsFound > 1) else ""))
+        exit(errorsFound)
+
+    ################################################
+    # Put it all together
+    out.setIndent(0)
+    out.msg("==== Stage 3: Writing the part image")
+    out.setIndent(2)
+
+    for slot in slots:
+        out.msg("0x%08x to 0x%08x: %s (%d bytes)" % (slot.offset, slot.end(), slot.fileName, len(slot.data)))
+    partFile = os.path.join(args.outpath, partName + ".bin")
+    writePart(partFile, partSize, fill, slots)
+    createVpd.reportOutput("part image", partFile)
+
+if __name__ == "__main__":
+    main()
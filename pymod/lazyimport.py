@@ -0,0 +1,36 @@
+# Python module to put off importing a module until it is used
+# The tools are run hundreds of times by station scripts, and a lot of those runs never touch the xml code
+# A module imported with lazyImport is only loaded the first time one of its attributes is looked up
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import sys
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class LazyModule(object):
+    """Stands in for a module until one of its attributes is used, then passes everything on to it"""
+
+    def __init__(self, name):
+        self._lazyName = name
+        self._lazyModule = None
+
+    def __getattr__(self, attr):
+        # Only called for what isn't found on the LazyModule itself, which is everything from the module
+        if (self._lazyModule == None):
+            __import__(self._lazyName)
+            self._lazyModule = sys.modules[self._lazyName]
+        return getattr(self._lazyModule, attr)
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+def lazyImport(name):
+    """
+    Returns the module with the given name, or a LazyModule that loads it when it's first used
+    """
+    if (name in sys.modules):
+        return sys.modules[name]
+    return LazyModule(name)
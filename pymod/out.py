@@ -5,6 +5,7 @@
 # Imports - Imports - Imports - Imports - Imports - Imports
 ############################################################
 import os
+import sys
 
 ############################################################
 # Variables - Variables - Variables - Variables - Variables
@@ -14,26 +15,58 @@ class VarBox:
 
 __m = VarBox()
 __m.indent = 0
+# When capturing, lines are saved here instead of printed
+__m.capture = None
+# Where lines are printed, None for stdout
+__m.stream = None
 
 ############################################################
 # Function - Functions - Functions - Functions - Functions
 ############################################################
+# Common function to print or capture a line of output
+def __emit(line):
+    if (__m.capture != None):
+        __m.capture.append(line)
+    else:
+        # Written directly instead of with print, which is a statement on python 2
+        (__m.stream if (__m.stream != None) else sys.stdout).write(line + "\n")
+
 # Common function for error printing
 def error(message):
-    print((' ' * __m.indent) + ("ERROR: %s" % message))
+    __emit((' ' * __m.indent) + ("ERROR: %s" % message))
 
 def warn(message):
-    print((' ' * __m.indent) + ("WARNING: %s" % message))
+    __emit((' ' * __m.indent) + ("WARNING: %s" % message))
 
 # Common function for debug printing
 def debug(message):
-    print((' ' * __m.indent) + ("DEBUG: %s" % message))
+    __emit((' ' * __m.indent) + ("DEBUG: %s" % message))
 
 def msg(message):
-    print((' ' * __m.indent) + message)
+    __emit((' ' * __m.indent) + message)
 
 def setIndent(num):
     """ 
     Sets the output indent on all printed lines
     """
     __m.indent = num
+
+def startCapture():
+    """
+    Saves all output lines instead of printing them, until stopCapture is called
+    """
+    __m.capture = list()
+
+def stopCapture():
+    """
+    Goes back to printing output lines and returns the lines saved since startCapture
+    """
+    lines = __m.capture
+    __m.capture = None
+    return (lines if (lines != None) else [])
+
+def setStream(stream):
+    """
+    Prints all output lines to stream, like sys.stderr when stdout is used for data
+    """
+    __m.stream = stream
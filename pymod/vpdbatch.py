@@ -0,0 +1,315 @@
+# Python module for the batch builds of createVpd.py --jobs, one image for each job from a template and keyword values
+# A jobs file has one json job per line, the same template and keywords as a serveVpd.py request plus the name of the image
+#
+#   {"name" : "YL1234", "template" : "bmc/p10_bmc_template.tvpd", "keywords" : {"VINI" : {"SN" : "YL1234"}}}
+#
+# The journal is an append only file with a json line for each job finished, so a build that is stopped part way
+# can be run again and only build the jobs that failed or never ran
+#
+#   {"name" : "YL1234", "input" : sha256, "output" : path, "hash" : sha256, "size" : bytes, "mtime" : ns}
+#
+# A work queue is a directory shared by the hosts building one batch, with no server or scheduler
+#   pending/  the chunks of jobs waiting to be built, each a jobs file
+#   claimed/  the chunks being built, as CHUNK@WORKER for the worker that claimed them.  The mtime is the worker's last heartbeat
+#   done/     the chunks that are finished
+#   failed/   the jobs of each chunk that failed, a jobs file to fix and queue again
+#   workers/  the journal and throughput stats of each worker
+# A chunk is claimed by renaming it from pending to claimed, the rename is atomic so only one worker gets it
+# The claim is a lease, a chunk whose worker hasn't touched it in the lease time is renamed back to pending
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+import re
+import time
+from lazyimport import lazyImport
+# Only loaded for a batch build
+json = lazyImport("json")
+hashlib = lazyImport("hashlib")
+socket = lazyImport("socket")
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# A job name is the name of its image file, so it can't have a path in it or be hidden
+JOB_NAME = re.compile("^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
+
+# The directories of a work queue
+QUEUE_DIRS = ["pending", "claimed", "done", "failed", "workers"]
+
+# The extension of a chunk of jobs
+CHUNK_EXTENSION = ".jobs"
+
+# Between the chunk name and the worker name of a claimed chunk.  A host name can't have one, so the last one splits them
+CLAIM_SEPARATOR = "@"
+
+# The seconds a worker waits to look at the queue again, when the chunks left are all claimed by other workers
+POLL_TIME = 1.0
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class Journal(object):
+    """The jobs a batch build has finished, read in when opened and added to as more finish"""
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        # The last entry for each job name
+        self.entries = dict()
+        self.load()
+        self.file = open(fileName, "a")
+        # A build that died while writing an entry leaves part of a line, the next entry has to start on its own line
+        if (self.file.tell() and not self.endsWithNewline()):
+            self.file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def load(self):
+        """
+        Reads the entries already in the journal, a line that isn't a whole entry is skipped
+        """
+        if (not os.path.exists(self.fileName)):
+            return
+        with open(self.fileName, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if (isinstance(entry, dict) and "name" in entry):
+                    self.entries[entry["name"]] = entry
+
+    def endsWithNewline(self):
+        with open(self.fileName, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return (f.read(1) == b"\n")
+
+    def done(self, name, inputHash, outputFile):
+        """
+        Returns if a job was finished with the same input into outputFile, and it is still the file that was written
+        Only the size and mtime of the output are checked, reading back every image would cost as much as building it
+        """
+        entry = self.entries.get(name)
+        if (entry == None or entry.get("input") != inputHash or entry.get("output") != outputFile):
+            return False
+        try:
+            st = os.stat(entry["output"])
+        except OSError:
+            return False
+        return (st.st_size == entry.get("size") and st.st_mtime_ns == entry.get("mtime"))
+
+    def add(self, name, inputHash, outputFile, outputHash):
+        """
+        Records a finished job, after its output is in place
+        Each entry is flushed as it is added, so a build that is killed loses at most the jobs still running
+        """
+        st = os.stat(outputFile)
+        entry = {"name" : name, "input" : inputHash, "output" : outputFile, "hash" : outputHash,
+                 "size" : st.st_size, "mtime" : st.st_mtime_ns}
+        self.entries[name] = entry
+        self.file.write(json.dumps(entry, sort_keys=True) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if (self.file != None):
+            self.file.close()
+            self.file = None
+
+class WorkQueue(object):
+    """The shared directory the workers of a batch build claim chunks of jobs from"""
+
+    def __init__(self, path, leaseTime = 60):
+        self.path = path
+        # The seconds a claimed chunk can go without a heartbeat before it is given to another worker
+        self.leaseTime = leaseTime
+        for name in QUEUE_DIRS:
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+
+    def queueDir(self, name):
+        return os.path.join(self.path, name)
+
+    def chunks(self, name):
+        """
+        Returns the sorted file names in one of the queue directories, without the temp files being written there
+        """
+        return sorted(fileName for fileName in os.listdir(self.queueDir(name)) if (not fileName.startswith(".")))
+
+    def writeFile(self, name, fileName, data):
+        """
+        Writes a file into one of the queue directories as a temp file renamed into place, so it's never seen part written
+        """
+        outputFile = os.path.join(self.queueDir(name), fileName)
+        tempFile = os.path.join(self.queueDir(name), ".%s.%s.tmp" % (fileName, workerName()))
+        with open(tempFile, "w") as f:
+            f.write(data)
+        os.rename(tempFile, outputFile)
+        return outputFile
+
+    def submit(self, chunkName, jobs):
+        """
+        Adds a chunk of jobs to pending
+        """
+        self.writeFile("pending", chunkName, "".join(json.dumps(job, sort_keys=True) + "\n" for job in jobs))
+
+    def claim(self, worker):
+        """
+        Takes the first pending chunk another worker doesn't get to first
+        Returns the chunk name and the claimed file, None when there aren't any pending
+        """
+        for chunkName in self.chunks("pending"):
+            claimedFile = os.path.join(self.queueDir("claimed"), chunkName + CLAIM_SEPARATOR + worker)
+            try:
+                os.rename(os.path.join(self.queueDir("pending"), chunkName), claimedFile)
+            except FileNotFoundError:
+                # Another worker renamed it first
+                continue
+            # The rename keeps the mtime of the pending file, the lease starts now
+            os.utime(claimedFile)
+            return (chunkName, claimedFile)
+        return None
+
+    def renew(self, claimedFile):
+        """
+        The heartbeat of a worker, which keeps the lease on its chunk
+        Returns False when the lease had already expired and the chunk was given back to pending
+        """
+        try:
+            os.utime(claimedFile)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def expired(self):
+        """
+        Returns the (chunk name, claimed file, worker) of the leases that have expired, the workers that had them are taken to be dead
+        """
+        leases = list()
+        now = time.time()
+        for fileName in self.chunks("claimed"):
+            claimedFile = os.path.join(self.queueDir("claimed"), fileName)
+            try:
+                heartbeat = os.stat(claimedFile).st_mtime
+            except FileNotFoundError:
+                continue
+            if ((now - heartbeat) > self.leaseTime):
+                (chunkName, separator, worker) = fileName.rpartition(CLAIM_SEPARATOR)
+                leases.append((chunkName, claimedFile, worker))
+        return leases
+
+    def reclaim(self, chunkName, claimedFile):
+        """
+        Gives an expired chunk back to pending
+        Returns False when another worker reclaimed it first, or its worker finished it after all
+        """
+        try:
+            os.rename(claimedFile, os.path.join(self.queueDir("pending"), chunkName))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def finish(self, chunkName, claimedFile, failedJobs):
+        """
+        Moves a claimed chunk to done, with the jobs that failed in it written to failed
+        Returns False when the lease had expired and the chunk went back to pending, it'll be built again
+        """
+        if (len(failedJobs)):
+            self.writeFile("failed", chunkName, "".join(json.dumps(job, sort_keys=True) + "\n" for job in failedJobs))
+        try:
+            os.rename(claimedFile, os.path.join(self.queueDir("done"), chunkName))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def active(self):
+        """
+        Returns if there are chunks pending or claimed, the queue isn't done until they are all done
+        """
+        return (len(self.chunks("pending")) > 0 or len(self.chunks("claimed")) > 0)
+
+    def journalFile(self, worker):
+        return os.path.join(self.queueDir("workers"), worker + ".journal")
+
+    def writeStats(self, worker, stats):
+        self.writeFile("workers", worker + ".stats", json.dumps(stats, sort_keys=True) + "\n")
+
+    def readStats(self):
+        """
+        Returns the stats of every worker that has written them, in worker name order
+        """
+        stats = list()
+        for fileName in self.chunks("workers"):
+            if (fileName.endswith(".stats")):
+                with open(os.path.join(self.queueDir("workers"), fileName), "r") as f:
+                    stats.append(json.loads(f.read()))
+        return stats
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# The name of this process as a worker, unique across all the hosts sharing a queue
+# It is also in the temp file names, so a temp file can be told apart from the ones of other workers writing the same file
+def workerName():
+    return "%s.%d" % (socket.gethostname(), os.getpid())
+
+# Read a jobs file
+# Returns a list of errors and the list of jobs, each a dict with a name, a template (None if not given) and keywords
+def loadJobs(fileName):
+    errors = list()
+    jobs = list()
+    names = set()
+
+    with open(fileName, "r") as f:
+        for (lineNumber, line) in enumerate(f, 1):
+            if (line.strip() == "" or line.lstrip().startswith("#")):
+                continue
+            where = "%s line %d" % (fileName, lineNumber)
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                errors.append("%s is not a json job: %s" % (where, e))
+                continue
+            if (not isinstance(job, dict)):
+                errors.append("%s must be a json object" % where)
+                continue
+
+            unknown = sorted(set(job) - set(["name", "template", "keywords"]))
+            if (len(unknown)):
+                errors.append("%s has unknown keys %s" % (where, ", ".join(unknown)))
+            name = job.get("name")
+            if (not isinstance(name, str) or JOB_NAME.match(name) == None):
+                errors.append("%s needs a name made of letters, numbers, _, . and -" % where)
+                continue
+            if (name in names):
+                errors.append("%s has the name %s of an earlier job" % (where, name))
+                continue
+            names.add(name)
+            template = job.get("template")
+            if (template != None and not isinstance(template, str)):
+                errors.append("%s template must be a file name" % where)
+            keywords = job.get("keywords", dict())
+            if (not isinstance(keywords, dict) or not all(isinstance(keywords[record], dict) for record in keywords)):
+                errors.append("%s keywords must be a dictionary of records, each a dictionary of keywords" % where)
+                continue
+            # The data is given like kwdata in a template, ascii text or hex digits, never a number or a list
+            badValues = ["%s:%s" % (record, keyword) for record in sorted(keywords) for keyword in sorted(keywords[record])
+                         if (not isinstance(keywords[record][keyword], str))]
+            if (len(badValues)):
+                errors.append("%s keyword data must be a string for %s" % (where, ", ".join(badValues)))
+                continue
+            jobs.append({"name" : name, "template" : template, "keywords" : keywords})
+
+    return (errors, jobs)
+
+# The hash of everything that goes into the image of a job
+# templateHash is the hash of the image the template builds on its own, which covers every file it includes
+def inputHash(templateHash, job):
+    return hashlib.sha256((templateHash + json.dumps(job["keywords"], sort_keys=True)).encode("utf-8")).hexdigest()
+
+# The hash of an image written for a job
+def outputHash(data):
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,163 @@
+# Python module to read and write vpd bundles
+# A bundle holds all the output files of one or more createVpd.py runs in a single append only file
+# The layout is the magic, the file data back to back, then the index and a fixed size trailer
+#   index entry: name length (2), name, offset (8), length (8)
+#   trailer:     index offset (8), entry count (4), magic (8)
+# Appending writes the new files after the old trailer, then a new index of everything and a new trailer
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+import sys
+import mmap
+import struct
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+BUNDLE_MAGIC = b"VPDBNDL1"
+
+# The fixed size parts of an index entry and the trailer
+ENTRY_NAME = struct.Struct("<H")
+ENTRY_AREA = struct.Struct("<QQ")
+TRAILER = struct.Struct("<QI8s")
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class BundleError(Exception):
+    """Raised when a file isn't a good bundle"""
+    pass
+
+class BundleWriter(object):
+    """Adds files to a new or existing bundle, the index is written on close"""
+
+    def __init__(self, path):
+        # The name of the bundle, - for stdout
+        self.path = path
+        # The name of each file in the bundle and its (offset, length)
+        self.entries = dict()
+
+        if (path == "-"):
+            # Streaming, so nothing can be appended to
+            self.stream = sys.stdout.buffer
+            self.offset = 0
+        elif (os.path.exists(path) and os.path.getsize(path) > 0):
+            # Keep everything already in the bundle, the new index will include it
+            with BundleReader(path) as reader:
+                self.entries.update(reader.entries)
+            self.stream = open(path, "ab")
+            self.offset = self.stream.tell()
+        else:
+            self.stream = open(path, "wb")
+            self.offset = 0
+
+        if (self.offset == 0):
+            self.write(BUNDLE_MAGIC)
+
+    def write(self, data):
+        self.stream.write(data)
+        self.offset += len(data)
+
+    def add(self, name, data):
+        """
+        Adds a file to the bundle, replacing any earlier file of the same name in the index
+        data can be anything with the buffer protocol, like a memoryview of part of an image
+        """
+        self.entries[name] = (self.offset, len(data))
+        self.write(data)
+
+    def addWritten(self, name, offset):
+        """
+        Adds everything written with write since offset as a file, for files written a piece at a time
+        """
+        self.entries[name] = (offset, self.offset - offset)
+
+    def close(self):
+        """
+        Writes the index and trailer, the bundle is not readable until this is done
+        """
+        indexOffset = self.offset
+        for (name, area) in self.entries.items():
+            encodedName = name.encode("utf-8")
+            self.write(ENTRY_NAME.pack(len(encodedName)) + encodedName + ENTRY_AREA.pack(*area))
+        self.write(TRAILER.pack(indexOffset, len(self.entries), BUNDLE_MAGIC))
+
+        if (self.stream is sys.stdout.buffer):
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+class BundleReader(object):
+    """
+    Reads files out of a bundle by name, through a read only mmap of the bundle
+    The views returned by get() have to be released before the reader is closed
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise BundleError("The bundle %s is empty!" % path)
+        self.view = memoryview(self.map)
+        # The name of each file in the bundle and its (offset, length)
+        self.entries = dict()
+
+        try:
+            self.readIndex()
+        except BundleError:
+            self.close()
+            raise
+
+    def readIndex(self):
+        if (len(self.map) < (len(BUNDLE_MAGIC) + TRAILER.size) or self.map[0:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC):
+            raise BundleError("%s is not a vpd bundle!" % self.path)
+        (indexOffset, entryCount, magic) = TRAILER.unpack_from(self.map, len(self.map) - TRAILER.size)
+        if (magic != BUNDLE_MAGIC or indexOffset > (len(self.map) - TRAILER.size)):
+            raise BundleError("The bundle %s has no index at the end, it may not have been closed!" % self.path)
+
+        offset = indexOffset
+        try:
+            for entry in range(entryCount):
+                nameLength = ENTRY_NAME.unpack_from(self.map, offset)[0]
+                offset += ENTRY_NAME.size
+                name = self.map[offset:(offset + nameLength)].decode("utf-8")
+                offset += nameLength
+                self.entries[name] = ENTRY_AREA.unpack_from(self.map, offset)
+                offset += ENTRY_AREA.size
+        except (struct.error, UnicodeDecodeError):
+            raise BundleError("The index in bundle %s is corrupt!" % self.path)
+
+    def names(self):
+        """
+        Returns the names of the files in the bundle, in the order they were added
+        """
+        return list(self.entries.keys())
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def get(self, name):
+        """
+        Returns a memoryview of the file with the given name, nothing is copied out of the bundle
+        """
+        entry = self.entries.get(name)
+        if (entry == None):
+            raise KeyError("%s is not in the bundle %s" % (name, self.path))
+        (offset, length) = entry
+        return self.view[offset:(offset + length)]
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,321 @@
+# Python module to read vpd from slow devices, like the sysfs eeprom files on a BMC, a piece at a time
+# Every byte read from an eeprom costs bus time, so only the VHDR, the VTOC and the records or keywords asked for are read
+# The reads are positioned, adjacent ones are coalesced into one and everything read is kept so it's never read twice
+# Any file works in place of a device, which is how it is tested
+# A simulated device counts the i2c transactions the reads would take, to compare how different layouts of an image read
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+import struct
+import vpdmodel
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The offsets in the VTOC are 16 bits, so nothing past this is ever read
+# Used as the size of a device that doesn't give one
+MAX_IMAGE_SIZE = 65536
+
+# The fewest bytes read at once, so walking small keywords doesn't cost a read each
+READ_AHEAD = 64
+
+# The VHDR with its ecc, the first thing read from every device
+VHDR_SIZE = vpdmodel.VHDR_ECC_SIZE + 44
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class DeviceReader(object):
+    """Reads a device or file with positioned reads, keeping everything read in memory"""
+
+    def __init__(self, fileName, readAhead = READ_AHEAD):
+        self.fileName = fileName
+        # Ranges closer together than this are read as one, the bytes between cost less than another read
+        self.readAhead = readAhead
+        self.size = min(self.open(), MAX_IMAGE_SIZE) or MAX_IMAGE_SIZE
+        # What has been read, at the offsets it was read from
+        self.buffer = bytearray(self.size)
+        # The (start, end) ranges of the buffer that have been read, sorted and merged
+        self.extents = list()
+        # The number of reads done and the bytes they returned
+        self.reads = 0
+        self.bytesRead = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """
+        Indexes and slices like bytes, so the vpdmodel parsing functions can be given a reader
+        """
+        if (isinstance(key, slice)):
+            (start, stop, step) = key.indices(self.size)
+            return self.read(start, max(stop - start, 0))[::step]
+        if (key < 0):
+            key += self.size
+        if (key < 0 or key >= self.size):
+            raise IndexError("offset %d is outside the %d bytes of %s" % (key, self.size, self.fileName))
+        # A bytearray gives an int on python 2 as well, where indexing bytes gives a 1 character string
+        return bytearray(self.read(key, 1))[0]
+
+    def open(self):
+        """
+        Opens the device and returns its size, sysfs gives the size of the eeprom and a character device gives 0
+        """
+        self.fd = os.open(self.fileName, os.O_RDONLY)
+        return os.fstat(self.fd).st_size
+
+    def close(self):
+        if (self.fd != None):
+            os.close(self.fd)
+            self.fd = None
+
+    def readDevice(self, offset, length):
+        """
+        The one read of the device everything else goes through
+        """
+        if (hasattr(os, "pread")):
+            return os.pread(self.fd, length, offset)
+        # Python 2 has no pread, the fd is only used by this reader so a seek and read does the same
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.read(self.fd, length)
+
+    def read(self, offset, length):
+        """
+        Returns length bytes at offset, only reading the parts that haven't been read yet
+        The last read is made at least readAhead long, for the reads that walk the keywords of a record
+        """
+        end = min(offset + length, self.size)
+        gaps = self.missing(offset, end)
+        for (index, (start, stop)) in enumerate(gaps):
+            if (index == (len(gaps) - 1)):
+                stop = min(max(stop, start + self.readAhead), self.nextExtent(start), self.size)
+            self.fetch(start, stop)
+        return bytes(self.buffer[offset:end])
+
+    def prefetch(self, ranges):
+        """
+        Reads a list of (offset, length) ranges, merging the ones that are close together into a single read
+        """
+        merged = list()
+        for (offset, length) in sorted(ranges):
+            end = min(offset + length, self.size)
+            if (len(merged) and offset <= (merged[-1][1] + self.readAhead)):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([offset, end])
+
+        for (start, end) in merged:
+            for (gapStart, gapEnd) in self.missing(start, end):
+                self.fetch(gapStart, gapEnd)
+
+    def missing(self, start, end):
+        """
+        Returns the (start, end) ranges between start and end that haven't been read
+        """
+        gaps = list()
+        for (extentStart, extentEnd) in self.extents:
+            if (extentEnd <= start):
+                continue
+            if (extentStart >= end):
+                break
+            if (extentStart > start):
+                gaps.append((start, extentStart))
+            start = extentEnd
+        if (start < end):
+            gaps.append((start, end))
+        return gaps
+
+    def nextExtent(self, offset):
+        """
+        Returns the start of the first range read after offset, the size of the device when there isn't one
+        """
+        for (extentStart, extentEnd) in self.extents:
+            if (extentStart > offset):
+                return extentStart
+        return self.size
+
+    def fetch(self, start, end):
+        """
+        Reads start to end from the device into the buffer
+        A device can return less than asked for, the rest is read until it stops giving data
+        """
+        self.reads += 1
+        offset = start
+        while (offset < end):
+            data = self.readDevice(offset, end - offset)
+            if (not data):
+                break
+            self.buffer[offset:(offset + len(data))] = data
+            offset += len(data)
+        self.bytesRead += (offset - start)
+        if (offset < end):
+            # The device is smaller than it said, nothing past here can be read
+            self.size = offset
+            del self.buffer[offset:]
+
+        # Add the range read, merging it with the ones it touches
+        extents = list()
+        for extent in sorted(self.extents + [(start, offset)]):
+            if (len(extents) and extent[0] <= extents[-1][1]):
+                extents[-1] = (extents[-1][0], max(extents[-1][1], extent[1]))
+            else:
+                extents.append(extent)
+        self.extents = extents
+
+class SimulatedDevice(DeviceReader):
+    """Reads an image in memory as if it were on an eeprom, counting the bus transactions the reads would take"""
+
+    def __init__(self, data, fileName, pageSize, transferSize, readAhead = READ_AHEAD):
+        self.data = data
+        # A transaction can't cross a page boundary or be more than transferSize bytes
+        self.pageSize = pageSize
+        self.transferSize = transferSize
+        self.transactions = 0
+        DeviceReader.__init__(self, fileName, readAhead)
+
+    def open(self):
+        self.fd = None
+        return len(self.data)
+
+    def readDevice(self, offset, length):
+        end = min(offset + length, len(self.data))
+        pos = offset
+        while (pos < end):
+            pos = min(end, pos + self.transferSize, pos - (pos % self.pageSize) + self.pageSize)
+            self.transactions += 1
+        return bytes(self.data[offset:end])
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Read the VHDR and the VTOC of the image on a device
+# Returns the image with the VTOC parsed, and the TOC entries as (name, offset, length, ecc offset, ecc length)
+def readToc(reader, name = None):
+    image = vpdmodel.VpdImage(name)
+
+    header = reader.read(0, VHDR_SIZE)
+    if (len(header) < VHDR_SIZE or
+        header[(vpdmodel.VHDR_SIGNATURE_OFFSET):(vpdmodel.VHDR_SIGNATURE_OFFSET + len(vpdmodel.VHDR_SIGNATURE))] != vpdmodel.VHDR_SIGNATURE):
+        raise vpdmodel.VpdError("No VHDR found at the start of %s!" % reader.fileName)
+    image.version = header[24:26]
+
+    # The VHDR has the one TOC entry, for the VTOC
+    vtoc = vpdmodel.Record("VTOC")
+    vpdmodel.unpackTocEntry(header[29:43], vtoc)
+    reader.prefetch([(vtoc.offset, vtoc.length)])
+    if (reader.read(vtoc.offset + 6, 4) != b"VTOC"):
+        raise vpdmodel.VpdError("Did not find VTOC at the expected offset!")
+    image.vtoc = vpdmodel.Record.parse(reader, vtoc.offset, "VTOC")
+    vpdmodel.unpackTocEntry(header[29:43], image.vtoc)
+
+    toc = image.vtoc.keyword("PT")
+    if (toc == None):
+        raise vpdmodel.VpdError("No PT keyword found in the VTOC!")
+    entries = list()
+    for tocOffset in range(0, len(toc.data) - vpdmodel.TOC_ENTRY_SIZE + 1, vpdmodel.TOC_ENTRY_SIZE):
+        entry = toc.data[tocOffset:(tocOffset + vpdmodel.TOC_ENTRY_SIZE)]
+        entries.append((entry[0:4].decode("latin-1"),) + struct.unpack("<HHHH", entry[6:14]))
+
+    return (image, entries)
+
+# Read the image on a device, with only the records given (None for all of them)
+# The records are read together, so adjacent ones are one read.  The ecc and the space after the image are never read
+def readImage(reader, name = None, recordNames = None):
+    (image, entries) = readToc(reader, name)
+
+    entries = [entry for entry in entries if (recordNames == None or entry[0] in recordNames)]
+    reader.prefetch([(entry[1], entry[2]) for entry in entries])
+    for entry in entries:
+        record = vpdmodel.Record.parse(reader, entry[1], entry[0])
+        (record.offset, record.length, record.eccOffset, record.eccLength) = entry[1:]
+        image.records.append(record)
+
+    # Keep the records in image order
+    image.records.sort(key=lambda record: record.offset)
+    image.size = max([image.vtoc.eccOffset + image.vtoc.eccLength] + [entry[3] + entry[4] for entry in entries])
+
+    return image
+
+# Find keywords in the record at offset, reading only the keyword names and lengths until they are all found
+# Returns a dictionary of the names found to the (offset, length) of their data
+def findKeywords(reader, offset, length, keywordNames):
+    found = dict()
+
+    recordLength = struct.unpack("<H", reader.read(offset + 1, 2))[0]
+    pos = offset + 3
+    end = min(pos + recordLength, offset + length)
+    while (pos < end and len(found) < len(keywordNames)):
+        header = reader.read(pos, 4)
+        keywordName = header[0:2].decode("latin-1")
+        if (keywordName[0:1] == "#"):
+            (dataOffset, dataLength) = (pos + 4, struct.unpack("<H", header[2:4])[0])
+        else:
+            (dataOffset, dataLength) = (pos + 3, bytearray(header)[2])
+        if (keywordName in keywordNames):
+            found[keywordName] = (dataOffset, dataLength)
+        pos = dataOffset + dataLength
+
+    return found
+
+# Read keywords from the image on a device
+# wanted is a list of (record, keyword) names, a keyword of None gives the whole record
+# Returns a dictionary of (record, keyword) to the data read, None for the ones that aren't in the image
+def readKeywords(reader, wanted):
+    (image, entries) = readToc(reader)
+    entries = dict((entry[0], entry) for entry in entries)
+
+    # Walk each record for the keywords in it, the data is read once they are all found so adjacent ones are one read
+    locations = dict()
+    for recordName in sorted(set(recordName for (recordName, keywordName) in wanted)):
+        entry = entries.get(recordName)
+        if (entry == None):
+            continue
+        keywordNames = set(keywordName for (name, keywordName) in wanted if (name == recordName))
+        if (None in keywordNames):
+            locations[(recordName, None)] = (entry[1], entry[2])
+            keywordNames.discard(None)
+        for (keywordName, location) in findKeywords(reader, entry[1], entry[2], keywordNames).items():
+            locations[(recordName, keywordName)] = location
+
+    reader.prefetch(locations.values())
+    return dict((key, (reader.read(*locations[key]) if (key in locations) else None)) for key in wanted)
+
+# Read a file of the record and keyword accesses firmware makes, the same RECORD or RECORD:KEYWORD as readVpd.py -k
+# Each line or comma separated entry is one access, so an entry given more times is accessed more
+# A # at the start of a line or after white space starts a comment, anywhere else it is part of a keyword name like #I
+# Returns the list of (record, keyword) names, a keyword of None for the whole record
+def loadAccesses(fileName):
+    accesses = list()
+    with open(fileName, "r") as f:
+        for line in f:
+            for (index, char) in enumerate(line):
+                if (char == "#" and (index == 0 or line[index - 1].isspace())):
+                    line = line[:index]
+                    break
+            for entry in line.split(","):
+                entry = entry.strip()
+                if (entry == ""):
+                    continue
+                (recordName, sep, keywordName) = entry.partition(":")
+                accesses.append((recordName, keywordName if (keywordName != "") else None))
+    return accesses
+
+# The layout policy for a list of accesses
+# The records accessed go first, the most accessed first, the rest stay in the order they were given after them
+# Returns the records in their new order and the names of the accessed records, the ones to page align
+def layoutRecords(records, accesses):
+    counts = dict()
+    for (recordName, keywordName) in accesses:
+        counts[recordName] = counts.get(recordName, 0) + 1
+    # sorted is stable, so records accessed the same number of times keep their order
+    ordered = sorted(records, key=lambda record: -counts.get(record.name, 0))
+    return (ordered, set(record.name for record in records if (record.name in counts)))
@@ -0,0 +1,91 @@
+# Python module for the json template format, the same vpd/record/keyword template as the xml tvpd in a json file
+# The json C parser gives plain dicts and lists, so a template is checked and turned into the image model without a tree
+#
+#   {"name" : "FILENAME", "size" : "16kb", "VD" : "01", "records" : [
+#     {"name" : "VINI", "rdesc" : "The VINI record", "keywords" : [
+#       {"name" : "RT", "kwdesc" : "The RT keyword", "kwformat" : "ascii", "kwlen" : 4, "kwdata" : "VINI"},
+#       {"name" : "NM", "kwdesc" : "The NM keyword", "kwformat" : "mixed", "kwlen" : 8, "kwdata" : [{"ascii" : "AB"}, {"hex" : "0102"}]},
+#       {"name" : "B1", "kwdesc" : "The B1 keyword", "kwformat" : "bin", "kwlen" : 16, "kwdata" : "b1.bin", "offset" : 16},
+#       {"name" : "HX", "ktvpdfile" : "vini-hx.json"}]},
+#     {"name" : "VSMC", "rtvpdfile" : "record-vsmc.json"},
+#     {"name" : "VMSC", "rbinfile" : "rbinfile-VMSC.rvpd"}]}
+#
+# A rtvpdfile has one record object, a ktvpdfile one keyword object
+# There are no comments in json, so the templates written out don't say where included data came from
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+from lazyimport import lazyImport
+# Only loaded when a json template is read or written
+json = lazyImport("json")
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The extension that marks a template file as json instead of xml
+EXTENSION = ".json"
+
+# The keys allowed at each level of a template
+VPD_KEYS = ["name", "size", "VD", "records"]
+RECORD_KEYS = ["name", "rdesc", "keywords", "rtvpdfile", "rbinfile"]
+KEYWORD_KEYS = ["name", "kwdesc", "kwformat", "kwlen", "kwdata", "offset", "length", "ktvpdfile"]
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+def isJson(fileName):
+    """
+    Returns if a template file is json, by its extension
+    """
+    return fileName.lower().endswith(EXTENSION)
+
+def load(jsonFile):
+    """
+    Reads a json template file and returns what is in it
+    Errors in the json raise the ValueError json gives
+    """
+    with open(jsonFile, "rb") as f:
+        return json.loads(f.read())
+
+def dumps(template):
+    """
+    Returns a template as the utf-8 bytes of its json file
+    """
+    return (json.dumps(template, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+
+def write(template, outputFile):
+    """
+    Writes a template to a file name or binary file object
+    """
+    if (isinstance(outputFile, str)):
+        with open(outputFile, "wb") as f:
+            f.write(dumps(template))
+    else:
+        outputFile.write(dumps(template))
+
+def fromXml(element):
+    """
+    Returns the json template for a <vpd>, <record> or <keyword> xml element
+    The comments are dropped, and a kwlen that is a number is given as one
+    """
+    if (element.tag == "vpd"):
+        template = dict()
+        for child in element:
+            if (child.tag == "record"):
+                template.setdefault("records", list()).append(fromXml(child))
+            elif (isinstance(child.tag, str)):
+                template[child.tag] = child.text
+        return template
+
+    template = {"name" : element.attrib.get("name")}
+    for child in element:
+        if (child.tag == "keyword"):
+            template.setdefault("keywords", list()).append(fromXml(child))
+        elif (child.tag == "kwlen" and child.text != None and child.text.strip().isdigit()):
+            template["kwlen"] = int(child.text)
+        elif (child.tag == "kwdata" and len([kwd for kwd in child if (isinstance(kwd.tag, str))])):
+            template["kwdata"] = [{kwd.tag : kwd.text} for kwd in child if (isinstance(kwd.tag, str))]
+        elif (isinstance(child.tag, str)):
+            template[child.tag] = child.text
+    return template
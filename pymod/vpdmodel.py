@@ -0,0 +1,577 @@
+# Python module to define the in memory model of a VPD image
+# Used by createVpd.py to pack images and reverseVpd.py to parse them
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import sys
+import struct
+import mmap
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The large and small resource tags that start and end every record
+LR_TAG = 0x84
+SR_TAG = 0x78
+
+# The VHDR has 11 bytes of ECC in front of the record
+VHDR_ECC_SIZE = 11
+
+# Each TOC entry is the record name (4), type (2), record offset/length (2/2) and ecc offset/length (2/2)
+TOC_ENTRY_SIZE = 14
+
+# The RT keyword at the start of every VHDR, used to find images in a larger dump
+# It follows the VHDR ecc, the large resource tag and the record length
+VHDR_SIGNATURE = b"RT\x04VHDR"
+VHDR_SIGNATURE_OFFSET = VHDR_ECC_SIZE + 3
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class VpdError(Exception):
+    """Raised when a binary VPD image isn't formatted as expected"""
+    pass
+
+class Keyword(object):
+    """A keyword in a vpd record"""
+    __slots__ = ("name", "data", "format", "offset")
+
+    def __init__(self, name, data, format = None):
+        # The 2 character keyword name
+        self.name = name
+        # The keyword data as bytes, the length of the data is the keyword length
+        self.data = data
+        # How the data is described in a template (ascii, hex or mixed), not stored in the image
+        self.format = format
+        # The offset of the keyword name in the image, set when the image is packed or parsed
+        self.offset = None
+
+    def lengthSize(self):
+        """
+        Keywords that start with # have a 2 byte length, all others are 1 byte
+        """
+        return 2 if (self.name[0] == "#") else 1
+
+    def packedSize(self):
+        """
+        The size of the keyword in the image, name and length included
+        """
+        return 2 + self.lengthSize() + len(self.data)
+
+    def pack(self):
+        """
+        Returns the keyword as it is written in the image
+        """
+        # The < at the front says to pack it little endian
+        if (self.lengthSize() == 2):
+            length = struct.pack("<H", len(self.data))
+        else:
+            length = struct.pack("<B", len(self.data))
+        return bytearray(self.name.encode()) + length + self.data
+
+class Record(object):
+    """A record in a vpd image"""
+    __slots__ = ("name", "keywords", "raw", "offset", "length", "eccOffset", "eccLength")
+
+    def __init__(self, name, keywords = None, raw = None):
+        # The 4 character record name
+        self.name = name
+        # The list of keywords in the record, in image order.  The PF keyword is created when packed and isn't included
+        self.keywords = keywords if (keywords != None) else list()
+        # The already packed record from a rbinfile.  When given, it is used as is instead of the keywords
+        self.raw = raw
+        # The offset/length of the record and its ecc in the image, set when the image is packed or parsed
+        self.offset = None
+        self.length = None
+        self.eccOffset = None
+        self.eccLength = None
+
+    def keyword(self, name):
+        """
+        Returns the keyword with the given name, or None if it isn't in the record
+        """
+        for keyword in self.keywords:
+            if (keyword.name == name):
+                return keyword
+        return None
+
+    def pack(self, offset = None):
+        """
+        Returns the record as it is written in the image
+        If the offset of the record in the image is given, the keyword offsets are set
+        """
+        if (self.raw != None):
+            return bytearray(self.raw)
+
+        # The large resource tag and the record length, which we will come back and update at the end
+        record = bytearray([LR_TAG, 0, 0])
+
+        # The keywords
+        for keyword in self.keywords:
+            if (offset != None):
+                keyword.offset = offset + len(record)
+            record += keyword.pack()
+
+        # The PF keyword
+        record += Keyword("PF", b"\0" * calcPadFill(record)).pack()
+
+        # The small resource tag
+        record.append(SR_TAG)
+
+        # Update the record length
+        # Total length minus 4, LR(1), SR(1), Length (2)
+        record[1:3] = struct.pack("<H", len(record) - 4)
+
+        return record
+
+    @classmethod
+    def parse(cls, data, offset, name = None):
+        """
+        Creates a record from the one found at offset in data
+        data can be anything that can be indexed and sliced like bytes (bytearray, mmap, memoryview)
+        """
+        data = byteView(data)
+        if (data[offset] != LR_TAG):
+            raise VpdError("Large resource tag not found for record %s at offset %d!" % (name, offset))
+
+        record = cls(name)
+        record.offset = offset
+
+        # Get the length, then loop and read until we get until the end of the record
+        recordLength = struct.unpack("<H", bytes(data[(offset + 1):(offset + 3)]))[0]
+        offset += 3
+        recordEnd = offset + recordLength
+        if (recordEnd >= len(data)):
+            raise VpdError("Record %s at offset %d runs past the end of the image!" % (name, record.offset))
+
+        while (offset < recordEnd):
+            # Read the keyword
+            keywordOffset = offset
+            keywordName = bytes(data[offset:(offset + 2)]).decode("latin-1")
+            offset += 2
+
+            # Determine if length is 1 or 2 bytes
+            if (keywordName[0] == "#"):
+                keywordLength = struct.unpack("<H", bytes(data[offset:(offset + 2)]))[0]
+                offset += 2
+            else:
+                keywordLength = data[offset]
+                offset += 1
+
+            # Get the keyword data out
+            keywordData = bytes(data[offset:(offset + keywordLength)])
+            offset += keywordLength
+
+            # If the keyword is PF, we are at the end and skip it
+            if (keywordName == "PF"):
+                continue
+
+            keyword = Keyword(keywordName, keywordData)
+            keyword.offset = keywordOffset
+            record.keywords.append(keyword)
+
+        # We should be done with all the keywords, which means it's pointing to the SR tag
+        if (offset >= len(data) or data[offset] != SR_TAG):
+            raise VpdError("Small resource tag not found!")
+
+        # Default the length to what was found in the record, the TOC entry will update it if available
+        record.length = offset + 1 - record.offset
+        if (name == None):
+            rt = record.keyword("RT")
+            record.name = rt.data.decode("latin-1") if (rt != None) else None
+
+        return record
+
+class VpdImage(object):
+    """A complete vpd image"""
+    __slots__ = ("name", "version", "records", "vtoc", "size")
+
+    def __init__(self, name = None, version = b"\x00\x00", records = None):
+        # The name used for the files created from the image, not stored in the image
+        self.name = name
+        # The data for the VD keyword in the VHDR
+        self.version = version
+        # The records listed in the VTOC, in image order
+        self.records = records if (records != None) else list()
+        # The VTOC record, created when the image is packed or parsed
+        self.vtoc = None
+        # The total size of the image, set when the image is packed or parsed
+        self.size = None
+
+    def record(self, name):
+        """
+        Returns the record with the given name, or None if it isn't in the image
+        """
+        for record in self.records:
+            if (record.name == name):
+                return record
+        return None
+
+    def pack(self, pageSize = None, aligned = ()):
+        """
+        Returns the complete image and sets the record and keyword offsets
+        The image is VHDR, VTOC, the records, then the VTOC ecc and the record ecc
+        The records named in aligned are moved to the next pageSize boundary when that has them span fewer pages
+        """
+        # The VHDR size is fixed, it has just the one TOC entry to the VTOC
+        vhdr = Record("VHDR", [Keyword("RT", b"VHDR"), Keyword("VD", bytes(self.version)),
+                               Keyword("PT", b"\0" * TOC_ENTRY_SIZE)])
+        # The VTOC has a TOC entry for each record.  The offsets get filled in once all the records are packed
+        vtoc = Record("VTOC", [Keyword("RT", b"VTOC"), Keyword("PT", b"\0" * (TOC_ENTRY_SIZE * len(self.records)))])
+        vtoc.offset = VHDR_ECC_SIZE + len(vhdr.pack())
+        vtoc.length = len(vtoc.pack())
+
+        # Pack the records, now that the offset of each is known
+        offset = vtoc.offset + vtoc.length
+        packed = list()
+        for record in self.records:
+            data = record.pack(offset)
+            if (pageSize and record.name in aligned):
+                pageOffset = offset + (-offset % pageSize)
+                if (pagesSpanned(pageOffset, len(data), pageSize) < pagesSpanned(offset, len(data), pageSize)):
+                    offset = pageOffset
+                    data = record.pack(offset)
+            packed.append(data)
+            record.offset = offset
+            record.length = len(data)
+            offset += record.length
+
+        # The ECC data areas, not supported at present so allocate the space and zero it out
+        for record in [vtoc] + self.records:
+            record.eccOffset = offset
+            record.eccLength = int(record.length / 4)
+            offset += record.eccLength
+
+        # Fill in the TOC entries
+        vtoc.keyword("PT").data = b"".join(packTocEntry(record) for record in self.records)
+        vhdr.keyword("PT").data = packTocEntry(vtoc)
+
+        # Put it all together
+        image = bytearray(VHDR_ECC_SIZE)
+        image += vhdr.pack(len(image))
+        image += vtoc.pack(vtoc.offset)
+        for (record, data) in zip(self.records, packed):
+            # Any space left to page align the record is zero, like the ecc
+            image += b"\0" * (record.offset - len(image))
+            image += data
+        for record in [vtoc] + self.records:
+            image += b"\0" * record.eccLength
+
+        self.vtoc = vtoc
+        self.size = len(image)
+        return image
+
+    @classmethod
+    def fromBytes(cls, data, name = None):
+        """
+        Creates an image from the binary vpd in data
+        data can be anything that can be indexed and sliced like bytes (bytearray, mmap, memoryview)
+        """
+        image = cls(name)
+        data = byteView(data)
+
+        # VD and the VTOC location are in fixed locations in VHDR
+        if (len(data) < (VHDR_ECC_SIZE + 44)):
+            raise VpdError("The image is too small to contain a VHDR!")
+        image.version = bytes(data[24:26])
+        vtocOffset = struct.unpack("<H", bytes(data[35:37]))[0]
+
+        # Make sure the VTOC is where the VHDR said it is
+        if (bytes(data[(vtocOffset + 6):(vtocOffset + 10)]) != b"VTOC"):
+            raise VpdError("Did not find VTOC at the expected offset!")
+        image.vtoc = Record.parse(data, vtocOffset, "VTOC")
+        unpackTocEntry(bytes(data[29:43]), image.vtoc)
+
+        # Loop through the toc and read out the record locations
+        toc = image.vtoc.keyword("PT")
+        if (toc == None):
+            raise VpdError("No PT keyword found in the VTOC!")
+        for tocOffset in range(0, len(toc.data) - TOC_ENTRY_SIZE + 1, TOC_ENTRY_SIZE):
+            entry = toc.data[tocOffset:(tocOffset + TOC_ENTRY_SIZE)]
+            recordName = entry[0:4].decode("latin-1")
+            recordOffset = struct.unpack("<H", entry[6:8])[0]
+            record = Record.parse(data, recordOffset, recordName)
+            unpackTocEntry(entry, record)
+            image.records.append(record)
+
+        # Keep the records in image order
+        image.records.sort(key=lambda record: record.offset)
+        image.size = max([image.vtoc.eccOffset + image.vtoc.eccLength] +
+                         [record.eccOffset + record.eccLength for record in image.records])
+
+        return image
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Python 2 indexes a str or mmap to a 1 character string and turns a memoryview into its repr with bytes()
+# A bytearray gives ints and its contents on both, so the parsers work on one there
+# Anything else, like a device reader, already indexes to ints
+def byteView(data):
+    if (sys.version_info[0] < 3 and isinstance(data, (str, mmap.mmap, memoryview))):
+        return bytearray(data)
+    return data
+
+# Calculate the length of the PF record
+def calcPadFill(record):
+    pfLength = 0
+
+    # The PF keyword must exist
+    # The keyword section of record must be at least 40 bytes long, padfill will be used to achieve that
+    # If the keyword section is over over 40, it must be aligned on word boundaries and PF accomplishes that
+
+    # The record passed in at this point is the keywords + 3 other bytes (LR Tag & Record Length)
+    # Those 3 bytes happen to match the length of the PF keyword and its length which needs to be in the calculation
+    # So we'll just use the length of the record, but it's due to those offsetting lengths of 3
+    pfLength = 40 - len(record)
+    if (pfLength < 1):
+        # It's > 40, so now we just need to fill to nearest word
+        pfLength = (4 - (len(record) % 4))
+
+    return pfLength
+
+# The number of pageSize pages that length bytes at offset are in
+def pagesSpanned(offset, length, pageSize):
+    return ((offset + max(length, 1) - 1) // pageSize) - (offset // pageSize) + 1
+
+# Create the TOC entry that points to a record
+def packTocEntry(record):
+    return (record.name.encode() + b"\0\0" +
+            struct.pack("<HHHH", record.offset, record.length, record.eccOffset, record.eccLength))
+
+# Fill in the offsets of a record from its TOC entry
+def unpackTocEntry(entry, record):
+    (record.offset, record.length, record.eccOffset, record.eccLength) = struct.unpack("<HHHH", entry[6:14])
+
+# Walk the record at offset in the image view, checking the record structure as it goes
+# Returns a list of (keyword name, data offset, data length) for the keywords found, PF included
+def walkRecord(view, offset, length, name, errors):
+    keywords = list()
+
+    if ((offset + length) > len(view) or length < 4):
+        errors.append("Record %s at offset %d with length %d is outside the image" % (name, offset, length))
+        return keywords
+
+    if (view[offset] != LR_TAG):
+        errors.append("Large resource tag not found for record %s at offset %d" % (name, offset))
+    recordLength = struct.unpack_from("<H", view, offset + 1)[0]
+    if ((recordLength + 4) != length):
+        errors.append("Record %s length %d doesn't match the TOC length %d" % (name, recordLength + 4, length))
+        return keywords
+
+    # The keyword section must be at least 40 bytes and word aligned, the PF keyword takes care of that
+    if (recordLength < 40 or (recordLength % 4) != 0):
+        errors.append("Record %s keyword length %d is not padded to at least 40 bytes on a word boundary" % (name, recordLength))
+
+    pos = offset + 3
+    end = pos + recordLength
+    while (pos < end):
+        keywordName = bytes(view[pos:(pos + 2)]).decode("latin-1")
+        if (keywordName[0] == "#"):
+            keywordLength = struct.unpack_from("<H", view, pos + 2)[0]
+            dataOffset = pos + 4
+        else:
+            keywordLength = view[pos + 2]
+            dataOffset = pos + 3
+        if ((dataOffset + keywordLength) > end):
+            errors.append("Keyword %s in record %s runs past the end of the record" % (keywordName, name))
+            return keywords
+        keywords.append((keywordName, dataOffset, keywordLength))
+        pos = dataOffset + keywordLength
+
+    if (len(keywords) == 0 or keywords[-1][0] != "PF"):
+        errors.append("Record %s does not end with a PF keyword" % name)
+    elif (view[keywords[-1][1]:(keywords[-1][1] + keywords[-1][2])] != (b"\0" * keywords[-1][2])):
+        errors.append("The PF keyword in record %s is not all zeros" % name)
+
+    if (view[end] != SR_TAG):
+        errors.append("Small resource tag not found for record %s at offset %d" % (name, end))
+
+    return keywords
+
+# Check the data of the keywords walked in a record against what is expected
+def checkRecordKeywords(view, name, found, expected, errors):
+    # PF is created when packed, it isn't in the expected keywords
+    found = [keyword for keyword in found if (keyword[0] != "PF")]
+    if ([keyword[0] for keyword in found] != [keyword.name for keyword in expected]):
+        errors.append("The keywords in record %s are %s, expected %s" %
+                      (name, [keyword[0] for keyword in found], [keyword.name for keyword in expected]))
+        return
+
+    for ((keywordName, dataOffset, dataLength), keyword) in zip(found, expected):
+        if (view[dataOffset:(dataOffset + dataLength)] != keyword.data):
+            errors.append("The data for keyword %s in record %s doesn't match" % (keywordName, name))
+
+# Check a packed image against the model it was created from
+# The image is read in place through a memoryview, nothing is copied or parsed into new objects
+# Returns a list of the problems found, which is empty when the image is good
+def verifyImage(data, expected):
+    errors = list()
+    view = memoryview(data)
+
+    if (len(view) < (VHDR_ECC_SIZE + 44)):
+        return ["The image is too small to contain a VHDR"]
+
+    # The VHDR and its one TOC entry for the VTOC
+    found = walkRecord(view, VHDR_ECC_SIZE, 44, "VHDR", errors)
+    if (len(errors)):
+        return errors
+    # The PT keyword is checked by following it to the VTOC below
+    found = [keyword for keyword in found if (keyword[0] != "PT")]
+    checkRecordKeywords(view, "VHDR", found, [Keyword("RT", b"VHDR"), Keyword("VD", expected.version)], errors)
+    if (bytes(view[26:33]) != b"PT\x0eVTOC"):
+        return errors + ["The VHDR PT keyword doesn't point to the VTOC"]
+    (vtocOffset, vtocLength, vtocEccOffset, vtocEccLength) = struct.unpack_from("<HHHH", view, 35)
+
+    # The VTOC and the TOC entries for each record
+    found = walkRecord(view, vtocOffset, vtocLength, "VTOC", errors)
+    if (len(errors)):
+        return errors
+    found = dict((keyword[0], keyword) for keyword in found)
+    if (found.get("RT") == None or bytes(view[found["RT"][1]:(found["RT"][1] + 4)]) != b"VTOC"):
+        errors.append("The RT keyword in the VTOC is not VTOC")
+    if (found.get("PT") == None or found["PT"][2] != (TOC_ENTRY_SIZE * len(expected.records))):
+        return errors + ["The VTOC PT keyword does not have %d TOC entries" % len(expected.records)]
+
+    # Every area in the image, as (offset, length, name), to check for overlaps
+    areas = [(0, VHDR_ECC_SIZE + 44, "VHDR"), (vtocOffset, vtocLength, "VTOC"), (vtocEccOffset, vtocEccLength, "VTOC ecc")]
+    if (vtocEccLength != int(vtocLength / 4)):
+        errors.append("The VTOC ecc length %d doesn't match the VTOC length %d" % (vtocEccLength, vtocLength))
+
+    tocOffset = found["PT"][1]
+    for record in expected.records:
+        recordName = bytes(view[tocOffset:(tocOffset + 4)]).decode("latin-1")
+        (recordOffset, recordLength, eccOffset, eccLength) = struct.unpack_from("<HHHH", view, tocOffset + 6)
+        tocOffset += TOC_ENTRY_SIZE
+        if (recordName != record.name):
+            errors.append("The VTOC entry %s was expected to be record %s" % (recordName, record.name))
+            continue
+
+        areas.append((recordOffset, recordLength, recordName))
+        areas.append((eccOffset, eccLength, recordName + " ecc"))
+        if (eccLength != int(recordLength / 4)):
+            errors.append("The ecc length %d for record %s doesn't match the record length %d" % (eccLength, recordName, recordLength))
+
+        if (record.raw != None):
+            # A record from a rbinfile goes in as is
+            if (view[recordOffset:(recordOffset + recordLength)] != record.raw):
+                errors.append("The rbinfile contents for record %s don't match" % recordName)
+            continue
+
+        found = walkRecord(view, recordOffset, recordLength, recordName, errors)
+        checkRecordKeywords(view, recordName, found, record.keywords, errors)
+
+    # All the areas have to be in the image and can't overlap each other
+    areas.sort()
+    for (area, nextArea) in zip(areas, areas[1:] + [(len(view), 0, "end of image")]):
+        if ((area[0] + area[1]) > nextArea[0]):
+            errors.append("%s at offset %d length %d overlaps %s at offset %d" % (area[2], area[0], area[1], nextArea[2], nextArea[0]))
+
+    return errors
+
+# Returns the areas of an image that has been packed or parsed, as (offset, length, name) in image order
+# That's the VHDR with its ecc, the VTOC, each record and the ecc for the VTOC and each record
+def imageAreas(image):
+    areas = [(0, VHDR_ECC_SIZE + 44, "VHDR")]
+    for record in [image.vtoc] + image.records:
+        areas.append((record.offset, record.length, record.name))
+        areas.append((record.eccOffset, record.eccLength, record.name + " ecc"))
+    areas.sort()
+    return areas
+
+# Account for every byte of an image that has been packed or parsed
+# Returns a list of rows of (name, keyword data, keyword names and lengths, PF keyword, LR/SR tags and record length, ecc, TOC entry)
+# for the VHDR, the VTOC and each record.  The TOC entry of a record is counted with it instead of in the VTOC
+# Also returns the bytes left between records to page align them, the rows and the gaps add up to the image size
+def imageSpace(image):
+    vhdr = Record("VHDR", [Keyword("RT", b"VHDR"), Keyword("VD", bytes(image.version)), Keyword("PT", b"\0" * TOC_ENTRY_SIZE)])
+    vhdr.length = 44
+    vhdr.eccLength = VHDR_ECC_SIZE
+    tocSize = TOC_ENTRY_SIZE * len(image.records)
+
+    rows = list()
+    for record in [vhdr, image.vtoc] + image.records:
+        # The keywords of a record from a rbinfile are only in its raw data
+        keywords = record.keywords
+        if (record.raw != None):
+            keywords = Record.parse(record.raw, 0, record.name).keywords
+        keywordData = sum(len(keyword.data) for keyword in keywords)
+        keywordHeaders = sum((keyword.packedSize() - len(keyword.data)) for keyword in keywords)
+        # Whatever isn't a keyword or the 4 bytes of tags and length is the PF keyword
+        padFill = record.length - 4 - keywordData - keywordHeaders
+        tocEntry = TOC_ENTRY_SIZE
+        if (record == image.vtoc):
+            keywordData -= tocSize
+            tocEntry = 0
+        elif (record == vhdr):
+            tocEntry = 0
+        rows.append((record.name, keywordData, keywordHeaders, padFill, 4, record.eccLength, tocEntry))
+
+    return (rows, image.size - sum(sum(row[1:]) for row in rows))
+
+# Find the vpd images in a larger binary, like a flash or eeprom dump
+# data needs find() and the buffer protocol (bytes, mmap) and is searched a chunk at a time
+# Yields (offset, image) for each image found, which is parsed in place without copying the rest of data
+def findImages(data, chunkSize = 16 * 1024 * 1024):
+    # Keep the chunks page aligned so an mmap can drop the pages already searched
+    chunkSize = max(mmap.PAGESIZE, chunkSize - (chunkSize % mmap.PAGESIZE))
+    dataLength = len(data)
+    chunkStart = 0
+    searchStart = 0
+
+    # Python 2 can't take a memoryview of an mmap, the candidates are sliced out of data itself there
+    view = memoryview(data) if (sys.version_info[0] >= 3) else data
+    try:
+        while (chunkStart < dataLength):
+            chunkEnd = min(chunkStart + chunkSize, dataLength)
+            # Let a signature that straddles the end of the chunk be found in this one
+            searchEnd = min(chunkEnd + len(VHDR_SIGNATURE) - 1, dataLength)
+            position = data.find(VHDR_SIGNATURE, max(searchStart, chunkStart), searchEnd)
+            while (position != -1):
+                offset = position - VHDR_SIGNATURE_OFFSET
+                image = checkCandidate(view, offset)
+                if (image != None):
+                    yield (offset, image)
+                    # Nothing else can start inside this image
+                    searchStart = offset + image.size
+                else:
+                    searchStart = position + 1
+                position = data.find(VHDR_SIGNATURE, searchStart, searchEnd)
+
+            # Done with the chunk, an mmap can give the pages back so memory stays flat no matter the dump size
+            if (hasattr(data, "madvise") and hasattr(mmap, "MADV_DONTNEED")):
+                data.madvise(mmap.MADV_DONTNEED, chunkStart, chunkEnd - chunkStart)
+            chunkStart = chunkEnd
+    finally:
+        if (isinstance(view, memoryview)):
+            view.release()
+
+# Check for a vpd image starting at offset in a larger binary
+# Returns the parsed image, or None if the VHDR, VTOC or the areas they point to don't make a good image
+def checkCandidate(view, offset):
+    # The VHDR has a fixed layout, check the parts that aren't in the signature
+    if (offset < 0):
+        return None
+    (tag, length) = struct.unpack_from("<BH", view, offset + VHDR_ECC_SIZE)
+    if (tag != LR_TAG or length != 40):
+        return None
+
+    imageView = view[offset:]
+    try:
+        try:
+            image = VpdImage.fromBytes(imageView)
+        except (VpdError, IndexError, struct.error):
+            return None
+
+        # Everything the VTOC points to has to fit in what's left of the binary
+        for record in [image.vtoc] + image.records:
+            if (record.offset < (VHDR_ECC_SIZE + 44) or (record.offset + record.length) > image.size):
+                return None
+        if (image.size > len(imageView)):
+            return None
+    finally:
+        if (isinstance(imageView, memoryview)):
+            imageView.release()
+
+    return image
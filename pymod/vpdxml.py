@@ -0,0 +1,220 @@
+# Python module for the xml backends the tools parse and write templates with
+# Every backend gives an ElementTree tree with the comments kept in it as Comment elements, so they are written back out
+#   etree  - the C TreeBuilder in python 3.8 and newer keeps the comments itself, nothing calls back into python
+#   python - a TreeBuilder subclass that adds the comments, for older pythons
+#            It is driven by expat directly so it can record the file and line each tag was read from
+#            The C parser has no way to give them, so only this backend has them for the error messages
+# lxml isn't a backend.  Its elements can only have one parent, and variant manifests share their elements with the base
+# Comments outside of the top level element are dropped by all of them, python 3 will error on multiple top level elements
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import sys
+import weakref
+from lazyimport import lazyImport
+# Only loaded when a template is parsed or written
+ET = lazyImport("xml.etree.ElementTree")
+expat = lazyImport("xml.parsers.expat")
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The backends in the order they are picked, fastest first
+BACKENDS = ["etree", "python"]
+
+# The backend in use, set by setBackend or the first time one is needed
+backend = None
+
+# The python backend builder class, created the first time it's used since it can't be defined until ElementTree is loaded
+CommentedTreeBuilder = None
+
+# The "file:line" each element read by the python backend started at
+# Weak keys, so the entries go away with the trees they are for
+locations = weakref.WeakKeyDictionary()
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+def available():
+    """
+    Returns the backends that can be used with this python
+    """
+    backends = list()
+    if (sys.version_info >= (3, 8)):
+        backends.append("etree")
+    backends.append("python")
+    return backends
+
+def setBackend(name):
+    """
+    Sets the backend used for parsing, a ValueError if it can't be used with this python
+    """
+    global backend
+    if (name not in available()):
+        raise ValueError("The xml backend %s is not available, the choices are %s" % (name, ", ".join(available())))
+    backend = name
+
+def getBackend():
+    """
+    Returns the backend in use, the fastest available if none was set
+    """
+    if (backend == None):
+        setBackend(available()[0])
+    return backend
+
+# This parser extension is necessary to save comments and write them back out in the final file
+# By default, element tree doesn't preserve comments
+# https://stackoverflow.com/questions/33573807/faithfully-preserve-comments-in-parsed-xml-python-2-7/
+def commentedTreeBuilder():
+    global CommentedTreeBuilder
+    if (CommentedTreeBuilder != None):
+        return CommentedTreeBuilder()
+
+    class CommentedTreeBuilder(ET.TreeBuilder):
+        def __init__(self, *args, **kwargs):
+            super(CommentedTreeBuilder, self).__init__(*args, **kwargs)
+            # Track how deep we are in the tree
+            # Comments outside of the top level element can't be stored
+            self.depth = 0
+            # The start and end events seen when used by iterparse, None when they aren't wanted
+            self.events = None
+            # The expat parser feeding the builder and the name of the file it's reading, for the locations
+            self.parser = None
+            self.fileName = None
+
+        def start(self, *args, **kwargs):
+            self.depth += 1
+            element = super(CommentedTreeBuilder, self).start(*args, **kwargs)
+            if (element.tag is not ET.Comment):
+                if (self.parser != None):
+                    locations[element] = "%s:%d" % (self.fileName, self.parser.CurrentLineNumber)
+                if (self.events != None):
+                    self.events.append(("start", element))
+            return element
+
+        def end(self, *args, **kwargs):
+            self.depth -= 1
+            element = super(CommentedTreeBuilder, self).end(*args, **kwargs)
+            if (self.events != None and element.tag is not ET.Comment):
+                self.events.append(("end", element))
+            return element
+
+        def comment(self, data):
+            if (self.depth == 0):
+                return
+            self.start(ET.Comment, {})
+            self.data(data)
+            self.end(ET.Comment)
+
+    return CommentedTreeBuilder()
+
+# An expat parser that builds the tree with the python builder, recording where each tag was read from
+def expatParser(target, fileName):
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = target.start
+    parser.EndElementHandler = target.end
+    parser.CharacterDataHandler = target.data
+    parser.CommentHandler = target.comment
+    target.parser = parser
+    target.fileName = fileName
+    return parser
+
+# Give expat a piece of the file, with its errors raised as the ParseError ElementTree gives
+def expatFeed(parser, data, final = False):
+    try:
+        parser.Parse(data, final)
+    except expat.ExpatError as e:
+        error = ET.ParseError(str(e))
+        error.code = e.code
+        error.position = (e.lineno, e.offset)
+        raise error
+
+def parse(xmlFile, chunkSize = 64 * 1024):
+    """
+    Parses a file name or file object and returns the root element
+    Errors in the xml raise the exceptions ElementTree does
+    """
+    if (getBackend() == "etree"):
+        target = ET.TreeBuilder(insert_comments=True)
+        return ET.parse(xmlFile, parser=ET.XMLParser(target=target)).getroot()
+
+    if (not hasattr(xmlFile, "read")):
+        with open(xmlFile, "rb") as f:
+            return parse(f, chunkSize)
+    target = commentedTreeBuilder()
+    parser = expatParser(target, getattr(xmlFile, "name", "<xml>"))
+    while True:
+        data = xmlFile.read(chunkSize)
+        if (not data):
+            break
+        expatFeed(parser, data)
+    expatFeed(parser, b"", True)
+    return target.close()
+
+def iterparse(xmlFile, chunkSize = 16 * 1024):
+    """
+    Parses a file object a piece at a time, yielding ("start", element) and ("end", element) as the tags are read
+    Comments are put in the tree like parse does, but don't have events of their own
+    The parser reads ahead, so elements after the one in the event may already be in the tree
+    """
+    if (getBackend() == "etree"):
+        parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+        for event in ET.iterparse(xmlFile, events=("start", "end"), parser=parser):
+            yield event
+        return
+
+    # Event handling only works with the plain TreeBuilder, so the python builder collects its own events
+    target = commentedTreeBuilder()
+    target.events = list()
+    parser = expatParser(target, getattr(xmlFile, "name", "<xml>"))
+    while True:
+        data = xmlFile.read(chunkSize)
+        if (not data):
+            break
+        expatFeed(parser, data)
+        for event in target.events:
+            yield event
+        del target.events[:]
+    expatFeed(parser, b"", True)
+    target.close()
+    for event in target.events:
+        yield event
+
+def location(element):
+    """
+    Returns the "file:line" an element was read from, None when the backend that read it doesn't keep them
+    """
+    return locations.get(element)
+
+def write(root, outputFile):
+    """
+    Writes the tree under root, with the xml declaration, to a file name or binary file object
+    All the backends give the same trees, so they are all written the same
+    """
+    ET.ElementTree(root).write(outputFile, encoding="utf-8", xml_declaration=True)
+
+def writeStart(root, outputFile):
+    """
+    Writes the xml declaration and the start tag and text of root to a binary file object
+    Followed by writeElement for each child and writeEnd, the file is the same as write gives
+    """
+    outputFile.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+    shell = ET.Element(root.tag, root.attrib)
+    shell.text = root.text
+    startTag = ET.tostring(shell, encoding="unicode", short_empty_elements=False)
+    outputFile.write(startTag[:-len("</%s>" % root.tag)].encode("utf-8"))
+
+def writeElement(element, outputFile):
+    """
+    Writes one child of the root, along with its tail, to a binary file object
+    """
+    # Encoding once at the end is much quicker than having ElementTree encode each piece it writes
+    outputFile.write(ET.tostring(element, encoding="unicode").encode("utf-8"))
+
+def writeEnd(root, outputFile):
+    """
+    Writes the end tag of root to a binary file object
+    """
+    outputFile.write(("</%s>" % root.tag).encode())
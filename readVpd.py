@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# Program to read records and keywords from the VPD eeproms on a system, without reading the whole of each eeprom
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import vpdmodel
+import vpddevice
+import reverseVpd
+import argparse
+import textwrap
+import time
+import struct
+import concurrent.futures
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# What is read when no keywords are given, enough to say what each part is
+INVENTORY_KEYWORDS = "VINI:CC,VINI:FN,VINI:PN,VINI:SN"
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Read the keywords wanted from a device
+# With a pageSize the file is an image read as if it were on an eeprom with those pages, and the transactions are counted
+# This is run in the worker threads, so nothing is printed, errors are handed back
+# Returns (error, values, reader) with the reader closed
+def readDevice(vpdFile, wanted, readAhead, pageSize = None, transferSize = None):
+    try:
+        if (pageSize != None):
+            reader = vpddevice.SimulatedDevice(open(vpdFile, mode='rb').read(), vpdFile, pageSize, transferSize, readAhead)
+        else:
+            reader = vpddevice.DeviceReader(vpdFile, readAhead)
+    except (IOError, OSError) as e:
+        return ("Unable to read: %s" % e, None, None)
+
+    # A device that fails a read, like an i2c NACK, or holds a short or corrupt image only fails itself
+    with reader:
+        try:
+            return (None, vpddevice.readKeywords(reader, wanted), reader)
+        except (vpdmodel.VpdError, IOError, OSError, struct.error, IndexError) as e:
+            return (str(e), None, reader)
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Reads records and keywords from VPD eeproms, only reading what is asked for', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./readVpd.py -v /sys/bus/i2c/devices/*/eeprom
+                                       ./readVpd.py -v /sys/bus/i2c/devices/8-0050/eeprom -k VINI:SN,VINI:PN,VSYS:TM
+                                       ./readVpd.py -v image.vpd -k VINI,VINI:DR
+                                       ./readVpd.py -v image.vpd -f boot-accesses.txt --page-size 32 --transfer-size 32
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-v', '--vpdfiles', help='The eeproms to read, or any files holding a vpd image', nargs="+", required=True)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-k', '--keywords', help="Comma separated RECORD or RECORD:KEYWORD list of the data to read, a record gives its length (default %s)" % INVENTORY_KEYWORDS,
+                          default=INVENTORY_KEYWORDS)
+    optgroup.add_argument('-f', '--access-file', help="A file of the RECORD or RECORD:KEYWORD accesses to make in order, one per line, instead of -k")
+    optgroup.add_argument('--page-size', help="Read the files as images on a simulated eeprom with pages of this many bytes, and count the transactions", type=int)
+    optgroup.add_argument('--transfer-size', help="The most bytes a simulated transaction can read (default the page size)", type=int)
+    optgroup.add_argument('-w', '--workers', help="The number of eeproms to read in parallel, they wait on the bus not the cpu", type=int, default=8)
+    optgroup.add_argument('-a', '--read-ahead', help="The fewest bytes to read at a time (default %d)" % vpddevice.READ_AHEAD, type=int, default=vpddevice.READ_AHEAD)
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # The (record, keyword) names to read, a keyword of None for the whole record
+    wanted = list()
+    if (args.access_file != None):
+        try:
+            wanted = vpddevice.loadAccesses(args.access_file)
+        except IOError as e:
+            out.error("Unable to read the access file %s: %s" % (args.access_file, e))
+            exit(1)
+    else:
+        for entry in args.keywords.split(","):
+            entry = entry.strip()
+            if (entry == ""):
+                continue
+            (recordName, sep, keywordName) = entry.partition(":")
+            wanted.append((recordName, keywordName if (keywordName != "") else None))
+    if (len(wanted) == 0):
+        out.error("No records or keywords given to read!")
+        exit(1)
+
+    # A simulated eeprom needs a page size to split the transactions on
+    transferSize = args.transfer_size
+    if (args.page_size != None or transferSize != None):
+        if (args.page_size == None or args.page_size < 1 or (transferSize != None and transferSize < 1)):
+            out.error("--page-size has to be given and at least 1 to simulate an eeprom")
+            exit(1)
+        if (transferSize == None):
+            transferSize = args.page_size
+
+    ################################################
+    # Read the devices
+    out.setIndent(0)
+    out.msg("==== Stage 1: Reading %d devices" % len(args.vpdfiles))
+    out.setIndent(2)
+
+    startTime = time.time()
+    failed = 0
+    totalRead = 0
+    totalSize = 0
+    totalReads = 0
+    totalTransactions = 0
+    # Each device is its own file, so they are read at the same time and a slow bus doesn't hold up the rest
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+        results = pool.map(lambda vpdFile: readDevice(vpdFile, wanted, args.read_ahead, args.page_size, transferSize), args.vpdfiles)
+        for (vpdFile, (error, values, reader)) in zip(args.vpdfiles, results):
+            transactions = ""
+            if (reader != None):
+                totalRead += reader.bytesRead
+                totalSize += len(reader)
+                totalReads += reader.reads
+                if (args.page_size != None):
+                    totalTransactions += reader.transactions
+                    transactions = ", %d transactions" % reader.transactions
+            if (error != None):
+                failed += 1
+                out.error("%s: %s" % (vpdFile, error))
+                continue
+
+            out.msg("%s: read %d of %d bytes in %d reads%s" % (vpdFile, reader.bytesRead, len(reader), reader.reads, transactions))
+            out.setIndent(4)
+            # An access file can name the same keyword many times, it's only printed once
+            for (recordName, keywordName) in dict.fromkeys(wanted):
+                data = values[(recordName, keywordName)]
+                if (keywordName == None):
+                    if (data == None):
+                        out.msg("%s not found" % recordName)
+                    else:
+                        out.msg("%s %d bytes" % (recordName, len(data)))
+                elif (data == None):
+                    out.msg("%s:%s not found" % (recordName, keywordName))
+                else:
+                    out.msg("%s:%s %s" % (recordName, keywordName, reverseVpd.keywordText(data)[1]))
+            out.setIndent(2)
+    elapsed = time.time() - startTime
+
+    out.msg("Read %d devices in %.3fs: %d of %d bytes in %d reads%s, %d failed" %
+            (len(args.vpdfiles), elapsed, totalRead, totalSize, totalReads,
+             (", %d transactions" % totalTransactions) if (args.page_size != None) else "", failed))
+
+    # Return the number of devices that couldn't be read as the return code
+    # The return code only has 8 bits, 256 failed devices can't look like they all worked
+    exit(min(failed, 255))
+
+if __name__ == "__main__":
+    main()
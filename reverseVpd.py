@@ -33,316 +33,416 @@ import os
 scriptPath = os.path.dirname(os.path.realpath(__file__))
 import sys
 sys.path.insert(0,scriptPath + "/pymod");
-import argparse
-import textwrap
 import out
-import xml.etree.ElementTree as ET
+import vpdmodel
+import vpdxml
+import vpdjson
+import vpddevice
+from lazyimport import lazyImport
+# Only loaded when templates are written, indexVpd.py uses this file without them
+ET = lazyImport("xml.etree.ElementTree")
 import struct
 import re
 import binascii
 import string
-import operator
+import mmap
+import contextlib
 
 def asciiAllowed(s):
     for c in s:
         if c not in string.printable:
             return False
+        # Vertical tab and form feed can't be in xml, and a carriage return is read back in as a newline
+        if c in "\r\x0b\x0c":
+            return False
     return True
 
-############################################################
-# Classes - Classes - Classes - Classes - Classes - Classes
-############################################################
-class RecordInfo:
-    """Stores the info about each vpd record"""
-    def __init__(self):
-        # The name of the record
-        self.recordName = None
-        # The location of the Record Offset
-        self.recordOffset = None
-        # The location of the Record Length
-        self.recordLength = None
-        # The location of the ECC Offset
-        self.eccOffset = None
-        # The location of the ECC Length
-        self.eccLength = None
-
 ############################################################
 # Function - Functions - Functions - Functions - Functions
 ############################################################
 # Function to write out the resultant tvpd xml file
 def writeTvpd(manifest, outputFile):
-    tree = ET.ElementTree(manifest)
-    tree.write(outputFile, encoding="utf-8", xml_declaration=True)
+    vpdxml.write(manifest, outputFile)
+    out.msg("Wrote tvpd file: %s" % outputFile)
+
+    # Now rip it through xmllint quick to cleanup formatting problems from the ET print
+    if (os.path.isfile("/usr/bin/xmllint")):
+        rc = os.system("/usr/bin/xmllint --format %s -o %s" % (outputFile, outputFile))
+        if (rc):
+            out.error("Error occurred calling xmllint to fix xml formatting")
+            return rc
+    else:
+        out.warn("xmllint not installed - no formatting cleanup done!")
+
+    return None
+
+# Write a template out as xml, or converted to the json template format
+def writeTemplate(manifest, outputFile, jsonOutput):
+    if (not jsonOutput):
+        return writeTvpd(manifest, outputFile)
+
+    vpdjson.write(vpdjson.fromXml(manifest), outputFile)
+    out.msg("Wrote json file: %s" % outputFile)
+    return None
+
+# Make a best guess at the format of keyword data, since it isn't stored in the image
+# Returns if the data is ascii and the text to put in the template for it
+def keywordText(keywordData):
+    # This is overly complicated in my opinion, but the only way I could get it to work with the time allowed
+    # First strip off any trailing zero byte values.  If you don't, then it's outside the ascii range and it thinks all data is hex
+    # Then try to decode the data from ascii.  If a byte is outside the range (like 0xff), it will throw the exception
+    # If it doesn't throw the exception, then check to make sure the string contains only chars we allow in VPD.  Otherwise, hex
+
+    # Walk backwords and bail the first time a nonzero value is found
+    nzeroidx = len(keywordData) - 1
+    while (nzeroidx >= 0):
+        if (keywordData[nzeroidx] != 0x00):
+            break;
+        nzeroidx-=1
+
+    # If we didn't get back to the start, shorten the data
+    if (nzeroidx >= 0):
+        keywordData = keywordData[0:(nzeroidx+1)]
+    # Made it all the way to the start, must be all zero.  Shorten it to just the first zero byte to put into the template
+    else:
+        keywordData = keywordData[0:1]
+
+    # Now try to decode and figure out hex vs ascii
+    try:
+        keywordData.decode('ascii')
+    except UnicodeDecodeError:
+        asciiState = False
+    else:
+        if asciiAllowed(keywordData.decode('ascii')):
+            asciiState = True
+        else:
+            asciiState = False
+
+    if (asciiState):
+        return (True, keywordData.decode())
+    return (False, binascii.hexlify(keywordData).decode())
+
+# Create the <keyword> xml for a keyword in the image
+# Hex data over binThreshold bytes, not counting the trailing zeros, goes in a bin file named binFileName instead
+# Returns if the keyword data goes in the bin file
+def createKeywordXml(record, keyword, binThreshold = None, binFileName = None):
+    keywordName = keyword.name
+    keywordLength = len(keyword.data)
+
+    # Create our keyword tag and subtags
+    keywordXml = ET.SubElement(record, "keyword", {"name":keywordName})
+    ET.SubElement(keywordXml, "kwdesc").text = "The " + keywordName + " keyword"
+    ET.SubElement(keywordXml, "kwlen").text = str(keywordLength)
+
+    # We know if its ascii or not, store away our data
+    (asciiState, keywordData) = keywordText(keyword.data)
+    if (asciiState):
+        kwformat = "ascii"
+    elif (binThreshold != None and (len(keywordData) // 2) > binThreshold):
+        # The trailing zeros are already left out of the hex, a keyword that is mostly padding stays in the template
+        kwformat = "bin"
+        keywordData = binFileName
+    else:
+        kwformat = "hex"
+    ET.SubElement(keywordXml, "kwformat").text = kwformat
+    ET.SubElement(keywordXml, "kwdata").text = keywordData
+
+    out.setIndent(4)
+    out.msg("Keyword: %s Type: %5s Length: %s" % (keywordName, kwformat, str(keywordLength)))
+    return (kwformat == "bin")
+
+# Create the tvpd xml for an image
+# Only the records in expandRecords are turned into keyword xml, the rest get a rbinfile tag. None expands them all
+# extension is the one the record files from createRecords are written with
+# Keywords that aren't ascii and are over binThreshold bytes get a bin file instead of hex data, None keeps them all hex
+# Returns the top level vpd, a dict of the vpd for each record, which is only filled in for createRecords,
+# the list of records that need a rbinfile written and the list of (file name, keyword) that need a bin file written
+def createTvpd(vpdImage, createRecords, expandRecords = None, extension = ".tvpd", binThreshold = None):
+    vpdName = vpdImage.name
+
+    # Create our top level level XML
+    vpd = ET.Element("vpd")
+
+    # Stick in our required tags
+    ET.SubElement(vpd, "name").text = vpdName
+    ET.SubElement(vpd, "size").text = "32 kB"
+    # VD is in a fixed location in VHDR, just rip it out instead of reading teh VPD to find it
+    ET.SubElement(vpd, "VD").text = ("%02X" % struct.unpack('<H', vpdImage.version)[0])
+
+    recordTvpd = dict()
+    recordBins = list()
+    keywordBins = list()
+    # If we are going to be creating individual record vpd files
+    # Stash away the top level vpd we created for use below
+    if (createRecords):
+        toplevelvpd = vpd
+
+    # Loop thru our records and create our record/keyword entries
+    # The records in the model are already in image order
+    for recordItem in vpdImage.records:
+        out.setIndent(2)
+        recordName = recordItem.name
+
+        # Records we aren't expanding are copied as is into a rbinfile
+        # createVpd.py checks a rbinfile by its RT keyword, so a record without a matching one has to be expanded
+        if (expandRecords != None and recordName not in expandRecords):
+            rt = recordItem.keyword("RT")
+            if (rt == None or rt.data != recordName.encode("latin-1")):
+                out.warn("Record %s has no matching RT keyword, it can't be a rbinfile" % (recordName))
+                expandRecords = expandRecords | set([recordName])
+
+        if (expandRecords != None and recordName not in expandRecords):
+            record = ET.SubElement((toplevelvpd if (createRecords) else vpd), "record", {'name':recordName})
+            ET.SubElement(record, "rbinfile").text = vpdName + "-" + recordName + ".rvpd"
+            recordBins.append(recordItem)
+            out.msg("Record: %s (rbinfile)" % (recordName))
+            continue
+
+        # The little indirection needed when creating individual record files
+        if (createRecords):
+            # Create a different vpd for use throughout below
+            vpd = ET.Element("vpd")
+            # Add a record and rtvpdfile to the toplevelvpd
+            record = ET.SubElement(toplevelvpd, "record", {'name':recordName})
+            ET.SubElement(record, "rtvpdfile").text = vpdName + "-" + recordName + extension
+
+        # Create our record
+        record = ET.SubElement(vpd, "record", {'name':recordName})
+
+        # Create the record description
+        ET.SubElement(record, "rdesc").text = "The " + recordName + " record"
+
+        out.msg("Record: %s" % (recordName))
+
+        # Create the keyword tag and it's sub tags for each keyword in the record
+        for keyword in recordItem.keywords:
+            binFileName = vpdName + "-" + recordName + "-" + keyword.name + ".bin"
+            if (createKeywordXml(record, keyword, binThreshold, binFileName)):
+                keywordBins.append((binFileName, keyword))
+
+        # Handle our indirection and add the record vpd to our dict for printing below
+        if (createRecords):
+            recordTvpd[recordName] = vpd
+
+    # All done with records, cleanup our indirection
+    if (createRecords):
+        vpd = toplevelvpd
+
+    return (vpd, recordTvpd, recordBins, keywordBins)
+
+# Run Stage 2 and 3 on an image that has been parsed into the model
+# Creates the tvpd xml for the image and writes it to outputPath, as json templates with jsonOutput
+# vpdData is the binary the image was parsed from, the rbinfiles are copied out of it
+def reverseImage(vpdImage, vpdData, outputPath, createRecords, expandRecords = None, jsonOutput = False, binThreshold = None):
+    vpdName = vpdImage.name
+
+    # Let the user know about any records they asked for that aren't there
+    if (expandRecords != None):
+        for recordName in expandRecords:
+            if (vpdImage.record(recordName) == None):
+                out.warn("The record %s to expand was not found in %s" % (recordName, vpdName))
+
+    ################################################
+    # Create tvpd XML
+    out.setIndent(0)
+    out.msg("==== Stage 2: Creating tvpd XML")
+    out.setIndent(2)
+
+    extension = vpdjson.EXTENSION if (jsonOutput) else ".tvpd"
+    (vpd, recordTvpd, recordBins, keywordBins) = createTvpd(vpdImage, createRecords, expandRecords, extension, binThreshold)
+
+    # We now have a correct tvpd, use it to create a binary VPD image
+    out.setIndent(0)
+    out.msg("==== Stage 3: Writing the tvpd output file")
+    out.setIndent(2)
+    # Create our output file names
+    tvpdFileName = outputPath + "/" + vpdName + extension
+
+    # This is our easy one, write the XML back out
+    # Write out the full template vpd representing the data contained in our image
+    rc = writeTemplate(vpd, tvpdFileName, jsonOutput)
+    if (rc):
+        return rc
+
+    # Write the sub files
+    # This can be in whatever order, we don't care
+    for recordName in recordTvpd:
+
+        # Create our output file names
+        tvpdFileName = outputPath + "/" + vpdName + "-" + recordName + extension
+
+        # This is our easy one, write the XML back out
+        # Write out the full template vpd representing the data contained in our image
+        rc = writeTemplate(recordTvpd[recordName], tvpdFileName, jsonOutput)
+        if (rc):
+            return rc
+
+    # Write the records that weren't expanded, exactly as they are in the image
+    for record in recordBins:
+        rvpdFileName = outputPath + "/" + vpdName + "-" + record.name + ".rvpd"
+        rvpdFile = open(rvpdFileName, "wb")
+        rvpdFile.write(vpdData[record.offset:(record.offset + record.length)])
+        rvpdFile.close()
+        out.msg("Wrote rbinfile: %s" % rvpdFileName)
+
+    # Write the keywords left out of the templates, createVpd.py finds them on its -i path
+    for (binFileName, keyword) in keywordBins:
+        binFileName = outputPath + "/" + binFileName
+        binFile = open(binFileName, "wb")
+        binFile.write(keyword.data)
+        binFile.close()
+        out.msg("Wrote bin file: %s" % binFileName)
+
+    return None
+
+# Find all the vpd images in a dump and reverse each of them
+# The dump is memory mapped and searched in chunks, so it can be much larger than memory
+# Each image is named for the dump and the offset it was found at
+def scanDump(dumpFile, vpdName, outputPath, createRecords, expandRecords = None, jsonOutput = False, binThreshold = None):
+    out.setIndent(0)
+    out.msg("==== Stage 1: Scanning %s for VPD images" % dumpFile)
+    out.setIndent(2)
+
+    if (os.path.getsize(dumpFile) == 0):
+        out.error("The file %s is empty!" % dumpFile)
+        return 1
+
+    imagesFound = 0
+    # An mmap is only a context manager on python 3, closing works on both
+    with open(dumpFile, mode='rb') as f, contextlib.closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as dump:
+        for (offset, vpdImage) in vpdmodel.findImages(dump):
+            imagesFound += 1
+            vpdImage.name = "%s-%08x" % (vpdName, offset)
+            out.setIndent(0)
+            out.msg("==== Found VPD image at offset 0x%08x, %d bytes, %d records" % (offset, vpdImage.size, len(vpdImage.records)))
+
+            rc = reverseImage(vpdImage, dump[offset:(offset + vpdImage.size)], outputPath, createRecords, expandRecords, jsonOutput, binThreshold)
+            if (rc):
+                return rc
+
+    out.setIndent(0)
+    if (imagesFound == 0):
+        out.error("No VPD images found in %s" % dumpFile)
+        return 1
+    out.msg("Found %d VPD images in %s" % (imagesFound, dumpFile))
+
     return None
 
 ############################################################
 # Main - Main - Main - Main - Main - Main - Main - Main
 ############################################################
-rc = 0
-
-################################################
-# Command line options
-# Create the argparser object
-# We disable auto help options here and add them manually below.  This is we can get all the optional args in 1 group
-parser = argparse.ArgumentParser(description='Reverses a VPD image into XML template files', add_help=False, formatter_class=argparse.RawDescriptionHelpFormatter,
-                                 epilog=textwrap.dedent('''\
-                                 Examples:
-                                   ./reverseVpd.py -v image.vpd -o /tmp
-                                 '''))
-# Create our group of required command line args
-reqgroup = parser.add_argument_group('Required Arguments')
-reqgroup.add_argument('-v', '--vpdfile', help='The valid vpd formatted input file', required=True)
-reqgroup.add_argument('-o', '--outpath', help='The output path for the files created by the tool', required=True)
-# Create our group of optional command line args
-optgroup = parser.add_argument_group('Optional Arguments')
-optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
-optgroup.add_argument('-d', '--debug', help="Enables debug printing",action="store_true")
-optgroup.add_argument('-r', '--create-records', help="Create tvpd files for each record in the vpd",action="store_true")
-
-# We've got everything we want loaded up, now look for it
-args = parser.parse_args()
-
-# Get the manifest file and get this party started
-clVpdFile = args.vpdfile
-
-# Look for output path
-clOutputPath = args.outpath
-# Make sure the path exists, we aren't going to create it
-if (os.path.exists(clOutputPath) != True):
-    out.error("The given output path %s does not exist!" % clOutputPath)
-    out.error("Please create the output directory and run again")
-    exit(1)
-
-# Debug printing
-clDebug = args.debug
-
-# Create separate tvpd files for each record
-clCreateRecords = args.create_records
-
-################################################
-# Read in the VPD file and break it apart
-out.setIndent(0)
-out.msg("==== Stage 1: Parsing the VPD file")
-out.setIndent(2)
-
-# Create our output name from the input name
-vpdName = os.path.splitext(os.path.basename(clVpdFile))[0]
-
-# Open the vpdfile
-vpdContents = open(clVpdFile, mode='rb').read()
-
-# Jump right to where the VTOC should be and make sure it says VTOC
-offset = 61
-if (vpdContents[offset:(offset+4)].decode() != "VTOC"):
-    out.error("Did not find VTOC at the expected offset!")
-    exit(1)
-offset+=4
-
-# Skip the PT keyword and read the 1 byte length to loop over the VTOC contents and create our record list
-offset+=2 # PT skip
-tocLength = struct.unpack('<B', vpdContents[offset:(offset + 1)])[0]
-offset+=1
-
-# Keep a dictionary of the record names we come across
-recordNames = dict()
-
-# Loop through the toc and read out the record locations
-tocOffset = 0
-while (tocOffset < tocLength):
-    # Get the record name
-    recordName = vpdContents[(tocOffset + offset):(tocOffset + offset + 4)].decode()
-    # Create the entry with the name
-    recordNames[recordName] = RecordInfo()
-    recordNames[recordName].recordName = recordName
-    tocOffset+=4
-    # Skip the record type
-    tocOffset+=2
-    # recordOffset
-    recordNames[recordName].recordOffset = struct.unpack('<H', vpdContents[(tocOffset + offset):(tocOffset + offset + 2)])[0]
-    tocOffset+=2
-    # recordLength
-    recordNames[recordName].recordLength = struct.unpack('<H', vpdContents[(tocOffset + offset):(tocOffset + offset + 2)])[0]
-    tocOffset+=2
-    # eccOffset
-    recordNames[recordName].eccOffset = struct.unpack('<H', vpdContents[(tocOffset + offset):(tocOffset + offset + 2)])[0]
-    tocOffset+=2
-    # eccLength
-    recordNames[recordName].eccLength = struct.unpack('<H', vpdContents[(tocOffset + offset):(tocOffset + offset + 2)])[0]
-    tocOffset+=2
-
-# We have all the record offsets in memory along with the entire VPD image.
-# Go onto our next step and create XML in memory
-
-################################################
-# Create tvpd XML
-out.setIndent(0)
-out.msg("==== Stage 2: Creating tvpd XML")
-out.setIndent(2)
-
-# Create our top level level XML
-vpd = ET.Element("vpd")
-
-# Stick in our required tags
-ET.SubElement(vpd, "name").text = vpdName
-ET.SubElement(vpd, "size").text = "32 kB"
-# VD is in a fixed location in VHDR, just rip it out instead of reading teh VPD to find it
-ET.SubElement(vpd, "VD").text = ("%02X" % struct.unpack('<H', vpdContents[24:26])[0])
-
-recordTvpd = dict()
-# If we are going to be creating individual record vpd files
-# Stash away the top level vpd we created for use below
-if (clCreateRecords):
-    toplevelvpd = vpd
-
-# Loop thru our records and create our record/keyword entries
-for recordItem in (sorted(recordNames.values(), key=operator.attrgetter('recordOffset'))):
-    out.setIndent(2)
-    recordName = recordItem.recordName
-
-    # The little indirection needed when creating individual record files
-    if (clCreateRecords):
-        # Create a different vpd for use throughout below
-        vpd = ET.Element("vpd")
-        # Add a record and rtvpdfile to the toplevelvpd
-        record = ET.SubElement(toplevelvpd, "record", {'name':recordName})
-        ET.SubElement(record, "rtvpdfile").text = vpdName + "-" + recordName + ".tvpd"
-
-    # Create our record
-    record = ET.SubElement(vpd, "record", {'name':recordName})
-
-    # Create the record description
-    ET.SubElement(record, "rdesc").text = "The " + recordName + " record"
-
-    # Start walking thru our record reading keywords out
-    # As we get to each keyword, we'll create the keyword tag and it's sub tags
-    recordOffset = recordItem.recordOffset
-
-    out.msg("Record: %s" % (recordName))
-
-    # Skip the LR tag
-    recordOffset+=1
-
-    # Get the length
-    recordLength = struct.unpack('<H', vpdContents[recordOffset:(recordOffset + 2)])[0]
-    recordOffset+=2
-
-    # Now loop and read until we get until the end of the record
-    recordEnd = recordOffset + recordLength
-    while (recordOffset < recordEnd):
-        # Read the keyword
-        keywordName = vpdContents[recordOffset:(recordOffset + 2)].decode()
-        recordOffset+=2
-
-        # Determine if length is 1 or 2 bytes
-        if (keywordName[0] == "#"):
-            keywordLength = struct.unpack('<H', vpdContents[recordOffset:(recordOffset + 2)])[0]
-            recordOffset+=2
-        else:
-            keywordLength = struct.unpack('<B', vpdContents[recordOffset:(recordOffset + 1)])[0]
-            recordOffset+=1
+def main():
+    # Only needed to run as a tool, not by the tools that import this file
+    import argparse
+    import textwrap
+
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Reverses a VPD image into XML template files', add_help=False, formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./reverseVpd.py -v image.vpd -o /tmp
+                                       ./reverseVpd.py -v pnor.bin -o /tmp --scan
+                                       ./reverseVpd.py -v image.vpd -o /tmp -e VINI,VSYS
+                                       ./reverseVpd.py -v image.vpd -o /tmp --json
+                                       ./reverseVpd.py -v image.vpd -o /tmp --bin-threshold 64
+                                       ./reverseVpd.py -v /sys/bus/i2c/devices/8-0050/eeprom -o /tmp --lazy
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-v', '--vpdfile', help='The valid vpd formatted input file', required=True)
+    reqgroup.add_argument('-o', '--outpath', help='The output path for the files created by the tool', required=True)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-d', '--debug', help="Enables debug printing",action="store_true")
+    optgroup.add_argument('-r', '--create-records', help="Create tvpd files for each record in the vpd",action="store_true")
+    optgroup.add_argument('-b', '--binary-records', help="Write the records to rbinfiles instead of keyword xml, except those given with -e",action="store_true")
+    optgroup.add_argument('-e', '--expand-records', help="Comma separated list of the records to expand into keyword xml, the rest are written to rbinfiles")
+    optgroup.add_argument('-s', '--scan', help="The vpd file is a larger dump (flash, eeprom), reverse every vpd image found in it",action="store_true")
+    optgroup.add_argument('--json', help="Write json templates instead of tvpd xml",action="store_true")
+    optgroup.add_argument('-t', '--bin-threshold', help="Write the keywords that aren't ascii and have over this many bytes before their trailing zeros to bin files instead of hex in the templates", type=int)
+    optgroup.add_argument('--lazy', help="Only read the VHDR, VTOC and records from the vpd file, for an eeprom or other slow device",action="store_true")
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # Get the manifest file and get this party started
+    clVpdFile = args.vpdfile
+
+    # Look for output path
+    clOutputPath = args.outpath
+    # Make sure the path exists, we aren't going to create it
+    if (os.path.exists(clOutputPath) != True):
+        out.error("The given output path %s does not exist!" % clOutputPath)
+        out.error("Please create the output directory and run again")
+        exit(1)
 
-        # Get the keyword data out
-        keywordData = vpdContents[recordOffset:(recordOffset + keywordLength)]
-        recordOffset+=keywordLength
+    # Debug printing
+    clDebug = args.debug
 
-        # If the keyword is PF, we are at the end at skip it
-        if (keywordName == "PF"):
-            continue
+    # Create separate tvpd files for each record
+    clCreateRecords = args.create_records
 
-        # Create our keyword tag and subtags
-        keyword = ET.SubElement(record, "keyword", {"name":keywordName})
-        ET.SubElement(keyword, "kwdesc").text = "The " + keywordName + " keyword"
-        ET.SubElement(keyword, "kwlen").text = str(keywordLength)
-        # This is overly complicated in my opinion, but the only way I could get it to work with the time allowed
-        # First strip off any trailing zero byte values.  If you don't, then it's outside the ascii range and it thinks all data is hex
-        # Then try to decode the data from ascii.  If a byte is outside the range (like 0xff), it will throw the exception
-        # If it doesn't throw the exception, then check to make sure the string contains only chars we allow in VPD.  Otherwise, hex
-
-        # Walk backwords and bail the first time a nonzero value is found
-        nzeroidx = len(keywordData) - 1
-        while (nzeroidx >= 0):
-            if (keywordData[nzeroidx] != 0x00):
-                break;
-            nzeroidx-=1
-
-        # If we didn't get back to the start, shorten the data
-        if (nzeroidx >= 0):
-            keywordData = keywordData[0:(nzeroidx+1)]
-        # Made it all the way to the start, must be all zero.  Shorten it to just the first zero byte to put into the template
-        else:
-            keywordData = keywordData[0:1]
+    # Search the input for images
+    clScan = args.scan
 
-        # Now try to decode and figure out hex vs ascii
-        try:
-            keywordData.decode('ascii')
-        except UnicodeDecodeError:
-            asciiState = False
-        else:
-            if asciiAllowed(keywordData.decode('ascii')):
-                asciiState = True
-            else:
-                asciiState = False
-
-        # We know if its ascii or not, store away our data
-        if (asciiState):
-            ET.SubElement(keyword, "kwformat").text = "ascii"
-            ET.SubElement(keyword, "kwdata").text = keywordData.decode()
-        else:
-            ET.SubElement(keyword, "kwformat").text = "hex"
-            ET.SubElement(keyword, "kwdata").text = binascii.hexlify(keywordData).decode()
+    # Write json templates
+    clJson = args.json
 
-        out.setIndent(4)
-        out.msg("Keyword: %s Type: %5s Length: %s" % (keywordName, ("ascii" if (asciiState) else "hex"), str(keywordLength)))
+    # The keywords to leave in bin files
+    clBinThreshold = args.bin_threshold
+    if (clBinThreshold != None and clBinThreshold < 0):
+        out.error("The bin threshold can't be negative")
+        exit(1)
+
+    # Read the vpd file a piece at a time
+    clLazy = args.lazy
+
+    # The records to expand into keyword xml, None for all of them
+    # Giving records to expand means the rest go to rbinfiles, with or without -b
+    clExpandRecords = None
+    if (args.binary_records or args.expand_records != None):
+        clExpandRecords = set()
+        if (args.expand_records != None):
+            clExpandRecords = set(name.strip() for name in args.expand_records.split(",") if (name.strip() != ""))
+
+    # Create our output name from the input name
+    vpdName = os.path.splitext(os.path.basename(clVpdFile))[0]
+
+    if (clScan):
+        exit(scanDump(clVpdFile, vpdName, clOutputPath, clCreateRecords, clExpandRecords, clJson, clBinThreshold))
+
+    ################################################
+    # Read in the VPD file and break it apart
+    out.setIndent(0)
+    out.msg("==== Stage 1: Parsing the VPD file")
+    out.setIndent(2)
 
-    # We should be done with all the keywords, which means it's pointing to the SR tag
-    if (struct.unpack('<B', vpdContents[recordOffset:(recordOffset + 1)])[0] != 0x78):
-        out.error("Small resource tag not found!")
+    # Break it apart into the records and keywords using the VTOC
+    # Lazy reads only what the VTOC points to, the ecc and anything after the image stay on the device
+    try:
+        if (clLazy):
+            vpdContents = vpddevice.DeviceReader(clVpdFile)
+            vpdImage = vpddevice.readImage(vpdContents, vpdName)
+            out.msg("Read %d of %d bytes in %d reads" % (vpdContents.bytesRead, len(vpdContents), vpdContents.reads))
+        else:
+            vpdContents = open(clVpdFile, mode='rb').read()
+            vpdImage = vpdmodel.VpdImage.fromBytes(vpdContents, vpdName)
+    except vpdmodel.VpdError as e:
+        out.error(str(e))
+        exit(1)
+    except (IOError, OSError) as e:
+        out.error("Unable to read %s: %s" % (clVpdFile, e))
         exit(1)
 
-    # Handle our indirection and add the record vpd to our dict for printing below
-    if (clCreateRecords):
-        recordTvpd[recordName] = vpd
-
-# All done with records, cleanup our indirection
-if (clCreateRecords):
-    vpd = toplevelvpd
-
-# We now have a correct tvpd, use it to create a binary VPD image
-out.setIndent(0)
-out.msg("==== Stage 3: Writing the tvpd output file")
-out.setIndent(2)
-# Create our output file names 
-tvpdFileName = clOutputPath + "/" + vpdName + ".tvpd"
-
-# This is our easy one, write the XML back out
-# Write out the full template vpd representing the data contained in our image
-writeTvpd(vpd, tvpdFileName)
-out.msg("Wrote tvpd file: %s" % tvpdFileName)
-
-# Now rip it through xmllint quick to cleanup formatting problems from the ET print
-if (os.path.isfile("/usr/bin/xmllint")):
-    rc = os.system("/usr/bin/xmllint --format %s -o %s" % (tvpdFileName, tvpdFileName))
+    # We have all the records and keywords in memory
+    # Go onto our next step and create XML in memory and write it out
+    rc = reverseImage(vpdImage, vpdContents, clOutputPath, clCreateRecords, clExpandRecords, clJson, clBinThreshold)
     if (rc):
-        out.error("Error occurred calling xmllint to fix xml formatting")
         exit(rc)
-else:
-    out.warn("xmllint not installed - no formatting cleanup done!")
 
-# Write the sub files
-if (clCreateRecords):
-    # This can be in whatever order, we don't care
-    for recordName in recordNames:
-        
-        # Create our output file names 
-        tvpdFileName = clOutputPath + "/" + vpdName + "-" + recordName + ".tvpd"
-        
-        # This is our easy one, write the XML back out
-        # Write out the full template vpd representing the data contained in our image
-        writeTvpd(recordTvpd[recordName], tvpdFileName)
-        out.msg("Wrote tvpd file: %s" % tvpdFileName)
-
-        # Now rip it through xmllint quick to cleanup formatting problems from the ET print
-        rc = os.system("xmllint --format %s -o %s" % (tvpdFileName, tvpdFileName))
-        if (rc):
-            out.error("Unable to call xmllint to fixing xml formatting")
-            exit(rc)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# Program to serve VPD images built from templates held in memory
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/pymod");
+import out
+import createVpd
+import argparse
+import textwrap
+import asyncio
+import json
+import time
+import collections
+import concurrent.futures
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class TemplateInfo:
+    """Stores a template that has been loaded and verified"""
+    def __init__(self):
+        # The image model created from the verified manifest, the xml isn't kept
+        self.image = None
+        # The max size of the image from the <size> tag
+        self.maxSizeBytes = None
+        # The input path used to find the files referenced by the template
+        self.inputPath = None
+        # The files the manifest was created from, with the (mtime, size) they had when read
+        self.files = dict()
+
+class Metrics:
+    """Tracks the request latency and throughput of the server"""
+    def __init__(self, window):
+        # The time the server was started
+        self.startTime = time.time()
+        # Number of requests in the window used for the rate and latency numbers
+        self.window = window
+        # Total counts since the server was started
+        self.requests = 0
+        self.errors = 0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.bytesServed = 0
+        # The (end time, latency) of the most recent requests
+        self.recent = collections.deque(maxlen=window)
+
+    def add(self, latency, errors, cacheHit, size):
+        self.requests += 1
+        if (errors):
+            self.errors += 1
+        if (cacheHit):
+            self.cacheHits += 1
+        else:
+            self.cacheMisses += 1
+        self.bytesServed += size
+        self.recent.append((time.time(), latency))
+
+    def report(self):
+        now = time.time()
+        latencies = sorted(entry[1] for entry in self.recent)
+        # Percentile from the sorted latencies, in ms
+        def percentile(pct):
+            if (len(latencies) == 0):
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000
+        # The rate over the recent requests, or since start if there aren't enough to span any time
+        if (len(self.recent) > 1 and now > self.recent[0][0]):
+            rate = len(self.recent) / (now - self.recent[0][0])
+        else:
+            rate = self.requests / max(now - self.startTime, 0.001)
+        return {"uptime" : round(now - self.startTime, 3),
+                "requests" : self.requests,
+                "errors" : self.errors,
+                "cacheHits" : self.cacheHits,
+                "cacheMisses" : self.cacheMisses,
+                "bytesServed" : self.bytesServed,
+                "requestsPerSec" : round(rate, 3),
+                "latencyMs" : {"window" : len(latencies),
+                               "avg" : round((sum(latencies) / len(latencies) * 1000) if latencies else 0.0, 3),
+                               "p50" : round(percentile(50), 3),
+                               "p95" : round(percentile(95), 3),
+                               "p99" : round(percentile(99), 3),
+                               "max" : round((latencies[-1] * 1000) if latencies else 0.0, 3)}}
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The templates loaded in this process, by full path of the template file
+# Each worker process keeps its own copy
+templates = dict()
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Get the (mtime, size) used to tell if a file has changed
+def fileStamp(fileName):
+    try:
+        st = os.stat(fileName)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+# Load and verify a template using stage 1 and 2 of createVpd
+def loadTemplate(templateFile, inputPath):
+    template = TemplateInfo()
+    template.inputPath = inputPath
+
+    createVpd.clInputPath = inputPath
+    (errorsFound, manifest) = createVpd.loadManifest(templateFile)
+    if (manifest == None or errorsFound):
+        return (max(errorsFound, 1), None)
+
+    (errorsFound, vpdName, maxSizeBytes) = createVpd.verifyManifest(manifest, templateFile)
+    if (errorsFound):
+        return (errorsFound, None)
+
+    template.image = createVpd.manifestToImage(manifest, vpdName)
+    template.maxSizeBytes = maxSizeBytes
+    for fileName in createVpd.inputFiles:
+        template.files[fileName] = fileStamp(fileName)
+
+    return (0, template)
+
+# Check if any of the files a template was created from have changed since it was loaded
+def templateChanged(template):
+    for fileName in template.files:
+        if (fileStamp(fileName) != template.files[fileName]):
+            return True
+    return False
+
+# Build an image from a template, loading it first if it isn't in memory or has changed
+# This is run in the worker processes, so all output is captured and handed back with the result
+def buildImage(templateFile, inputPath, overrides):
+    out.startCapture()
+    cacheHit = False
+    image = None
+
+    template = templates.get(templateFile)
+    if (template != None and template.inputPath == inputPath and not templateChanged(template)):
+        cacheHit = True
+        errorsFound = 0
+    else:
+        templates.pop(templateFile, None)
+        (errorsFound, template) = loadTemplate(templateFile, inputPath)
+        if (template != None):
+            templates[templateFile] = template
+
+    if (not errorsFound):
+        errorsFound += createVpd.checkOverrides(template.image, overrides)
+
+    if (not errorsFound):
+        image = createVpd.applyOverrides(template.image, overrides).pack()
+        errorsFound += createVpd.checkImageSize(len(image), template.maxSizeBytes)
+
+    messages = out.stopCapture()
+    if (errorsFound):
+        return (errorsFound, None, None, messages, cacheHit)
+    return (0, template.image.name, bytes(image), messages, cacheHit)
+
+# Find the template file for a request in the template search path
+def findTemplate(templateName, templatePath):
+    # Requests can only name files under the template path
+    if (os.path.isabs(templateName) or ".." in templateName.split("/")):
+        return None
+    return createVpd.findFile(templateName, templatePath)
+
+# Send a http response and close the connection
+async def sendResponse(writer, status, contentType, body, headers = None):
+    reasons = {200 : "OK", 400 : "Bad Request", 404 : "Not Found", 405 : "Method Not Allowed", 422 : "Unprocessable Entity",
+               500 : "Internal Server Error"}
+    lines = ["HTTP/1.0 %d %s" % (status, reasons.get(status, "Error")),
+             "Content-Type: %s" % contentType,
+             "Content-Length: %d" % len(body),
+             "Connection: close"]
+    for header in (headers or {}):
+        lines.append("%s: %s" % (header, headers[header]))
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+# Send a json response
+async def sendJson(writer, status, data):
+    await sendResponse(writer, status, "application/json", (json.dumps(data, indent=2) + "\n").encode())
+
+# Handle a single http request
+#  GET /metrics - returns the request latency and throughput metrics
+#  POST /build - body is {"template" : name, "keywords" : {record : {keyword : data}}}, returns the image
+async def handleClient(reader, writer, server):
+    try:
+        requestLine = (await reader.readline()).decode("latin-1").split()
+        headers = dict()
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if (line in ("\r\n", "\n", "")):
+                break
+            (name, sep, value) = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    except (ValueError, asyncio.IncompleteReadError):
+        await sendJson(writer, 400, {"errors" : ["Malformed http request"]})
+        return
+
+    if (len(requestLine) < 2):
+        await sendJson(writer, 400, {"errors" : ["Malformed http request"]})
+        return
+    (method, path) = requestLine[0:2]
+
+    if (path == "/metrics"):
+        await sendJson(writer, 200, server.metrics.report())
+        return
+
+    if (path != "/build"):
+        await sendJson(writer, 404, {"errors" : ["Unknown path %s, use /build or /metrics" % path]})
+        return
+
+    if (method != "POST"):
+        await sendJson(writer, 405, {"errors" : ["Images are requested with a POST to /build"]})
+        return
+
+    startTime = time.time()
+    try:
+        request = json.loads(body.decode())
+        templateName = request["template"]
+        if (not isinstance(templateName, str) or templateName == ""):
+            raise ValueError("template must be the file name of a template")
+        overrides = request.get("keywords", dict())
+        if (not isinstance(overrides, dict) or not all(isinstance(overrides[record], dict) for record in overrides)):
+            raise ValueError("keywords must be a dictionary of records, each a dictionary of keywords")
+        # The data is given like kwdata in a template, ascii text or hex digits, never a number or a list
+        badValues = ["%s:%s" % (record, keyword) for record in sorted(overrides) for keyword in sorted(overrides[record])
+                     if (not isinstance(overrides[record][keyword], str))]
+        if (len(badValues)):
+            raise ValueError("keyword data must be a string for %s" % ", ".join(badValues))
+    except (ValueError, KeyError, TypeError) as e:
+        server.metrics.add(time.time() - startTime, 1, False, 0)
+        await sendJson(writer, 400, {"errors" : ["Invalid build request: %s" % e]})
+        return
+
+    templateFile = findTemplate(templateName, server.templatePath)
+    if (templateFile == None):
+        server.metrics.add(time.time() - startTime, 1, False, 0)
+        await sendJson(writer, 404, {"errors" : ["The template %s could not be found in the template path" % templateName]})
+        return
+
+    # The template directory is always searched first for the files it references
+    inputPath = os.path.dirname(templateFile) + os.pathsep + server.inputPath
+
+    # Packing is cpu bound, run it in the worker pool so other requests can keep being served
+    loop = asyncio.get_event_loop()
+    try:
+        (errorsFound, vpdName, image, messages, cacheHit) = await loop.run_in_executor(server.pool, buildImage,
+                                                                                       templateFile, inputPath, overrides)
+    except Exception as e:
+        # A bug in the build, or a worker that died, fails this request without taking down the server
+        latency = time.time() - startTime
+        server.metrics.add(latency, 1, False, 0)
+        out.error("Failed %s with an exception in %.3fs: %s" % (templateName, latency, e))
+        await sendJson(writer, 500, {"errors" : ["The image for %s could not be built: %s" % (templateName, e)]})
+        return
+    latency = time.time() - startTime
+    server.metrics.add(latency, errorsFound, cacheHit, len(image) if image else 0)
+
+    if (server.debug):
+        for line in messages:
+            out.debug(line)
+
+    if (errorsFound):
+        out.msg("Failed %s with %d error%s in %.3fs" % (templateName, errorsFound, "s" if (errorsFound > 1) else "", latency))
+        await sendJson(writer, 422, {"errors" : [line.strip() for line in messages if "ERROR:" in line]})
+        return
+
+    out.msg("Built %s (%d bytes) in %.3fs" % (templateName, len(image), latency))
+    await sendResponse(writer, 200, "application/octet-stream", image,
+                       {"X-Vpd-Name" : vpdName, "X-Vpd-Cache" : "hit" if cacheHit else "miss"})
+
+async def serve(server, socketPath, port):
+    handler = lambda reader, writer: handleClient(reader, writer, server)
+    if (socketPath != None):
+        # Clean up the socket from a previous run
+        if (os.path.exists(socketPath)):
+            os.unlink(socketPath)
+        listener = await asyncio.start_unix_server(handler, path=socketPath)
+        out.msg("Listening on unix socket %s" % socketPath)
+    else:
+        listener = await asyncio.start_server(handler, host="127.0.0.1", port=port)
+        out.msg("Listening on http://127.0.0.1:%d" % port)
+
+    async with listener:
+        await listener.serve_forever()
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Serves VPD images built from templates kept in memory', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./serveVpd.py -t examples/p10 -s /tmp/vpd.sock
+                                       curl --unix-socket /tmp/vpd.sock -o vpd.bin http://localhost/build \\
+                                            -d '{"template" : "bmc/p10_bmc_template.tvpd", "keywords" : {"VINI" : {"SN" : "YL1234"}}}'
+                                       curl --unix-socket /tmp/vpd.sock http://localhost/metrics
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments (one of)')
+    listengroup = reqgroup.add_mutually_exclusive_group(required=True)
+    listengroup.add_argument('-s', '--socket', help='The unix socket to listen on')
+    listengroup.add_argument('-p', '--port', help='The localhost http port to listen on', type=int)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-d', '--debug', help="Enables debug printing", action="store_true")
+    optgroup.add_argument('-t', '--templates', help="The search path to find the templates named in requests", default=".")
+    optgroup.add_argument('-i', '--inpath', help="The search path to use for the files referenced in the templates")
+    optgroup.add_argument('-w', '--workers', help="The number of worker processes to build images, each keeps its own loaded templates",
+                          type=int, default=os.cpu_count())
+    optgroup.add_argument('--window', help="The number of recent requests used for the latency and throughput metrics",
+                          type=int, default=1000)
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    # Same input path rules as createVpd, the CWD is always looked at
+    inputPath = "."
+    if (args.inpath != None):
+        inputPath = args.inpath + os.pathsep + "."
+
+    server = argparse.Namespace()
+    server.templatePath = args.templates
+    server.inputPath = inputPath
+    server.debug = args.debug
+    server.metrics = Metrics(args.window)
+    server.pool = concurrent.futures.ProcessPoolExecutor(max_workers=max(args.workers, 1))
+
+    try:
+        asyncio.run(serve(server, args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown()
+        if (args.socket != None and os.path.exists(args.socket)):
+            os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
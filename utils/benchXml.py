@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Program to compare the xml backends on how fast they read and write templates, and that they give the same tvpd
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/..");
+sys.path.insert(0,scriptPath + "/../pymod");
+import out
+import vpdxml
+import createVpd
+import argparse
+import textwrap
+import io
+import time
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+rootPath = os.path.dirname(scriptPath)
+
+# The largest of the example templates, the p9 one has the MEMD record
+TEMPLATES = ["examples/p9/sysplanar32_ddr4/sysplanar32_ddr4.tvpd", "examples/p10/sysplanar/p10_sysplanar_template.tvpd"]
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Read in a template and all its files the way createVpd stage 1 does, then write the tvpd
+# Returns the errors found, the tvpd and the (read, write) times in seconds
+def readWrite(templateFile):
+    createVpd.clInputPath = os.path.dirname(templateFile)
+
+    out.startCapture()
+    startTime = time.perf_counter()
+    (errorsFound, manifest) = createVpd.loadManifest(os.path.basename(templateFile))
+    readTime = time.perf_counter() - startTime
+    messages = out.stopCapture()
+    if (manifest == None or errorsFound):
+        for message in messages:
+            out.msg(message)
+        return (max(errorsFound, 1), None, None)
+
+    tvpd = io.BytesIO()
+    startTime = time.perf_counter()
+    vpdxml.write(manifest, tvpd)
+    writeTime = time.perf_counter() - startTime
+
+    return (0, tvpd.getvalue(), (readTime, writeTime))
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Compares the xml backends on reading and writing templates', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./utils/benchXml.py
+                                       ./utils/benchXml.py -n 100 -t examples/p10/bmc/p10_bmc_template.tvpd
+                                     '''))
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-t', '--templates', help="The templates to read and write, the largest examples by default", nargs="+",
+                          default=[os.path.join(rootPath, template) for template in TEMPLATES])
+    optgroup.add_argument('-n', '--runs', help="The number of times to read and write each template, the best time is shown", type=int, default=50)
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    errorsFound = 0
+    backends = vpdxml.available()
+    out.msg("Backends: %s" % ", ".join(backends))
+
+    for templateFile in args.templates:
+        out.msg("%s" % templateFile)
+        out.setIndent(2)
+
+        tvpds = dict()
+        for backend in backends:
+            vpdxml.setBackend(backend)
+            best = None
+            for run in range(max(args.runs, 1)):
+                (rc, tvpd, times) = readWrite(templateFile)
+                if (rc):
+                    break
+                best = times if (best == None) else (min(best[0], times[0]), min(best[1], times[1]))
+            if (rc):
+                errorsFound += rc
+                continue
+            tvpds[backend] = tvpd
+            out.msg("%-8s read %8.3fms  write %8.3fms" % (backend, best[0] * 1000, best[1] * 1000))
+
+        # The tvpd has to be the same whichever backend read it in
+        for backend in tvpds:
+            if (tvpds[backend] != tvpds[backends[0]]):
+                out.error("The tvpd from the %s backend is different from the %s backend" % (backend, backends[0]))
+                errorsFound += 1
+        out.setIndent(0)
+
+    exit(errorsFound)
+
+if __name__ == "__main__":
+    main()
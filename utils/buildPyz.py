@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Program to package the tools into a single executable zipapp that starts fast
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# Running createVpd.py directly compiles the whole script on every run, python only caches the modules a script imports
+# The zipapp holds every tool and pymod with the compiled code next to the source, so nothing is compiled at startup
+# The compiled code is for the python that runs this, the zipapp has to be run with the same version
+#
+# The tool to run is picked by the name the zipapp is run as, or by the first argument
+#   ./vpdtools.pyz create -m simple.tvpd -o /tmp
+#   ln -s vpdtools.pyz createVpd; ./createVpd -m simple.tvpd -o /tmp
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/../pymod");
+import out
+import argparse
+import textwrap
+import zipfile
+import py_compile
+import tempfile
+import stat
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+rootPath = os.path.dirname(scriptPath)
+
+# The tools in the zipapp, by the command that runs them
+TOOLS = {"create" : "createVpd", "reverse" : "reverseVpd", "serve" : "serveVpd",
+         "archive" : "archiveVpd", "check" : "checkVpd", "index" : "indexVpd",
+         "read" : "readVpd", "layout" : "layoutVpd"}
+
+# The code run when the zipapp is started, kept small since it's the one part compiled every time
+MAIN = '''\
+# Runs one of the vpd tools, picked by the name this is run as or by the first argument
+import os
+import sys
+TOOLS = %r
+name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+if (name not in TOOLS.values()):
+    if (len(sys.argv) < 2 or sys.argv[1] not in TOOLS):
+        sys.stderr.write("usage: %%s {%%s} [args]\\n" %% (os.path.basename(sys.argv[0]), ",".join(sorted(TOOLS))))
+        sys.exit(2)
+    name = TOOLS[sys.argv.pop(1)]
+    sys.argv[0] = name + ".py"
+__import__(name).main()
+'''
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Add a python file to the zipapp, along with its compiled code under the name zipimport looks for
+def addModule(pyz, sourceFile, archiveName):
+    pyz.write(sourceFile, archiveName)
+
+    # The hash based pyc isn't checked against the source, the zipapp is never changed once built
+    with tempfile.TemporaryDirectory() as tempPath:
+        compiledFile = os.path.join(tempPath, "module.pyc")
+        py_compile.compile(sourceFile, cfile=compiledFile, dfile=archiveName, doraise=True,
+                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+        pyz.write(compiledFile, archiveName + "c")
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Packages the vpd tools into a single executable zipapp', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./utils/buildPyz.py -o /tmp/vpdtools.pyz
+                                       /tmp/vpdtools.pyz create -m examples/simple/simple.tvpd -o /tmp
+                                     '''))
+    # Create our group of required command line args
+    reqgroup = parser.add_argument_group('Required Arguments')
+    reqgroup.add_argument('-o', '--output', help='The zipapp file to create', required=True)
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-p', '--python', help="The interpreter for the #! line, it has to be the same version as this one",
+                          default="/usr/bin/env python%d.%d" % sys.version_info[0:2])
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    if (os.path.isdir(os.path.dirname(os.path.abspath(args.output))) != True):
+        out.error("The directory for %s does not exist!" % args.output)
+        exit(1)
+
+    # Build into a temp file next to the output, then move it into place
+    tempFile = args.output + ".tmp"
+    with open(tempFile, "wb") as pyzFile:
+        pyzFile.write(("#!%s\n" % args.python).encode())
+        with zipfile.ZipFile(pyzFile, "w", compression=zipfile.ZIP_STORED) as pyz:
+            pyz.writestr("__main__.py", MAIN % TOOLS)
+            for tool in sorted(TOOLS.values()):
+                addModule(pyz, os.path.join(rootPath, tool + ".py"), tool + ".py")
+            for fileName in sorted(os.listdir(os.path.join(rootPath, "pymod"))):
+                if (fileName.endswith(".py")):
+                    addModule(pyz, os.path.join(rootPath, "pymod", fileName), "pymod/" + fileName)
+    os.chmod(tempFile, os.stat(tempFile).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.replace(tempFile, args.output)
+
+    out.msg("Wrote %s with %s for python %d.%d" % (args.output, ", ".join(sorted(TOOLS.values())), sys.version_info[0], sys.version_info[1]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python
+# Program to run the tests/pass and tests/fail cases and check them against their expected results
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# Every case is run with the tools in this tree, each in its own temp directory
+#   pass - every tvpd and json template under tests/pass is built and the image compared byte for byte to tests/golden/pass
+#          The image is then reversed and the reversed templates built again, which has to give the same image
+#          Building with --stream has to give the same image and template
+#   fail - the tvpd or json template in each tests/fail directory is built and has to fail with the return code and
+#          ERROR lines in tests/golden/fail/<case>.txt, with and without --stream
+#          Nothing from the image can be written, no vpd and none of the rvpd and kvpd files asked for with -r and -k
+#   startup - each tool is imported as a library and run with -h, with the compiled code cached like an installed tool
+#          Both have to be under their time budget, and importing can't load the modules the tools only load when used
+# The time of each case is compared to tests/golden/timings.json to catch cases that got slower
+# --update writes all of the golden files from the current tools
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/../pymod");
+import out
+import argparse
+import textwrap
+import subprocess
+import tempfile
+import json
+import time
+import concurrent.futures
+
+############################################################
+# Classes - Classes - Classes - Classes - Classes - Classes
+############################################################
+class Case:
+    """A pass, fail or startup case and what happened when it was run"""
+    def __init__(self, kind, name, tvpdFile):
+        # pass, fail or startup
+        self.kind = kind
+        # The path of the tvpd under tests/pass, the directory name under tests/fail or the module name
+        self.name = name
+        # The full path of the tvpd to build, None for startup cases
+        self.tvpdFile = tvpdFile
+        # What was found when the case was run, empty if it passed
+        self.failures = list()
+        # The image built for a pass case, or the rc and ERROR lines of a fail case
+        self.result = None
+        self.elapsed = 0.0
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+rootPath = os.path.dirname(scriptPath)
+passPath = os.path.join(rootPath, "tests", "pass")
+failPath = os.path.join(rootPath, "tests", "fail")
+goldenPath = os.path.join(rootPath, "tests", "golden")
+timingsFile = os.path.join(goldenPath, "timings.json")
+
+# A case has to be this much slower than its recorded time, on top of the slowdown factor, to be flagged
+# Keeps cases that only take a fraction of a second from being flagged for the noise of starting python
+SLOW_ALLOWANCE = 0.25
+
+# The modules checked for startup time, and the modules importing them must not load
+# Station scripts run these hundreds of times, and most runs never need the xml or command line code
+STARTUP_MODULES = {"createVpd" : ["xml.etree.ElementTree", "json", "argparse"],
+                   "reverseVpd" : ["xml.etree.ElementTree", "json", "argparse"],
+                   "vpdmodel" : ["xml.etree.ElementTree", "json", "argparse"]}
+
+# Startup times are the best of this many runs, to keep other load on the machine out of them
+STARTUP_RUNS = 5
+
+# Run in a fresh python to time importing a module and list what it loaded
+STARTUP_CODE = """import sys, time
+sys.path[0:0] = [%r, %r]
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+print(" ".join(sys.modules))
+"""
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# Run one of the tools in this tree, returns the rc and everything it printed
+def runTool(tool, args, cwd):
+    process = subprocess.run([sys.executable, os.path.join(rootPath, tool)] + args, cwd=cwd,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return (process.returncode, process.stdout.decode("utf-8", "replace"))
+
+# Find the one file with the extension in a directory, None if there isn't exactly one
+def findOutput(path, extension):
+    found = [fileName for fileName in os.listdir(path) if (fileName.endswith(extension))]
+    if (len(found) != 1):
+        return None
+    return os.path.join(path, found[0])
+
+# If a file is a full template, a tvpd or a json template with a size
+# The record and keyword json files some templates include aren't built on their own
+def isTemplate(fileName):
+    if (fileName.endswith(".tvpd")):
+        return True
+    if (fileName.endswith(".json")):
+        with open(fileName, "rb") as f:
+            template = json.loads(f.read())
+        return (isinstance(template, dict) and "size" in template)
+    return False
+
+# Find all the cases
+# The pass cases are every full template under tests/pass, the record files some of them include aren't built on their own
+def findCases():
+    cases = list()
+    for (dirPath, dirNames, fileNames) in os.walk(passPath, followlinks=True):
+        dirNames.sort()
+        for fileName in sorted(fileNames):
+            tvpdFile = os.path.join(dirPath, fileName)
+            if (isTemplate(tvpdFile)):
+                cases.append(Case("pass", os.path.relpath(tvpdFile, passPath), tvpdFile))
+    for name in sorted(os.listdir(failPath)):
+        tvpdFile = findOutput(os.path.join(failPath, name), ".tvpd") or findOutput(os.path.join(failPath, name), ".json")
+        if (tvpdFile != None):
+            cases.append(Case("fail", name, tvpdFile))
+    for name in sorted(STARTUP_MODULES):
+        cases.append(Case("startup", name, None))
+    return cases
+
+# The golden file for a case
+def goldenFile(case):
+    if (case.kind == "pass"):
+        return os.path.join(goldenPath, "pass", os.path.splitext(case.name)[0] + ".vpd")
+    return os.path.join(goldenPath, "fail", case.name + ".txt")
+
+# Build a pass case, then reverse the image and build it again
+# A json template is reversed into json templates, so both formats make the round trip
+def runPass(case, workPath):
+    casePath = os.path.dirname(case.tvpdFile)
+    extension = os.path.splitext(case.tvpdFile)[1]
+    createPath = os.path.join(workPath, "create")
+    reversePath = os.path.join(workPath, "reverse")
+    rebuildPath = os.path.join(workPath, "rebuild")
+    streamPath = os.path.join(workPath, "stream")
+    for path in [createPath, reversePath, rebuildPath, streamPath]:
+        os.mkdir(path)
+
+    (rc, output) = runTool("createVpd.py", ["-m", case.tvpdFile, "-i", casePath, "-o", createPath], casePath)
+    vpdFile = findOutput(createPath, ".vpd")
+    if (rc or vpdFile == None):
+        case.failures.append("createVpd.py failed with rc %d" % rc)
+        case.failures.extend(line.strip() for line in output.splitlines() if ("ERROR" in line))
+        return
+    case.result = open(vpdFile, mode='rb').read()
+
+    # Streaming the manifest a record at a time has to write the same files
+    (rc, output) = runTool("createVpd.py", ["-m", case.tvpdFile, "-i", casePath, "-o", streamPath, "--stream"], casePath)
+    if (rc):
+        case.failures.append("createVpd.py failed with rc %d with --stream" % rc)
+        case.failures.extend(line.strip() for line in output.splitlines() if ("ERROR" in line))
+    for outputExtension in [".vpd", extension]:
+        streamFile = findOutput(streamPath, outputExtension)
+        if (streamFile == None or open(streamFile, mode='rb').read() != open(findOutput(createPath, outputExtension), mode='rb').read()):
+            case.failures.append("The %s file written with --stream doesn't match the one written without it" % outputExtension)
+
+    # Round trip, the reversed templates have to build the exact same image
+    (rc, output) = runTool("reverseVpd.py", ["-v", vpdFile, "-o", reversePath] + (["--json"] if (extension == ".json") else []), workPath)
+    tvpdFile = findOutput(reversePath, extension)
+    if (rc or tvpdFile == None):
+        case.failures.append("reverseVpd.py failed with rc %d" % rc)
+        return
+    (rc, output) = runTool("createVpd.py", ["-m", tvpdFile, "-i", reversePath, "-o", rebuildPath], workPath)
+    rebuildFile = findOutput(rebuildPath, ".vpd")
+    if (rc or rebuildFile == None):
+        case.failures.append("createVpd.py failed with rc %d on the reversed templates" % rc)
+        return
+    if (open(rebuildFile, mode='rb').read() != case.result):
+        case.failures.append("The image built from the reversed templates doesn't match the image reversed")
+
+# Build a fail case and keep the rc and ERROR lines
+# The case directory is taken out of the messages so they are the same wherever the tree is
+def runFail(case, workPath):
+    casePath = os.path.dirname(case.tvpdFile)
+    args = ["-m", os.path.basename(case.tvpdFile), "-o", workPath, "-r", "-k", "--verify"]
+    (rc, output) = runTool("createVpd.py", args, casePath)
+    errors = [line.strip().replace(casePath + os.sep, "") for line in output.splitlines() if ("ERROR" in line)]
+    case.result = "rc %d\n" % rc + "".join(error + "\n" for error in errors)
+    if (rc == 0):
+        case.failures.append("createVpd.py passed, it was expected to fail")
+    checkNoImage(case, workPath)
+
+    # Streaming has to find the same errors, they can come out in a different order
+    (rc, output) = runTool("createVpd.py", args + ["--stream"], casePath)
+    streamErrors = [line.strip().replace(casePath + os.sep, "") for line in output.splitlines() if ("ERROR" in line)]
+    if (("rc %d\n" % rc) != case.result.splitlines(True)[0] or sorted(streamErrors) != sorted(errors)):
+        case.failures.append("createVpd.py with --stream gave rc %d and different errors" % rc)
+    checkNoImage(case, workPath)
+
+# A build that failed can't leave an image behind, it could be flashed as if it was good
+def checkNoImage(case, workPath):
+    for fileName in sorted(os.listdir(workPath)):
+        if (os.path.splitext(fileName)[1] in [".vpd", ".rvpd", ".kvpd"]):
+            case.failures.append("createVpd.py failed but wrote %s" % fileName)
+
+# Time importing a module and running it as a tool, the best of STARTUP_RUNS each
+# The compiled code is cached in the temp directory, so it's timed the way an installed tool starts
+def runStartup(case, workPath, importBudget, startBudget):
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = workPath
+    code = STARTUP_CODE % (rootPath, os.path.join(rootPath, "pymod"), case.name)
+
+    importTime = None
+    for run in range(STARTUP_RUNS + 1):
+        process = subprocess.run([sys.executable, "-c", code], cwd=workPath, env=env,
+                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.stdout.decode("utf-8", "replace").splitlines()
+        if (process.returncode or len(output) != 2):
+            case.failures.append("Importing %s failed: %s" % (case.name, " ".join(output)))
+            return
+        # The first run compiles and caches the code, it isn't counted
+        if (run):
+            importTime = min(float(output[0]), importTime if (importTime != None) else float(output[0]))
+    modules = output[1].split()
+
+    for module in STARTUP_MODULES[case.name]:
+        if (module in modules):
+            case.failures.append("Importing %s loads %s, it should only be loaded when it's used" % (case.name, module))
+    if (importTime > importBudget):
+        case.failures.append("Importing %s took %.3fs, over the budget of %.3fs" % (case.name, importTime, importBudget))
+    case.elapsed = importTime
+
+    # Only the tools can be started
+    toolFile = os.path.join(rootPath, case.name + ".py")
+    if (os.path.exists(toolFile) != True):
+        return
+    startTime = None
+    for run in range(STARTUP_RUNS + 1):
+        runStart = time.perf_counter()
+        process = subprocess.run([sys.executable, toolFile, "-h"], cwd=workPath, env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - runStart
+        if (process.returncode):
+            case.failures.append("%s -h failed with rc %d" % (case.name, process.returncode))
+            return
+        if (run):
+            startTime = min(elapsed, startTime if (startTime != None) else elapsed)
+    if (startTime > startBudget):
+        case.failures.append("Starting %s took %.3fs, over the budget of %.3fs" % (case.name, startTime, startBudget))
+    case.elapsed = max(case.elapsed, startTime)
+
+# Run a case in a temp directory of its own, so any number can run at once
+def runCase(case):
+    startTime = time.time()
+    with tempfile.TemporaryDirectory(prefix="regressVpd-") as workPath:
+        if (case.kind == "pass"):
+            runPass(case, workPath)
+        else:
+            runFail(case, workPath)
+    case.elapsed = time.time() - startTime
+    return case
+
+# Compare what a case did to its golden file
+def checkGolden(case):
+    fileName = goldenFile(case)
+    if (case.kind == "startup" or case.result == None):
+        return
+    if (os.path.exists(fileName) != True):
+        case.failures.append("There is no golden file %s, run with --update to create it" % os.path.relpath(fileName, rootPath))
+        return
+
+    if (case.kind == "pass"):
+        golden = open(fileName, mode='rb').read()
+        if (case.result != golden):
+            offset = next((i for i in range(min(len(golden), len(case.result))) if (golden[i] != case.result[i])),
+                          min(len(golden), len(case.result)))
+            case.failures.append("The image doesn't match the golden image, %d bytes vs %d bytes, first difference at offset 0x%04x" %
+                                 (len(case.result), len(golden), offset))
+    else:
+        golden = open(fileName).read()
+        if (case.result != golden):
+            case.failures.append("The rc or errors don't match the golden file, expected:")
+            case.failures.extend("  " + line for line in golden.splitlines())
+            case.failures.append("found:")
+            case.failures.extend("  " + line for line in case.result.splitlines())
+
+# Write a golden file for a case from what it did
+def writeGolden(case):
+    fileName = goldenFile(case)
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    if (case.kind == "pass"):
+        with open(fileName, "wb") as golden:
+            golden.write(case.result)
+    else:
+        with open(fileName, "w") as golden:
+            golden.write(case.result)
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Runs the tests/pass and tests/fail cases and checks their results', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./utils/regressVpd.py
+                                       ./utils/regressVpd.py -k p10 simple
+                                       ./utils/regressVpd.py --update
+                                     '''))
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-k', '--cases', help="Only run the cases with one of these in their name", nargs="+")
+    optgroup.add_argument('-w', '--workers', help="The number of cases to run in parallel", type=int, default=os.cpu_count())
+    optgroup.add_argument('-s', '--slowdown', help="Flag cases that take this many times longer than their recorded time", type=float, default=2.0)
+    optgroup.add_argument('--update', help="Write the golden files and timings from this run instead of checking them", action="store_true")
+    optgroup.add_argument('--import-budget', help="The most time in seconds importing a tool can take", type=float, default=0.04)
+    optgroup.add_argument('--start-budget', help="The most time in seconds starting a tool with -h can take", type=float, default=0.15)
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    cases = findCases()
+    if (args.cases != None):
+        cases = [case for case in cases if (any((name in case.name) for name in args.cases))]
+    if (len(cases) == 0):
+        out.error("No cases found to run")
+        exit(1)
+
+    timings = dict()
+    if (os.path.exists(timingsFile)):
+        with open(timingsFile) as timingsData:
+            timings = json.load(timingsData)
+
+    ################################################
+    # Run the cases
+    startTime = time.time()
+    failed = 0
+    slow = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+        # The startup cases are timed after everything else is done, one at a time, so the other cases don't slow them down
+        results = list(pool.map(runCase, [case for case in cases if (case.kind != "startup")]))
+    for case in [case for case in cases if (case.kind == "startup")]:
+        with tempfile.TemporaryDirectory(prefix="regressVpd-") as workPath:
+            runStartup(case, workPath, args.import_budget, args.start_budget)
+        results.append(case)
+
+    for case in results:
+        if (args.update and case.kind != "startup"):
+            if (len(case.failures) == 0):
+                writeGolden(case)
+                timings["%s/%s" % (case.kind, case.name)] = round(case.elapsed, 3)
+        else:
+            checkGolden(case)
+
+        # Only flag a slow case when it is slower by more than the noise of starting the tools
+        recorded = timings.get("%s/%s" % (case.kind, case.name))
+        isSlow = (args.update != True and recorded != None and case.elapsed > (recorded * args.slowdown + SLOW_ALLOWANCE))
+
+        status = "PASS" if (len(case.failures) == 0) else "FAIL"
+        out.msg("%s %s/%s %.3fs%s" % (status, case.kind, case.name, case.elapsed,
+                                      (" SLOW, recorded %.3fs" % recorded) if (isSlow) else ""))
+        out.setIndent(2)
+        for failure in case.failures:
+            out.error(failure)
+        out.setIndent(0)
+
+        if (len(case.failures)):
+            failed += 1
+        elif (isSlow):
+            slow += 1
+    elapsed = time.time() - startTime
+
+    if (args.update):
+        os.makedirs(goldenPath, exist_ok=True)
+        with open(timingsFile, "w") as timingsData:
+            json.dump(timings, timingsData, indent=2, sort_keys=True)
+            timingsData.write("\n")
+        out.msg("Updated the golden files for %d cases" % (len(cases) - failed))
+
+    out.msg("Ran %d cases in %.3fs: %d passed, %d failed, %d slow" % (len(cases), elapsed, len(cases) - failed - slow, failed, slow))
+
+    # Return the number of cases that failed or got slower as the return code
+    # The return code only has 8 bits, 256 failed cases can't look like they all passed
+    exit(min(failed + slow, 255))
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,16 @@ fi
 # Copy the scripts out the release point
 cp $SCRIPTDIR/../createVpd.py $1/.
 cp $SCRIPTDIR/../reverseVpd.py $1/.
+cp $SCRIPTDIR/../serveVpd.py $1/.
+cp $SCRIPTDIR/../archiveVpd.py $1/.
+cp $SCRIPTDIR/../checkVpd.py $1/.
+cp $SCRIPTDIR/../indexVpd.py $1/.
 chmod +x $1/createVpd.py
 chmod +x $1/reverseVpd.py
+chmod +x $1/serveVpd.py
+chmod +x $1/archiveVpd.py
+chmod +x $1/checkVpd.py
+chmod +x $1/indexVpd.py
 
 # Copy out the pymods
 cp -r $SCRIPTDIR/../pymod $1/.
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# Program to build random manifests, reverse the images and build them again to find packing and parsing bugs
+
+# IBM_PROLOG_BEGIN_TAG
+# This is an automatically generated prolog.
+#
+# OpenPOWER HostBoot Project
+#
+# Contributors Listed Below - COPYRIGHT 2010,2014
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# IBM_PROLOG_END_TAG
+
+# Each case is a random manifest that createVpd.py has to build
+# The image is checked with vpdmodel.verifyImage, reversed the way reverseVpd.py does it and the reversed tvpd built again
+# The image built from the reversed tvpd has to be the same, byte for byte
+# Case N of seed S is always the same manifest, so a failure can be run again with -s S -c N
+#
+# The manifests are made to hit the edges of the layout
+#   - records whose keywords come to just under, at and just over the 40 bytes PF pads up to
+#   - records past 40 bytes at every word alignment
+#   - # keywords with 2 byte lengths, up to the largest that fits in an image with 16 bit offsets
+#   - ascii, hex and mixed data, shorter than kwlen so it's padded with zeros or the full kwlen
+
+############################################################
+# Imports - Imports - Imports - Imports - Imports - Imports
+############################################################
+import os
+# Get the path the script resides in
+scriptPath = os.path.dirname(os.path.realpath(__file__))
+import sys
+sys.path.insert(0,scriptPath + "/..");
+sys.path.insert(0,scriptPath + "/../pymod");
+import out
+import vpdxml
+import vpdmodel
+import createVpd
+import reverseVpd
+import argparse
+import textwrap
+import tempfile
+import random
+import string
+import shutil
+import time
+import traceback
+import xml.etree.ElementTree as ET
+
+############################################################
+# Variables - Variables - Variables - Variables - Variables
+############################################################
+# The characters used in ascii data, all of them come back from the tvpd as they went in
+ASCII_CHARS = string.ascii_letters + string.digits + " -_.,:;/()+=*#&<>"
+NAME_CHARS = string.ascii_uppercase + string.digits
+
+# The VTOC and VHDR with their ecc, plus the TOC entry and ecc for each record, are at most this
+HEADER_SIZE = 128
+TOC_SIZE = 18
+
+# Records and their ecc have to end before the 16 bit offsets run out
+# A normal case leaves room to spare, a huge case is one record with a # keyword as long as will fit
+IMAGE_LIMIT = 65535
+NORMAL_BUDGET = 40000
+
+# The VTOC PT keyword has a 1 byte length, so it can only hold 18 of the 14 byte TOC entries
+MAX_RECORDS = 255 // 14
+
+############################################################
+# Function - Functions - Functions - Functions - Functions
+############################################################
+# A name that isn't already used
+def uniqueName(rng, length, used, first = ""):
+    while True:
+        name = first + "".join(rng.choice(NAME_CHARS) for i in range(length - len(first)))
+        if (name not in used):
+            used.add(name)
+            return name
+
+# The most a keyword with data of this length can add to a record
+def keywordSize(name, kwlen):
+    return 2 + (2 if (name[0] == "#") else 1) + kwlen
+
+# Add a keyword to a record, with kwlen bytes of random data in the format given
+def addKeyword(rng, record, name, kwlen, kwformat):
+    keyword = ET.SubElement(record, "keyword", {"name" : name})
+    ET.SubElement(keyword, "kwdesc").text = "The %s keyword" % name
+    ET.SubElement(keyword, "kwformat").text = kwformat
+    ET.SubElement(keyword, "kwlen").text = str(kwlen)
+    kwdata = ET.SubElement(keyword, "kwdata")
+
+    # Half the time the data is shorter than kwlen and gets padded with zeros
+    dataLength = kwlen if (rng.random() < 0.5) else rng.randint(1, kwlen)
+
+    if (kwformat == "ascii"):
+        kwdata.text = "".join(rng.choice(ASCII_CHARS) for i in range(dataLength))
+    elif (kwformat == "hex"):
+        kwdata.text = randomHex(rng, dataLength)
+    elif (kwformat == "repeat"):
+        # A short pattern, mostly a single fill byte
+        kwdata.text = randomHex(rng, min(dataLength, rng.choice([1, 1, 2, 3, 7])))
+    else:
+        # Split the data into ascii and hex pieces
+        while (dataLength):
+            pieceLength = rng.randint(1, dataLength)
+            if (rng.random() < 0.5):
+                ET.SubElement(kwdata, "ascii").text = "".join(rng.choice(ASCII_CHARS) for i in range(pieceLength))
+            else:
+                ET.SubElement(kwdata, "hex").text = randomHex(rng, pieceLength)
+            dataLength -= pieceLength
+
+# Random bytes as hex, in upper or lower case and sometimes split up with spaces and newlines
+def randomHex(rng, length):
+    text = "%0*x" % (length * 2, rng.getrandbits(length * 8))
+    if (rng.random() < 0.2):
+        text = text.upper()
+    if (rng.random() < 0.2):
+        text = "\n".join(text[i:(i + 32)] for i in range(0, len(text), 32))
+    elif (rng.random() < 0.2):
+        text = " ".join(text[i:(i + 8)] for i in range(0, len(text), 8))
+    return text
+
+# Add a record with the RT keyword, returns the record and the size it has so far
+def addRecord(rng, vpd, names):
+    name = uniqueName(rng, 4, names)
+    record = ET.SubElement(vpd, "record", {"name" : name})
+    ET.SubElement(record, "rdesc").text = "The %s record" % name
+    addKeyword(rng, record, "RT", 4, "ascii")
+    record.find("keyword/kwdata").text = name
+    # The LR tag and length, the RT keyword, and the most the PF keyword and SR tag can be
+    return (record, 3 + keywordSize("RT", 4) + 3 + 40 + 1)
+
+# Create a random manifest for a case
+def createManifest(rng, vpdName):
+    vpd = ET.Element("vpd")
+    ET.SubElement(vpd, "name").text = vpdName
+    ET.SubElement(vpd, "size").text = "128KB"
+    ET.SubElement(vpd, "VD").text = "%02x" % rng.randint(0, 255)
+    names = set(["VHDR", "VTOC"])
+
+    # One record with a # keyword as big as will fit
+    if (rng.random() < 0.05):
+        (record, size) = addRecord(rng, vpd, names)
+        name = uniqueName(rng, 2, set(), "#")
+        kwlen = rng.randint(60000, IMAGE_LIMIT - HEADER_SIZE - TOC_SIZE - size - keywordSize(name, 0))
+        addKeyword(rng, record, name, kwlen, rng.choice(["hex", "mixed", "repeat"]))
+        return vpd
+
+    budget = NORMAL_BUDGET
+    for recordCount in range(rng.choice([1, 2, 3, 5, 8, 13, MAX_RECORDS])):
+        (record, size) = addRecord(rng, vpd, names)
+        keywordNames = set(["RT", "PF"])
+
+        if (rng.random() < 0.3):
+            # Aim the keywords at just around the 40 bytes PF pads up to, RT and the LR tag and length are 10
+            target = rng.randint(10, 48) - 10
+            if (target >= 4):
+                addKeyword(rng, record, uniqueName(rng, 2, keywordNames), target - 3, rng.choice(["ascii", "hex", "mixed", "repeat"]))
+            continue
+
+        for keywordCount in range(rng.randint(1, 12)):
+            name = uniqueName(rng, 2, keywordNames, "#" if (rng.random() < 0.15) else "")
+            maxlen = 255 if (name[0] != "#") else rng.choice([255, 1024, 8192])
+            kwlen = rng.choice([rng.randint(1, 8), rng.randint(1, maxlen), maxlen])
+            if (((size + keywordSize(name, kwlen)) * 1.25 + TOC_SIZE) > budget):
+                break
+            size += keywordSize(name, kwlen)
+            addKeyword(rng, record, name, kwlen, rng.choice(["ascii", "hex", "mixed", "repeat"]))
+
+        budget -= (size * 1.25 + TOC_SIZE)
+        if (budget < 1000):
+            break
+
+    return vpd
+
+# Build a tvpd with the createVpd.py stages, returns the image and model, or None and the errors
+def buildTvpd(tvpdFile):
+    createVpd.clInputPath = os.path.dirname(tvpdFile)
+    (errorsFound, manifest) = createVpd.loadManifest(os.path.basename(tvpdFile))
+    if (errorsFound or manifest == None):
+        return (None, None)
+    (errorsFound, vpdName, maxSizeBytes) = createVpd.verifyManifest(manifest, tvpdFile)
+    if (errorsFound):
+        return (None, None)
+    (errorsFound, image, vpdImage) = createVpd.createImage(manifest, vpdName=vpdName)
+    if (errorsFound):
+        return (None, None)
+    return (image, vpdImage)
+
+# Run one case, returns what went wrong or None, and adds the time taken by each step to times
+def runCase(seed, index, workPath, times, stats):
+    rng = random.Random("%d:%d" % (seed, index))
+    vpdName = "stress-%d-%d" % (seed, index)
+    tvpdFile = os.path.join(workPath, vpdName + ".tvpd")
+    vpdxml.write(createManifest(rng, vpdName), tvpdFile)
+
+    # Build the random manifest
+    startTime = time.perf_counter()
+    (image, vpdImage) = buildTvpd(tvpdFile)
+    times["create"] += time.perf_counter() - startTime
+    if (image == None):
+        return "createVpd.py couldn't build the manifest"
+    with open(os.path.join(workPath, vpdName + ".vpd"), "wb") as vpdFile:
+        vpdFile.write(image)
+
+    errors = vpdmodel.verifyImage(image, vpdImage)
+    if (errors):
+        return "The image doesn't match the manifest: %s" % "; ".join(errors)
+
+    # Reverse it
+    startTime = time.perf_counter()
+    reversedImage = vpdmodel.VpdImage.fromBytes(image, vpdName + "-reversed")
+    (vpd, recordTvpd, recordBins, keywordBins) = reverseVpd.createTvpd(reversedImage, False)
+    reversedFile = os.path.join(workPath, vpdName + "-reversed.tvpd")
+    vpdxml.write(vpd, reversedFile)
+    times["reverse"] += time.perf_counter() - startTime
+
+    # And build it again
+    startTime = time.perf_counter()
+    (rebuilt, rebuiltImage) = buildTvpd(reversedFile)
+    times["rebuild"] += time.perf_counter() - startTime
+    if (rebuilt == None):
+        return "createVpd.py couldn't build the reversed tvpd"
+    if (rebuilt != image):
+        offset = next((i for i in range(min(len(image), len(rebuilt))) if (image[i] != rebuilt[i])), min(len(image), len(rebuilt)))
+        return "The image built from the reversed tvpd is different, first difference at offset 0x%04x" % offset
+
+    # Keep track of what the cases covered
+    stats["bytes"] += len(image)
+    stats["records"] += len(vpdImage.records)
+    for record in vpdImage.records:
+        stats["keywords"] += len(record.keywords)
+        stats["largest"] = max([stats["largest"]] + [len(keyword.data) for keyword in record.keywords])
+        # The LR tag and length and the keywords, then PF fills it out to 40 bytes or the next word
+        keywordsEnd = 3 + sum(keyword.packedSize() for keyword in record.keywords)
+        stats["padFill"].add(record.length - keywordsEnd - 3 - 1)
+        if (keywordsEnd < 40):
+            stats["padded"] += 1
+        else:
+            stats["aligned"] += 1
+
+    return None
+
+############################################################
+# Main - Main - Main - Main - Main - Main - Main - Main
+############################################################
+def main():
+    ################################################
+    # Command line options
+    # Create the argparser object
+    # We disable auto help options here and add them manually below.  This is so we can get all the optional args in 1 group
+    parser = argparse.ArgumentParser(description='Builds, reverses and rebuilds random manifests', add_help=False,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=textwrap.dedent('''\
+                                     Examples:
+                                       ./utils/stressVpd.py
+                                       ./utils/stressVpd.py -s 7 -n 5000
+                                       ./utils/stressVpd.py -s 7 -c 1234 -k /tmp/stress
+                                     '''))
+    # Create our group of optional command line args
+    optgroup = parser.add_argument_group('Optional Arguments')
+    optgroup.add_argument('-h', '--help', action="help", help="Show this help message and exit")
+    optgroup.add_argument('-s', '--seed', help="The seed for the random manifests, the same seed always gives the same cases", type=int, default=1)
+    optgroup.add_argument('-n', '--count', help="The number of cases to run", type=int, default=500)
+    optgroup.add_argument('-c', '--case', help="Run only this case of the seed", type=int)
+    optgroup.add_argument('-k', '--keep', help="Copy the files of the cases that fail into this directory")
+
+    # We've got everything we want loaded up, now look for it
+    args = parser.parse_args()
+
+    if (args.keep != None and os.path.isdir(args.keep) != True):
+        out.error("The directory %s does not exist!" % args.keep)
+        exit(1)
+
+    cases = [args.case] if (args.case != None) else range(args.count)
+    times = {"create" : 0.0, "reverse" : 0.0, "rebuild" : 0.0}
+    stats = {"bytes" : 0, "records" : 0, "keywords" : 0, "largest" : 0, "padded" : 0, "aligned" : 0, "padFill" : set()}
+    failed = 0
+
+    startTime = time.perf_counter()
+    for index in cases:
+        with tempfile.TemporaryDirectory() as workPath:
+            out.startCapture()
+            try:
+                failure = runCase(args.seed, index, workPath, times, stats)
+            except Exception:
+                failure = "Exception: %s" % traceback.format_exc().strip()
+            messages = out.stopCapture()
+
+            if (failure == None):
+                continue
+            failed += 1
+            out.setIndent(0)
+            out.msg("FAIL case %d: %s" % (index, failure))
+            out.setIndent(2)
+            for message in messages:
+                if ("ERROR" in message):
+                    out.msg(message.strip())
+            out.msg("Run it again with: ./utils/stressVpd.py -s %d -c %d -k <dir>" % (args.seed, index))
+            out.setIndent(0)
+            if (args.keep != None):
+                for fileName in os.listdir(workPath):
+                    shutil.copy(os.path.join(workPath, fileName), args.keep)
+    elapsed = time.perf_counter() - startTime
+    out.setIndent(0)
+
+    passed = len(cases) - failed
+    out.msg("Ran %d cases with seed %d in %.3fs: %d passed, %d failed" % (len(cases), args.seed, elapsed, passed, failed))
+    if (passed):
+        out.msg("Covered %d records, %d keywords, the largest %d bytes, %d records padded to 40 bytes, %d word aligned, %d PF lengths" %
+                (stats["records"], stats["keywords"], stats["largest"], stats["padded"], stats["aligned"], len(stats["padFill"])))
+        for step in ["create", "reverse", "rebuild"]:
+            out.msg("%-8s %8.1f images/s %8.2f MB/s" % (step, passed / times[step], stats["bytes"] / times[step] / (1024 * 1024)))
+
+    # The return code only has 8 bits, 256 failed cases can't look like they all passed
+    exit(min(failed, 255))
+
+if __name__ == "__main__":
+    main()